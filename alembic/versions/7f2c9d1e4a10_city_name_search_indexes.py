@@ -0,0 +1,35 @@
+"""city name search indexes
+
+Revision ID: 7f2c9d1e4a10
+Revises: 394d97376e8a
+Create Date: 2026-10-18 10:12:40.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f2c9d1e4a10'
+down_revision: Union[str, None] = '394d97376e8a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # text_pattern_ops позволяет использовать индекс и для =, и для поиска по префиксу
+    op.create_index('ix_cities_name_lower', 'cities',
+                    [sa.text('lower(name) text_pattern_ops')], unique=False)
+    op.create_index('ix_cities_name_trgm', 'cities',
+                    [sa.text('lower(name) gin_trgm_ops')], unique=False,
+                    postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_cities_name_trgm', table_name='cities')
+    op.drop_index('ix_cities_name_lower', table_name='cities')
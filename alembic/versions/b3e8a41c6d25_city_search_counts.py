@@ -0,0 +1,41 @@
+"""city search counts
+
+Revision ID: b3e8a41c6d25
+Revises: 7f2c9d1e4a10
+Create Date: 2026-10-18 11:03:27.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e8a41c6d25'
+down_revision: Union[str, None] = '7f2c9d1e4a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('city_search_counts',
+    sa.Column('city_name', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('city_name')
+    )
+    op.create_index('ix_city_search_counts_count', 'city_search_counts',
+                    [sa.text('count DESC')], unique=False)
+    # Заполнение счётчиков по существующей истории поиска
+    op.execute(
+        "INSERT INTO city_search_counts (city_name, count) "
+        "SELECT city_name, count(*) FROM search_history "
+        "WHERE city_name IS NOT NULL GROUP BY city_name"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_city_search_counts_count', table_name='city_search_counts')
+    op.drop_table('city_search_counts')
@@ -0,0 +1,30 @@
+"""search history user timestamp index
+
+Revision ID: c91d2f7a3e48
+Revises: b3e8a41c6d25
+Create Date: 2026-10-18 11:48:05.273614
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c91d2f7a3e48'
+down_revision: Union[str, None] = 'b3e8a41c6d25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_search_history_user_id_timestamp', 'search_history',
+                    ['user_id', sa.text('timestamp DESC')], unique=False,
+                    postgresql_include=['city_name'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_search_history_user_id_timestamp', table_name='search_history')
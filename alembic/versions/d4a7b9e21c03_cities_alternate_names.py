@@ -0,0 +1,28 @@
+"""cities alternate names
+
+Revision ID: d4a7b9e21c03
+Revises: c91d2f7a3e48
+Create Date: 2026-10-18 13:20:51.904377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a7b9e21c03'
+down_revision: Union[str, None] = 'c91d2f7a3e48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('cities', sa.Column('alternate_names', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('cities', 'alternate_names')
@@ -0,0 +1,40 @@
+"""city search hourly
+
+Revision ID: e5b2c8d94f17
+Revises: d4a7b9e21c03
+Create Date: 2026-10-18 14:05:12.318406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b2c8d94f17'
+down_revision: Union[str, None] = 'd4a7b9e21c03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('city_search_hourly',
+    sa.Column('hour', sa.Integer(), nullable=False),
+    sa.Column('city_name', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('hour', 'city_name')
+    )
+    # Заполнение почасовых счётчиков по существующей истории поиска
+    op.execute(
+        "INSERT INTO city_search_hourly (hour, city_name, count) "
+        "SELECT timestamp - timestamp % 3600, city_name, count(*) FROM search_history "
+        "WHERE city_name IS NOT NULL AND timestamp IS NOT NULL "
+        "GROUP BY timestamp - timestamp % 3600, city_name"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('city_search_hourly')
@@ -0,0 +1,104 @@
+"""search history partitioning
+
+Revision ID: f6c3d9a1b2e4
+Revises: e5b2c8d94f17
+Create Date: 2026-10-18 15:12:40.551290
+
+"""
+import time
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6c3d9a1b2e4'
+down_revision: Union[str, None] = 'e5b2c8d94f17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Ширина секции и запас секций вперёд (совпадают с настройками app.db.retention)
+PARTITION_WIDTH = 7 * 86400
+PARTITIONS_AHEAD = 4
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # Дублирующие индексы: ключ id и префикс составного индекса (user_id, timestamp)
+    op.drop_index('ix_search_history_user_id', table_name='search_history')
+    op.drop_index('ix_search_history_id', table_name='search_history')
+    op.execute("UPDATE search_history SET timestamp = 0 WHERE timestamp IS NULL")
+    if bind.dialect.name != 'postgresql':
+        with op.batch_alter_table('search_history') as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.Integer(), nullable=False)
+        return
+
+    op.execute("""
+        CREATE TABLE search_history_partitioned (
+            id integer NOT NULL DEFAULT nextval('search_history_id_seq'),
+            user_id varchar,
+            city_name varchar,
+            timestamp integer NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    # Строки вне созданных секций попадают в секцию по умолчанию
+    op.execute("CREATE TABLE search_history_default "
+               "PARTITION OF search_history_partitioned DEFAULT")
+
+    oldest = bind.execute(sa.text(
+        "SELECT min(timestamp) FROM search_history WHERE timestamp > 0"
+    )).scalar()
+    now = int(time.time())
+    start = (min(oldest or now, now) // PARTITION_WIDTH) * PARTITION_WIDTH
+    end = (now // PARTITION_WIDTH + PARTITIONS_AHEAD) * PARTITION_WIDTH
+    for lower in range(start, end, PARTITION_WIDTH):
+        op.execute(
+            f"CREATE TABLE search_history_p{lower} PARTITION OF search_history_partitioned "
+            f"FOR VALUES FROM ({lower}) TO ({lower + PARTITION_WIDTH})"
+        )
+
+    op.execute("INSERT INTO search_history_partitioned (id, user_id, city_name, timestamp) "
+               "SELECT id, user_id, city_name, timestamp FROM search_history")
+    op.execute("ALTER SEQUENCE search_history_id_seq OWNED BY search_history_partitioned.id")
+    op.drop_index('ix_search_history_user_id_timestamp', table_name='search_history')
+    op.drop_table('search_history')
+    op.execute("ALTER TABLE search_history_partitioned RENAME TO search_history")
+
+    op.create_index('ix_search_history_user_id_timestamp', 'search_history',
+                    ['user_id', sa.text('timestamp DESC')], unique=False,
+                    postgresql_include=['city_name'])
+    op.create_index('ix_search_history_timestamp_brin', 'search_history',
+                    ['timestamp'], unique=False, postgresql_using='brin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute("""
+            CREATE TABLE search_history_plain (
+                id integer NOT NULL DEFAULT nextval('search_history_id_seq'),
+                user_id varchar,
+                city_name varchar,
+                timestamp integer,
+                PRIMARY KEY (id)
+            )
+        """)
+        op.execute("INSERT INTO search_history_plain (id, user_id, city_name, timestamp) "
+                   "SELECT id, user_id, city_name, timestamp FROM search_history")
+        op.execute("ALTER SEQUENCE search_history_id_seq OWNED BY search_history_plain.id")
+        # Секции удаляются вместе с секционированной таблицей
+        op.drop_table('search_history')
+        op.execute("ALTER TABLE search_history_plain RENAME TO search_history")
+        op.create_index('ix_search_history_user_id_timestamp', 'search_history',
+                        ['user_id', sa.text('timestamp DESC')], unique=False,
+                        postgresql_include=['city_name'])
+    else:
+        with op.batch_alter_table('search_history') as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.Integer(), nullable=True)
+    op.create_index(op.f('ix_search_history_id'), 'search_history', ['id'], unique=False)
+    op.create_index(op.f('ix_search_history_user_id'), 'search_history', ['user_id'],
+                    unique=False)
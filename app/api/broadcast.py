@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import random
+import time
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from app.api import services
+from app.api.cache import next_refresh_at
+from app.log_conf import logging
+from app.metrics import registry
+from app.models.weather import City
+
+
+logger = logging.getLogger(__name__)
+
+
+# Событий в очереди одного подключения; медленный клиент вместо них получит полный прогноз
+STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', '8'))
+# Сколько секунд город без подписчиков продолжает обновляться (на случай переподключения)
+STREAM_IDLE_TTL = float(os.getenv('STREAM_IDLE_TTL', '60'))
+# Комментарий-пинг, чтобы прокси не закрывали молчащее соединение (сек)
+STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', '15'))
+# Повторная попытка после ошибки API (сек)
+STREAM_RETRY = float(os.getenv('STREAM_RETRY', '30'))
+# Случайная задержка обновления после смены модели, чтобы города не обновлялись разом
+STREAM_JITTER = float(os.getenv('STREAM_JITTER', '30'))
+STREAM_MAX_SUBSCRIBERS = int(os.getenv('STREAM_MAX_SUBSCRIBERS', '10000'))
+
+HEARTBEAT_EVENT = ": ping\n\n"
+
+
+def encode_event(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    """Событие в формате text/event-stream"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def forecast_snapshot(forecast) -> dict:
+    """Полное состояние прогноза в том же виде, что и ответ /forecast"""
+    return {"city": forecast.city,
+            "forecast": services.format_forecast(forecast),
+            "stale": forecast.stale,
+            "fetched_at": forecast.fetched_at}
+
+
+def forecast_delta(previous: dict, current: dict) -> Optional[dict]:
+    """Изменения прогноза: новые и изменившиеся часы, прошедшие часы; None — без изменений"""
+    before = {row["time"]: row for row in previous["forecast"]}
+    after = {row["time"]: row for row in current["forecast"]}
+    updated = [row for time_str, row in after.items() if before.get(time_str) != row]
+    removed = [time_str for time_str in before if time_str not in after]
+    if (not updated and not removed and previous["stale"] == current["stale"]
+            and previous["fetched_at"] == current["fetched_at"]):
+        return None
+    return {"updated": updated,
+            "removed": removed,
+            "stale": current["stale"],
+            "fetched_at": current["fetched_at"]}
+
+
+class Subscription:
+    """Подписка одного подключения: ограниченная очередь готовых событий"""
+
+    def __init__(self, channel: "CityChannel", queue_size: int):
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+
+    def push(self, event: str) -> bool:
+        """Постановка события в очередь; False — очередь была переполнена"""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            # Клиент не успевает читать: накопленные изменения заменяются полным состоянием
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(self.channel.snapshot_event or event)
+            return False
+
+
+class CityChannel:
+    """Город с подписчиками: один запрос прогноза на цикл обновления для всех"""
+
+    def __init__(self, city: City):
+        self.city = city
+        self.subscribers: Set[Subscription] = set()
+        self.snapshot: Optional[dict] = None
+        self.snapshot_event: Optional[str] = None
+        self.version = 0
+        self.idle_since: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def publish(self, event: str) -> int:
+        """Рассылка события подписчикам; возвращает число переполненных очередей"""
+        return sum(not subscription.push(event) for subscription in self.subscribers)
+
+
+class ForecastBroadcaster:
+    """Рассылка обновлений прогноза подписчикам Server-Sent Events"""
+
+    def __init__(
+            self,
+            queue_size: int = STREAM_QUEUE_SIZE,
+            idle_ttl: float = STREAM_IDLE_TTL,
+            heartbeat: float = STREAM_HEARTBEAT,
+            retry: float = STREAM_RETRY,
+            jitter: float = STREAM_JITTER,
+            max_subscribers: int = STREAM_MAX_SUBSCRIBERS
+        ):
+        self.queue_size = queue_size
+        self.idle_ttl = idle_ttl
+        self.heartbeat = heartbeat
+        self.retry = retry
+        self.jitter = jitter
+        self.max_subscribers = max_subscribers
+        self.channels: Dict[str, CityChannel] = {}
+        self.subscribers = 0
+
+        self.fetches = 0
+        self.errors = 0
+        self.published = 0
+        self.evictions = 0
+        self.rejected = 0
+        self.overflows = 0
+
+    @staticmethod
+    def _key(city: City) -> str:
+        return f"{city.name.lower()}:{city.latitude}:{city.longitude}"
+
+    def check_capacity(self):
+        """Отказ 503, если подписок уже максимум (до начала ответа)"""
+        if self.subscribers >= self.max_subscribers:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Слишком много подписок на обновления")
+
+    def subscribe(self, city: City) -> Subscription:
+        """Подписка на обновления прогноза города"""
+        self.check_capacity()
+
+        key = self._key(city)
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = CityChannel(city)
+        subscription = Subscription(channel, self.queue_size)
+        channel.subscribers.add(subscription)
+        channel.idle_since = None
+        self.subscribers += 1
+
+        if channel.snapshot_event is not None:
+            subscription.push(channel.snapshot_event)
+        if channel.task is None or channel.task.done():
+            channel.task = asyncio.create_task(self._run(key, channel))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        channel = subscription.channel
+        if subscription in channel.subscribers:
+            channel.subscribers.discard(subscription)
+            self.subscribers -= 1
+        if not channel.subscribers:
+            channel.idle_since = time.monotonic()
+
+    async def events(self, city: City) -> AsyncIterator[str]:
+        """События подписки на город; при отключении клиента подписка снимается.
+
+        Подписка создаётся при первой итерации: если клиент отключится до начала
+        ответа, генератор не запустится и его finally не выполнится.
+        """
+        try:
+            subscription = self.subscribe(city)
+        except HTTPException as e:
+            # Лимит мог быть достигнут после проверки в обработчике запроса
+            yield encode_event("error", {"detail": e.detail})
+            return
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT_EVENT
+        finally:
+            self.unsubscribe(subscription)
+
+    async def refresh(self, channel: CityChannel) -> bool:
+        """Получение прогноза и рассылка изменений; False — при ошибке API"""
+        self.fetches += 1
+        try:
+            forecast = await services.get_weather_forecast(channel.city)
+        except HTTPException as e:
+            self.errors += 1
+            self.overflows += channel.publish(encode_event("error", {"detail": e.detail}))
+            return False
+        if forecast is None:
+            return True
+
+        snapshot = forecast_snapshot(forecast)
+        if channel.snapshot is None:
+            event = "forecast", snapshot
+        else:
+            delta = forecast_delta(channel.snapshot, snapshot)
+            event = ("delta", delta) if delta is not None else None
+
+        channel.snapshot = snapshot
+        if event is not None:
+            channel.version += 1
+            channel.snapshot_event = encode_event("forecast", snapshot, channel.version)
+            self.overflows += channel.publish(
+                channel.snapshot_event if event[0] == "forecast"
+                else encode_event(*event, channel.version)
+            )
+            self.published += 1
+        return True
+
+    def _idle(self, channel: CityChannel) -> bool:
+        return (channel.idle_since is not None
+                and time.monotonic() - channel.idle_since >= self.idle_ttl)
+
+    async def _run(self, key: str, channel: CityChannel):
+        """Обновление города раз в цикл модели, пока у него есть подписчики"""
+        try:
+            while not self._idle(channel):
+                try:
+                    ok = await self.refresh(channel)
+                except Exception as e:
+                    logger.error(f"Ошибка обновления подписки на {channel.city.name}: {e}")
+                    ok = False
+                # После смены часа прогноз сдвигается, поэтому обновление нужно и без новых данных
+                wake_at = (time.time() + self.retry if not ok
+                           else next_refresh_at() + random.uniform(0, self.jitter))
+                # Просыпаемся не реже idle_ttl, чтобы вовремя удалить город без подписчиков
+                while not self._idle(channel) and time.time() < wake_at:
+                    await asyncio.sleep(min(wake_at - time.time(), self.idle_ttl))
+        finally:
+            if self.channels.get(key) is channel and not channel.subscribers:
+                del self.channels[key]
+                self.evictions += 1
+
+    async def stop(self):
+        """Остановка обновлений (при завершении приложения)"""
+        tasks: List[asyncio.Task] = [channel.task for channel in self.channels.values()
+                                     if channel.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.channels.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"channels": len(self.channels),
+                "subscribers": self.subscribers,
+                "fetches": self.fetches,
+                "errors": self.errors,
+                "published": self.published,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+                "overflows": self.overflows}
+
+
+# Подписки на обновления прогноза
+forecast_broadcaster = ForecastBroadcaster()
+registry.register_stats('weather_stream', forecast_broadcaster.stats)
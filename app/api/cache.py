@@ -0,0 +1,69 @@
+import os
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from pydantic import TypeAdapter
+
+from app.api.cache_backends import Codec, create_cache
+from app.metrics import registry
+from app.models.weather import City, WeatherForecast
+
+
+FORECAST_CACHE_MAX_ENTRIES = int(os.getenv('FORECAST_CACHE_MAX_ENTRIES', '2048'))
+# Период обновления моделей Open-Meteo и задержка публикации новых данных (сек)
+FORECAST_REFRESH_INTERVAL = int(os.getenv('FORECAST_REFRESH_INTERVAL', '3600'))
+FORECAST_REFRESH_OFFSET = int(os.getenv('FORECAST_REFRESH_OFFSET', '0'))
+# Сколько секунд после истечения запись хранится для выдачи при сбоях API
+FORECAST_STALE_TTL = int(os.getenv('FORECAST_STALE_TTL', '21600'))
+# Точность округления координат (в знаках после запятой) для ключа ячейки сетки
+FORECAST_GRID_PRECISION = int(os.getenv('FORECAST_GRID_PRECISION', '2'))
+
+GEOCODING_CACHE_MAX_ENTRIES = int(os.getenv('GEOCODING_CACHE_MAX_ENTRIES', '4096'))
+# Время жизни результата геокодирования (сек) и пустого результата
+GEOCODING_CACHE_TTL = int(os.getenv('GEOCODING_CACHE_TTL', '86400'))
+GEOCODING_CACHE_NEGATIVE_TTL = int(os.getenv('GEOCODING_CACHE_NEGATIVE_TTL', '600'))
+
+
+def next_refresh_at(now: Optional[float] = None) -> float:
+    """Момент следующего обновления модели прогноза"""
+    if now is None:
+        now = time.time()
+    shifted = now - FORECAST_REFRESH_OFFSET
+    boundary = (shifted // FORECAST_REFRESH_INTERVAL + 1) * FORECAST_REFRESH_INTERVAL
+    return boundary + FORECAST_REFRESH_OFFSET
+
+
+def seconds_until_refresh(now: Optional[float] = None) -> int:
+    """Количество секунд до следующего обновления модели прогноза"""
+    if now is None:
+        now = time.time()
+    return max(int(next_refresh_at(now) - now), 0)
+
+
+def forecast_cache_key(
+        city: City, forecast_days: int, hourly: Sequence[str]
+    ) -> Tuple:
+    """Ключ кэша: ячейка сетки по округлённым координатам и параметры запроса"""
+    return (round(city.latitude, FORECAST_GRID_PRECISION),
+            round(city.longitude, FORECAST_GRID_PRECISION),
+            forecast_days,
+            tuple(hourly))
+
+
+def geocoding_cache_key(city_name: str, limit: int) -> Tuple:
+    return (city_name.lower(), limit)
+
+
+_cities = TypeAdapter(List[City])
+
+FORECAST_CODEC = Codec(WeatherForecast.model_dump_json, WeatherForecast.model_validate_json)
+CITIES_CODEC = Codec(lambda cities: _cities.dump_json(cities).decode(), _cities.validate_json)
+
+# Кэш прогнозов погоды
+forecast_cache = create_cache('weather_forecast', FORECAST_CODEC,
+                              FORECAST_CACHE_MAX_ENTRIES, FORECAST_STALE_TTL)
+registry.register_stats('weather_forecast_cache', forecast_cache.stats)
+
+# Кэш результатов API геокодирования для городов, которых нет в БД
+geocoding_cache = create_cache('weather_geocoding', CITIES_CODEC, GEOCODING_CACHE_MAX_ENTRIES)
+registry.register_stats('weather_geocoding_cache', geocoding_cache.stats)
@@ -0,0 +1,540 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from app.log_conf import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# memory — в памяти процесса (у каждого воркера свой кэш),
+# sqlite — файл SQLite, общий для всех воркеров хоста,
+# redis — сервер с протоколом Redis, общий для всех хостов
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory').lower()
+CACHE_SQLITE_PATH = os.getenv(
+    'CACHE_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'weather_cache.sqlite3'))
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_REDIS_POOL_SIZE = int(os.getenv('CACHE_REDIS_POOL_SIZE', '10'))
+# Таймаут операции с общим кэшем (сек): дольше ждать выгоднее запросом к API
+CACHE_TIMEOUT = float(os.getenv('CACHE_TIMEOUT', '0.5'))
+# Пауза перед повторным обращением к недоступному общему кэшу (сек)
+CACHE_RETRY_INTERVAL = float(os.getenv('CACHE_RETRY_INTERVAL', '5'))
+
+# Просроченные записи SQLite-кэша удаляются раз в столько сохранений
+SQLITE_PURGE_EVERY = 256
+
+
+class TTLCache:
+    """Ограниченный по размеру LRU-кэш с временем жизни записей"""
+
+    def __init__(self, max_entries: int, stale_ttl: float = 0):
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, now: Optional[float] = None) -> Optional[Any]:
+        """Получение значения, если оно есть и не устарело"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if now is None:
+            now = time.time()
+        if expires_at <= now:
+            # Устаревшая запись остаётся на случай недоступности API
+            if expires_at + self.stale_ttl <= now:
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_stale(self, key: Hashable, now: Optional[float] = None) -> Optional[Any]:
+        """Получение значения, в том числе устаревшего в пределах stale_ttl"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at + self.stale_ttl <= (time.time() if now is None else now):
+            return None
+        self.stale_hits += 1
+        return value
+
+    def expires_at(self, key: Hashable) -> Optional[float]:
+        """Срок жизни записи без влияния на порядок LRU и счётчики"""
+        entry = self._data.get(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: Hashable, value: Any, expires_at: float):
+        """Сохранение значения до момента expires_at"""
+        if key in self._data:
+            self._data.move_to_end(key)
+        self._data[key] = (expires_at, value)
+
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики попаданий, промахов и вытеснений"""
+        return {"size": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+                "expirations": self.expirations}
+
+
+class Codec(NamedTuple):
+    """Преобразование значений в строку и обратно для общих хранилищ"""
+    dumps: Callable[[Any], str]
+    loads: Callable[[str], Any]
+
+
+def encode_key(namespace: str, key: Hashable) -> str:
+    """Строковый ключ общего хранилища: пространство имён и JSON исходного ключа"""
+    return f"{namespace}:{json.dumps(key, ensure_ascii=False, separators=(',', ':'))}"
+
+
+class MemoryCache:
+    """Кэш в памяти процесса: быстрый, но у каждого воркера свой"""
+    backend = 'memory'
+
+    def __init__(self, namespace: str, max_entries: int, stale_ttl: float = 0):
+        self.namespace = namespace
+        self.cache = TTLCache(max_entries, stale_ttl)
+
+    async def get(self, key: Hashable, now: Optional[float] = None) -> Optional[Any]:
+        return self.cache.get(key, now)
+
+    async def get_stale(self, key: Hashable, now: Optional[float] = None) -> Optional[Any]:
+        return self.cache.get_stale(key, now)
+
+    async def expires_at(self, key: Hashable) -> Optional[float]:
+        return self.cache.expires_at(key)
+
+    async def set(self, key: Hashable, value: Any, expires_at: float):
+        self.cache.set(key, value, expires_at)
+
+    async def clear(self):
+        self.cache.clear()
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+
+class SharedCache(ABC):
+    """Общий для воркеров кэш: значение хранится строкой вместе со сроком жизни.
+
+    Сбой хранилища считается промахом: запрос уходит к API,
+    а хранилище пропускается на retry_interval секунд.
+    """
+    backend = ''
+    # Исключения, означающие недоступность хранилища
+    errors: Tuple[type, ...] = ()
+
+    def __init__(
+            self,
+            namespace: str,
+            codec: Codec,
+            stale_ttl: float = 0,
+            retry_interval: float = CACHE_RETRY_INTERVAL
+        ):
+        self.namespace = namespace
+        self.codec = codec
+        self.stale_ttl = stale_ttl
+        self.retry_interval = retry_interval
+        self._down_until = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.failures = 0
+
+    @abstractmethod
+    async def _load(self, key: str) -> Optional[Tuple[float, str]]:
+        """Срок жизни и значение записи"""
+
+    @abstractmethod
+    async def _store(self, key: str, expires_at: float, purge_at: float, payload: str):
+        """Сохранение записи; после purge_at хранилище может её удалить"""
+
+    @abstractmethod
+    async def _clear(self):
+        """Удаление всех записей пространства имён"""
+
+    async def _call(self, operation: Callable, *args) -> Any:
+        """Операция с хранилищем; при сбое — None и пауза перед следующей попыткой"""
+        if time.time() < self._down_until:
+            return None
+        try:
+            return await operation(*args)
+        except self.errors as e:
+            self.failures += 1
+            self._down_until = time.time() + self.retry_interval
+            logger.warning(f"Кэш {self.backend} недоступен: {e!r}")
+            return None
+
+    def _decode(self, payload: str) -> Optional[Any]:
+        try:
+            return self.codec.loads(payload)
+        except ValueError:
+            # Запись в прежнем формате (например, после изменения модели)
+            return None
+
+    async def get(self, key: Hashable, now: Optional[float] = None) -> Optional[Any]:
+        """Получение значения, если оно есть и не устарело"""
+        entry = await self._call(self._load, encode_key(self.namespace, key))
+        if now is None:
+            now = time.time()
+        value = self._decode(entry[1]) if entry is not None and entry[0] > now else None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    async def get_stale(self, key: Hashable, now: Optional[float] = None) -> Optional[Any]:
+        """Получение значения, в том числе устаревшего в пределах stale_ttl"""
+        entry = await self._call(self._load, encode_key(self.namespace, key))
+        if now is None:
+            now = time.time()
+        if entry is None or entry[0] + self.stale_ttl <= now:
+            return None
+        value = self._decode(entry[1])
+        if value is not None:
+            self.stale_hits += 1
+        return value
+
+    async def expires_at(self, key: Hashable) -> Optional[float]:
+        entry = await self._call(self._load, encode_key(self.namespace, key))
+        return entry[0] if entry is not None else None
+
+    async def set(self, key: Hashable, value: Any, expires_at: float):
+        await self._call(self._store, encode_key(self.namespace, key),
+                         expires_at, expires_at + self.stale_ttl, self.codec.dumps(value))
+
+    async def clear(self):
+        await self._call(self._clear)
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "failures": self.failures}
+
+
+class SQLiteCache(SharedCache):
+    """Кэш в файле SQLite в режиме WAL, общий для всех воркеров на хосте"""
+    backend = 'sqlite'
+    errors = (sqlite3.Error,)
+
+    def __init__(
+            self,
+            namespace: str,
+            codec: Codec,
+            path: str = CACHE_SQLITE_PATH,
+            max_entries: int = 10000,
+            stale_ttl: float = 0,
+            timeout: float = CACHE_TIMEOUT
+        ):
+        super().__init__(namespace, codec, stale_ttl)
+        self.path = path
+        self.max_entries = max_entries
+        self.timeout = timeout
+        # Одно соединение на процесс; запросы выполняются по очереди в отдельном потоке
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix=f'{namespace}-cache')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self.purged = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   isolation_level=None, check_same_thread=False)
+            try:
+                # WAL: читатели не блокируются записью из других процессов
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS cache_entries ("
+                             "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, "
+                             "purge_at REAL NOT NULL, value TEXT NOT NULL) WITHOUT ROWID")
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_purge_at "
+                             "ON cache_entries (purge_at)")
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def _namespace_range(self) -> Tuple[str, str]:
+        """Границы ключей пространства имён (';' следует за ':')"""
+        return f"{self.namespace}:", f"{self.namespace};"
+
+    async def _execute(self, function: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    async def _load(self, key: str) -> Optional[Tuple[float, str]]:
+        return await self._execute(self._load_sync, key)
+
+    def _load_sync(self, key: str) -> Optional[Tuple[float, str]]:
+        return self._connect().execute(
+            "SELECT expires_at, value FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+
+    async def _store(self, key: str, expires_at: float, purge_at: float, payload: str):
+        await self._execute(self._store_sync, key, expires_at, purge_at, payload)
+
+    def _store_sync(self, key: str, expires_at: float, purge_at: float, payload: str):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO cache_entries (key, expires_at, purge_at, value) "
+                     "VALUES (?, ?, ?, ?)", (key, expires_at, purge_at, payload))
+        self._writes += 1
+        if self._writes % SQLITE_PURGE_EVERY == 0:
+            self._purge_sync(conn)
+
+    def _purge_sync(self, conn: sqlite3.Connection, now: Optional[float] = None):
+        """Удаление записей после срока хранения и сверх max_entries (с ближайшим сроком)"""
+        self.purged += conn.execute("DELETE FROM cache_entries WHERE purge_at <= ?",
+                                    (time.time() if now is None else now,)).rowcount
+        lower, upper = self._namespace_range()
+        size = conn.execute("SELECT count(*) FROM cache_entries WHERE key >= ? AND key < ?",
+                            (lower, upper)).fetchone()[0]
+        if size > self.max_entries:
+            self.purged += conn.execute(
+                "DELETE FROM cache_entries WHERE key IN ("
+                "SELECT key FROM cache_entries WHERE key >= ? AND key < ? "
+                "ORDER BY purge_at LIMIT ?)",
+                (lower, upper, size - self.max_entries)
+            ).rowcount
+
+    async def purge(self, now: Optional[float] = None):
+        await self._call(self._execute, lambda: self._purge_sync(self._connect(), now))
+
+    async def _clear(self):
+        await self._execute(self._clear_sync)
+
+    def _clear_sync(self):
+        self._connect().execute("DELETE FROM cache_entries WHERE key >= ? AND key < ?",
+                                self._namespace_range())
+
+    async def close(self):
+        if self._conn is not None:
+            await self._execute(self._close_sync)
+
+    def _close_sync(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self) -> Dict[str, int]:
+        return {**super().stats(), "purged": self.purged}
+
+
+class RedisError(Exception):
+    """Ответ сервера с ошибкой"""
+
+
+def encode_command(args: Tuple) -> bytes:
+    """Команда в формате RESP: массив строк"""
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """Чтение одного ответа RESP2"""
+    line = await reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError("Соединение с сервером кэша закрыто")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b'+':
+        return rest.decode()
+    if kind == b'-':
+        raise RedisError(rest.decode())
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        size = int(rest)
+        if size < 0:
+            return None
+        return (await reader.readexactly(size + 2))[:-2]
+    if kind == b'*':
+        size = int(rest)
+        if size < 0:
+            return None
+        return [await read_reply(reader) for _ in range(size)]
+    raise RedisError(f"Неизвестный тип ответа: {line!r}")
+
+
+class RedisConnection:
+    """Соединение с сервером Redis: команда и ответ по очереди"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def execute(self, *args) -> Any:
+        self.writer.write(encode_command(args))
+        await self.writer.drain()
+        return await read_reply(self.reader)
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisClient:
+    """Минимальный клиент протокола Redis (RESP2) с пулом соединений"""
+
+    def __init__(
+            self,
+            url: str = CACHE_REDIS_URL,
+            pool_size: int = CACHE_REDIS_POOL_SIZE,
+            timeout: float = CACHE_TIMEOUT
+        ):
+        parts = urlsplit(url)
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or 6379
+        self.username = unquote(parts.username) if parts.username else None
+        self.password = unquote(parts.password) if parts.password else None
+        self.database = int(parts.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._idle: List[RedisConnection] = []
+        self._slots = asyncio.Semaphore(pool_size)
+
+    async def _connect(self) -> RedisConnection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        conn = RedisConnection(reader, writer)
+        try:
+            if self.password:
+                credentials = [self.username, self.password] if self.username else [self.password]
+                await conn.execute('AUTH', *credentials)
+            if self.database:
+                await conn.execute('SELECT', self.database)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    async def execute(self, *args) -> Any:
+        """Выполнение команды на свободном соединении пула"""
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else None
+            try:
+                if conn is None:
+                    conn = await asyncio.wait_for(self._connect(), self.timeout)
+                reply = await asyncio.wait_for(conn.execute(*args), self.timeout)
+            except BaseException:
+                # После сбоя или отмены состояние протокола неизвестно
+                if conn is not None:
+                    conn.close()
+                raise
+            self._idle.append(conn)
+            return reply
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class RedisCache(SharedCache):
+    """Кэш на сервере Redis (или совместимом), общий для всех хостов.
+
+    Записи удаляются сервером после срока хранения; размер ограничивается
+    политикой вытеснения сервера (maxmemory-policy).
+    """
+    backend = 'redis'
+    errors = (OSError, EOFError, asyncio.TimeoutError, RedisError)
+
+    def __init__(self, namespace: str, codec: Codec, client: RedisClient, stale_ttl: float = 0):
+        super().__init__(namespace, codec, stale_ttl)
+        self.client = client
+
+    async def _load(self, key: str) -> Optional[Tuple[float, str]]:
+        raw = await self.client.execute('GET', key)
+        if raw is None:
+            return None
+        expires_at, _, payload = raw.decode().partition('\n')
+        try:
+            return float(expires_at), payload
+        except ValueError:
+            return None
+
+    async def _store(self, key: str, expires_at: float, purge_at: float, payload: str):
+        ttl = int((purge_at - time.time()) * 1000)
+        if ttl > 0:
+            await self.client.execute('SET', key, f"{expires_at!r}\n{payload}", 'PX', ttl)
+
+    async def _clear(self):
+        cursor = b'0'
+        while True:
+            cursor, keys = await self.client.execute(
+                'SCAN', cursor, 'MATCH', f"{self.namespace}:*", 'COUNT', 1000
+            )
+            if keys:
+                await self.client.execute('DEL', *keys)
+            if cursor == b'0':
+                break
+
+    async def close(self):
+        await self.client.close()
+
+
+_redis_clients: Dict[str, RedisClient] = {}
+
+
+def create_cache(
+        namespace: str,
+        codec: Codec,
+        max_entries: int,
+        stale_ttl: float = 0,
+        backend: str = CACHE_BACKEND
+    ):
+    """Кэш с хранилищем, выбранным в CACHE_BACKEND"""
+    if backend == 'memory':
+        return MemoryCache(namespace, max_entries, stale_ttl)
+    if backend == 'sqlite':
+        return SQLiteCache(namespace, codec, CACHE_SQLITE_PATH, max_entries, stale_ttl)
+    if backend == 'redis':
+        # Кэши разных пространств имён используют один пул соединений
+        client = _redis_clients.get(CACHE_REDIS_URL)
+        if client is None:
+            client = _redis_clients[CACHE_REDIS_URL] = RedisClient(CACHE_REDIS_URL)
+        return RedisCache(namespace, codec, client, stale_ttl)
+    raise ValueError(f"Неизвестный тип кэша: {backend}")
@@ -0,0 +1,75 @@
+import os
+import time
+from typing import Optional
+
+import httpx
+
+
+UPSTREAM_BREAKER_FAILURES = int(os.getenv('UPSTREAM_BREAKER_FAILURES', '5'))
+UPSTREAM_BREAKER_RESET = float(os.getenv('UPSTREAM_BREAKER_RESET', '30'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Запрос не выполнен: автоматический выключатель хоста разомкнут"""
+
+
+class CircuitBreaker:
+    """Автоматический выключатель для внешнего хоста с пробным запросом"""
+
+    def __init__(
+            self,
+            host: str,
+            failure_threshold: int = UPSTREAM_BREAKER_FAILURES,
+            reset_timeout: float = UPSTREAM_BREAKER_RESET
+        ):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.trips = 0
+
+    def is_open(self, now: Optional[float] = None) -> bool:
+        """Разомкнут ли выключатель (запросы отклоняются без обращения к хосту)"""
+        if self.state == CLOSED:
+            return False
+        if self.state == HALF_OPEN:
+            return self._probe_in_flight
+        if now is None:
+            now = time.monotonic()
+        return now < self.opened_at + self.reset_timeout
+
+    def before_call(self):
+        """Проверка перед запросом; в полуоткрытом состоянии пропускается один пробный"""
+        if self.state == CLOSED:
+            return
+        if self.is_open():
+            self.rejected += 1
+            raise CircuitOpenError(f"Хост {self.host} временно недоступен")
+        self.state = HALF_OPEN
+        self._probe_in_flight = True
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.trips += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Пробный запрос прерван без результата: следующий запрос станет пробным"""
+        self._probe_in_flight = False
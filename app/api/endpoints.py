@@ -1,13 +1,32 @@
-from fastapi import APIRouter, Cookie, Response, Query, Depends
+from fastapi import APIRouter, Cookie, HTTPException, Request, Response, Query, Depends
+from fastapi.responses import StreamingResponse
 from typing import Dict, List, Optional
+import math
 import uuid
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api import services
-from app.db.base import db
-from app.models.weather import City
+from app.api import http_cache, services
+from app.api.broadcast import forecast_broadcaster
+from app.api.limits import client_address, user_rate_limiter
+from app.db.base import STATS_WINDOWS, db, decode_history_cursor
+from app.models.weather import BatchForecastRequest, City
 
-router = APIRouter()
+
+async def rate_limit(request: Request, user_id: Optional[str] = Cookie(None)):
+    """Ограничение частоты запросов пользователя (по cookie user_id, без неё — по адресу)"""
+    if user_id:
+        key = f"user:{user_id}"
+    else:
+        peer = request.client.host if request.client else None
+        key = f"ip:{client_address(peer, request.headers.get('x-forwarded-for'))}"
+    retry_after = user_rate_limiter.hit(key)
+    if retry_after:
+        raise HTTPException(status_code=429,
+                            detail="Слишком много запросов. Повторите позже.",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+router = APIRouter(dependencies=[Depends(rate_limit)])
 
 @router.get("/search")
 async def search_city(
@@ -15,39 +34,92 @@ async def search_city(
     session: AsyncSession = Depends(db.get_session)
 ) -> Dict[str, List[City]]:
     """Поиск города по названию (для автодополнения)"""
-    cities = await services.get_city_coordinates(q, session=session)
+    cities = await services.search_cities(q, session=session)
     return {"cities": cities}
 
 @router.get("/forecast")
 async def get_forecast(
+    request: Request,
     city: str = Query(..., description="Название города"),
+    response_format: str = Query("rows", alias="format", pattern="^(rows|columnar)$",
+                                 description="Формат прогноза: rows или columnar"),
     user_id: Optional[str] = Cookie(None),
     response: Response = None,
     session: AsyncSession = Depends(db.get_session)
 ):
     """Получение прогноза погоды для города"""
     # Если пользователь не имеет ID
-    if not user_id:
+    new_user = not user_id
+    if new_user:
         user_id = str(uuid.uuid4())
         response.set_cookie(key="user_id", value=user_id, max_age=3600*24*30)
     
-    return await services.forecast_handler(city, user_id, session)
+    result = await services.forecast_handler(city, user_id, session, response_format)
+
+    # Ответ с новой cookie не должен сохраняться в общих кэшах
+    headers = http_cache.forecast_cache_headers(result, response_format, private=new_user)
+    response.headers.update(headers)
+    return http_cache.not_modified(request, headers, response) or result
+
+@router.get("/forecast/stream")
+async def stream_forecast(
+    city: str = Query(..., description="Название города")
+) -> StreamingResponse:
+    """Обновления прогноза погоды для города (Server-Sent Events)"""
+    # Сессия закрывается до начала потока, чтобы подписка не занимала соединение с БД
+    async with db.Session() as session:
+        cities = await services.get_city_coordinates(city, limit=1, session=session)
+    if not cities:
+        raise HTTPException(status_code=404, detail=f"Город '{city}' не найден")
+
+    forecast_broadcaster.check_capacity()
+    return StreamingResponse(forecast_broadcaster.events(cities[0]),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no"})
+
+@router.post("/forecast/batch")
+async def get_forecast_batch(
+    request: BatchForecastRequest,
+    response_format: str = Query("rows", alias="format", pattern="^(rows|columnar)$",
+                                 description="Формат прогноза: rows или columnar"),
+    session: AsyncSession = Depends(db.get_session)
+):
+    """Получение прогноза погоды для нескольких городов одним запросом"""
+    return await services.batch_forecast_handler(
+        request.cities, session, request.forecast_days, response_format
+    )
 
 @router.get("/history")
 async def get_history(
     user_id: Optional[str] = Cookie(None), 
+    limit: int = Query(20, ge=1, le=100, description="Размер страницы"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы"),
     session: AsyncSession = Depends(db.get_session)
 ):
     """Получение истории поиска для пользователя"""
     if not user_id:
-        return {"history": []}
+        return {"history": [], "next_cursor": None}
     
-    history = await db.get_user_history(user_id, session)
-    return {"history": history}
+    try:
+        after = decode_history_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await db.get_user_history_page(user_id, session, limit, after)
 
 @router.get("/stats")
 async def get_statistics(
+    request: Request,
+    response: Response,
+    window: Optional[str] = Query(None, pattern="^(hour|day|week)$",
+                                  description="Период: hour, day или week (по умолчанию всё время)"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Количество городов"),
     session: AsyncSession = Depends(db.get_session)
 ):
     """Получение статистики поиска городов"""
-    return await db.get_city_stats(session)
+    stats = await db.get_city_stats(session, limit=limit,
+                                    window=STATS_WINDOWS.get(window))
+
+    headers = http_cache.stats_cache_headers(stats, window)
+    response.headers.update(headers)
+    return http_cache.not_modified(request, headers) or stats
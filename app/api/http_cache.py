@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.api.cache import seconds_until_refresh
+
+
+# Время кэширования статистики браузером и CDN (сек)
+STATS_CACHE_MAX_AGE = int(os.getenv('STATS_CACHE_MAX_AGE', '30'))
+
+# Суффиксы ETag сжатых вариантов ответа (добавляются CompressionMiddleware)
+ENCODING_SUFFIXES = ('-gzip', '-br')
+
+
+def make_etag(*parts) -> str:
+    """Сильный ETag по значениям, от которых зависит тело ответа"""
+    payload = json.dumps(jsonable_encoder(parts), ensure_ascii=False,
+                         separators=(',', ':'), sort_keys=True)
+    return '"%s"' % hashlib.sha1(payload.encode('utf-8')).hexdigest()[:24]
+
+
+def _opaque_tag(tag: str) -> str:
+    """ETag без признака слабого сравнения и суффикса кодировки"""
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def matching_etag(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """Значение из If-None-Match, совпадающее с etag (слабое сравнение, RFC 9110)"""
+    if not if_none_match:
+        return None
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return etag
+        if _opaque_tag(tag) == etag:
+            return tag
+    return None
+
+
+def cache_headers(etag: str, max_age: int, private: bool = False) -> Dict[str, str]:
+    scope = 'private' if private else 'public'
+    return {"ETag": etag, "Cache-Control": f"{scope}, max-age={max(int(max_age), 0)}"}
+
+
+def not_modified(
+        request: Request, headers: Dict[str, str], response: Optional[Response] = None
+    ) -> Optional[Response]:
+    """Ответ 304, если версия клиента совпадает с текущей"""
+    matched = matching_etag(request.headers.get('if-none-match'), headers["ETag"])
+    if matched is None:
+        return None
+    # Клиенту возвращается тот вариант ETag, который он прислал (с суффиксом сжатия)
+    result = Response(status_code=304, headers=dict(headers, ETag=matched))
+    if response is not None:
+        # Cookie нового пользователя передаётся и в ответе 304
+        result.raw_headers.extend(header for header in response.raw_headers
+                                  if header[0] == b'set-cookie')
+    return result
+
+
+def forecast_cache_headers(
+        result: dict, response_format: str, private: bool = False, now: Optional[int] = None
+    ) -> Dict[str, str]:
+    """ETag и Cache-Control ответа с прогнозом"""
+    if now is None:
+        now = int(time.time())
+    # Прогноз отдаётся начиная с текущего часа: тело меняется на границе часа
+    hour = now // 3600
+    etag = make_etag(result.get("city"), result.get("fetched_at"), result.get("stale", False),
+                     response_format, hour)
+    if result.get("stale"):
+        # Данные устаревшие: клиент должен перепроверить их при следующем запросе
+        max_age = 0
+    else:
+        max_age = min(seconds_until_refresh(now), (hour + 1) * 3600 - now)
+    return cache_headers(etag, max_age, private)
+
+
+def stats_cache_headers(stats, *variant) -> Dict[str, str]:
+    """ETag и Cache-Control ответа со статистикой поиска"""
+    return cache_headers(make_etag(stats, *variant), STATS_CACHE_MAX_AGE)
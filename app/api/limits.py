@@ -0,0 +1,254 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from ipaddress import IPv4Network, IPv6Network, ip_address, ip_network
+from typing import Deque, Dict, Hashable, List, Optional, Tuple, Union
+
+import httpx
+
+from app.metrics import registry
+
+
+# Одновременных запросов к внешнему API на процесс
+UPSTREAM_CONCURRENCY = int(os.getenv('UPSTREAM_CONCURRENCY', '50'))
+# Ожидающих свободного слота сверх этого числа запросы сразу отклоняются
+UPSTREAM_QUEUE_DEPTH = int(os.getenv('UPSTREAM_QUEUE_DEPTH', '200'))
+# Сколько запрос может ждать в очереди (сек)
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', '2'))
+# Запросов в секунду к внешнему API (0 — без ограничения) и допустимый всплеск
+UPSTREAM_RATE = float(os.getenv('UPSTREAM_RATE', '0'))
+UPSTREAM_BURST = int(os.getenv('UPSTREAM_BURST', '10'))
+
+# Запросов пользователя к API сервиса за окно USER_RATE_WINDOW секунд (0 — без ограничения)
+USER_RATE_LIMIT = int(os.getenv('USER_RATE_LIMIT', '120'))
+USER_RATE_WINDOW = float(os.getenv('USER_RATE_WINDOW', '60'))
+# Сколько пользователей хранить; давно не обращавшиеся вытесняются первыми
+USER_RATE_MAX_KEYS = int(os.getenv('USER_RATE_MAX_KEYS', '100000'))
+
+
+def parse_networks(value: str) -> List[Union[IPv4Network, IPv6Network]]:
+    """Список адресов и подсетей через запятую"""
+    return [ip_network(item.strip(), strict=False) for item in value.split(',') if item.strip()]
+
+
+# Адреса и подсети прокси (балансировщик, CDN), которым доверяется X-Forwarded-For
+TRUSTED_PROXIES = parse_networks(os.getenv('TRUSTED_PROXIES', ''))
+
+
+upstream_queue_wait = registry.histogram(
+    'upstream_queue_wait_seconds',
+    'Время ожидания слота и токена для запроса к внешнему API'
+)
+
+
+class UpstreamOverloadedError(httpx.HTTPError):
+    """Запрос не выполнен: очередь запросов к внешнему API переполнена"""
+
+
+class TokenBucket:
+    """Ограничение частоты: rate токенов в секунду, не больше burst накопленных"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self, now: Optional[float] = None) -> float:
+        """Резервирование токена; возвращает задержку до его появления (сек)"""
+        if now is None:
+            now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Токен может уйти в долг: следующие запросы ждут дольше, порядок сохраняется
+        self.tokens -= 1
+        return max(-self.tokens / self.rate, 0.0)
+
+    def cancel(self):
+        """Возврат зарезервированного токена"""
+        self.tokens += 1
+
+
+class UpstreamLimiter:
+    """Ограничение одновременных запросов к внешнему API с очередью ограниченной длины.
+
+    При переполненной очереди или истечении ожидания запрос отклоняется
+    UpstreamOverloadedError, и сервис отвечает 503 (или устаревшим прогнозом).
+    """
+
+    def __init__(
+            self,
+            concurrency: int = UPSTREAM_CONCURRENCY,
+            max_queue: int = UPSTREAM_QUEUE_DEPTH,
+            timeout: float = UPSTREAM_QUEUE_TIMEOUT,
+            rate: float = UPSTREAM_RATE,
+            burst: int = UPSTREAM_BURST
+        ):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.in_flight = 0
+        # Futures создаются в текущем цикле событий, поэтому лимитер не привязан к циклу
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        self.shed = 0
+        self.timeouts = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def _acquire(self, timeout: float):
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            raise UpstreamOverloadedError("Очередь запросов к внешнему API переполнена")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise UpstreamOverloadedError("Превышено время ожидания запроса к внешнему API")
+        except asyncio.CancelledError:
+            # Слот уже передан этому запросу: возвращаем его следующему
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _release(self):
+        # Слот передаётся первому ожидающему без уменьшения in_flight
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """Слот для одного запроса к внешнему API"""
+        started = time.monotonic()
+        await self._acquire(self.timeout)
+        try:
+            if self.bucket is not None:
+                delay = self.bucket.reserve()
+                if delay > self.timeout - (time.monotonic() - started):
+                    self.bucket.cancel()
+                    self.timeouts += 1
+                    raise UpstreamOverloadedError("Превышена частота запросов к внешнему API")
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            upstream_queue_wait.observe(time.monotonic() - started)
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": self.in_flight,
+                "queued": self.queued,
+                "shed": self.shed,
+                "timeouts": self.timeouts}
+
+
+def _is_trusted(address: str) -> bool:
+    try:
+        parsed = ip_address(address)
+    except ValueError:
+        return False
+    return any(parsed in network for network in TRUSTED_PROXIES)
+
+
+def client_address(peer: Optional[str], forwarded_for: Optional[str] = None) -> str:
+    """Адрес клиента; X-Forwarded-For учитывается, только если запрос пришёл от доверенного прокси"""
+    address = peer or 'unknown'
+    if not forwarded_for or not _is_trusted(address):
+        return address
+    # Адреса справа добавлены нашими прокси: клиент — первый недоверенный адрес справа,
+    # адреса левее него клиент мог подставить сам
+    for hop in reversed([hop.strip() for hop in forwarded_for.split(',') if hop.strip()]):
+        address = hop
+        if not _is_trusted(hop):
+            break
+    return address
+
+
+class SlidingWindowLimiter:
+    """Ограничение частоты запросов по ключу скользящим окном.
+
+    Для ключа хранятся только номер окна и счётчики текущего и предыдущего окна;
+    число запросов за скользящее окно оценивается их взвешенной суммой.
+    """
+
+    def __init__(
+            self,
+            limit: int = USER_RATE_LIMIT,
+            window: float = USER_RATE_WINDOW,
+            max_keys: int = USER_RATE_MAX_KEYS
+        ):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[Hashable, Tuple[int, int, int]]" = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def clear(self):
+        self._counters.clear()
+
+    def hit(self, key: Hashable, now: Optional[float] = None) -> float:
+        """Учёт запроса; 0 — разрешён, иначе через сколько секунд можно повторить"""
+        if self.limit <= 0:
+            return 0.0
+        if now is None:
+            now = time.time()
+        window_id = int(now // self.window)
+        number, previous, current = self._counters.get(key, (window_id, 0, 0))
+        if number == window_id - 1:
+            previous, current = current, 0
+        elif number != window_id:
+            previous, current = 0, 0
+
+        # Доля предыдущего окна, ещё входящая в скользящее окно
+        overlap = 1 - (now % self.window) / self.window
+        if previous * overlap + current >= self.limit:
+            self.rejected += 1
+            self._counters[key] = (window_id, previous, current)
+            until_next_window = self.window - now % self.window
+            if current >= self.limit:
+                return until_next_window
+            # Вклад предыдущего окна уменьшается со временем
+            excess = previous * overlap + current - self.limit + 1
+            return min(excess / previous * self.window, until_next_window)
+
+        self._counters[key] = (window_id, previous, current + 1)
+        self._counters.move_to_end(key)
+        while len(self._counters) > self.max_keys:
+            self._counters.popitem(last=False)
+            self.evictions += 1
+        self.allowed += 1
+        return 0.0
+
+    def stats(self) -> Dict[str, int]:
+        return {"keys": len(self._counters),
+                "allowed": self.allowed,
+                "rejected": self.rejected,
+                "evictions": self.evictions}
+
+
+# Ограничение частоты запросов пользователей к API сервиса
+user_rate_limiter = SlidingWindowLimiter()
+registry.register_stats('weather_user_rate_limit', user_rate_limiter.stats)
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+from app.api import services
+from app.api.cache import forecast_cache, forecast_cache_key, next_refresh_at
+from app.db.base import DB, STATS_WINDOWS, db
+from app.db.city_index import city_from_db
+from app.log_conf import logging
+from app.metrics import registry
+from app.models.weather import City
+
+
+logger = logging.getLogger(__name__)
+
+
+PREFETCH_TOP_N = int(os.getenv('PREFETCH_TOP_N', '20'))
+PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', '4'))
+PREFETCH_INTERVAL = float(os.getenv('PREFETCH_INTERVAL', '60'))
+# Записи, истекающие на ближайшей смене модели в течение PREFETCH_LEAD секунд, продлеваются
+# на PREFETCH_LEAD секунд после неё и обновляются уже после смены модели
+PREFETCH_LEAD = float(os.getenv('PREFETCH_LEAD', '180'))
+# Случайная задержка перед каждым обновлением, чтобы не создавать всплеск запросов
+PREFETCH_JITTER = float(os.getenv('PREFETCH_JITTER', '30'))
+# Популярность считается по поискам за период hour, day или week (пусто — за всё время)
+PREFETCH_WINDOW = STATS_WINDOWS.get(os.getenv('PREFETCH_WINDOW', 'day'))
+
+
+class ForecastPrefetcher:
+    """Фоновое обновление прогнозов популярных городов до истечения кэша"""
+
+    def __init__(
+            self,
+            database: DB,
+            top_n: int = PREFETCH_TOP_N,
+            concurrency: int = PREFETCH_CONCURRENCY,
+            interval: float = PREFETCH_INTERVAL,
+            lead: float = PREFETCH_LEAD,
+            jitter: float = PREFETCH_JITTER,
+            window: Optional[int] = PREFETCH_WINDOW
+        ):
+        self.db = database
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.interval = interval
+        self.lead = lead
+        # Задержка не должна выводить обновление за пределы окна lead
+        self.jitter = min(jitter, lead / 2)
+        self.window = window
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped_fresh = 0
+        self.extended = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Запуск фоновой задачи предзагрузки"""
+        if self.running or self.top_n <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка предзагрузки прогнозов: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _top_cities(self) -> List[City]:
+        async with self.db.Session() as session:
+            stats = await self.db.get_city_stats(session, limit=self.top_n,
+                                                 window=self.window)
+            names = [item["city"] for item in stats]
+            db_cities = await self.db.find_cities_by_names(names, session)
+
+        by_name: Dict[str, City] = {}
+        for db_city in db_cities:
+            by_name.setdefault(db_city.name.lower(), city_from_db(db_city))
+        return [by_name[name.lower()] for name in names if name.lower() in by_name]
+
+    async def run_once(self, now: Optional[float] = None):
+        """Обновление прогнозов популярных городов после смены модели прогноза.
+
+        До смены модели API отдаёт прежние данные, поэтому запрос к нему раньше
+        смены закэшировал бы их ещё на цикл. Вместо этого истекающая запись
+        продлевается на lead секунд и обновляется при первом запуске после смены.
+        """
+        self.runs += 1
+        if now is None:
+            now = time.time()
+        boundary = next_refresh_at(now)
+
+        due = []
+        seen = set()
+        for city in await self._top_cities():
+            key = forecast_cache_key(city, 1, services.HOURLY_VARIABLES)
+            if key in seen:
+                continue
+            seen.add(key)
+            expires_at = await forecast_cache.expires_at(key)
+            if expires_at is not None and expires_at - now > self.lead:
+                self.skipped_fresh += 1
+                continue
+            if expires_at is not None and expires_at >= boundary:
+                # Запись истекает на ближайшей смене модели: данные ещё актуальны
+                forecast = await forecast_cache.get(key, now)
+                if forecast is not None:
+                    await forecast_cache.set(key, forecast, boundary + self.lead)
+                    self.extended += 1
+                continue
+            # Запись отсутствует, истекла или продлена на прошлой смене модели
+            due.append(city)
+
+        if not due:
+            return
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh(city: City):
+            async with semaphore:
+                if self.jitter:
+                    await asyncio.sleep(random.uniform(0, self.jitter))
+                try:
+                    # Новая запись истекает на следующей смене модели
+                    await services.refresh_weather_forecast(city)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Не удалось обновить прогноз для {city.name}: {e}")
+                else:
+                    self.refreshed += 1
+
+        await asyncio.gather(*(refresh(city) for city in due))
+
+    def stats(self) -> Dict[str, int]:
+        return {"runs": self.runs,
+                "refreshed": self.refreshed,
+                "failed": self.failed,
+                "skipped_fresh": self.skipped_fresh,
+                "extended": self.extended}
+
+
+# Фоновая предзагрузка прогнозов
+forecast_prefetcher = ForecastPrefetcher(db)
+registry.register_stats('weather_prefetch', forecast_prefetcher.stats)
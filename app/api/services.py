@@ -1,11 +1,29 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left
 from datetime import datetime
-from typing import Optional, List
+from functools import lru_cache
+from typing import Dict, Optional, List
 
 from fastapi import HTTPException
 import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.cache import (
+    GEOCODING_CACHE_NEGATIVE_TTL,
+    GEOCODING_CACHE_TTL,
+    forecast_cache,
+    forecast_cache_key,
+    geocoding_cache,
+    geocoding_cache_key,
+    next_refresh_at
+)
+from app.api.singleflight import forecast_flight, geocoding_flight
+from app.api.upstream import upstream
 from app.db.base import db
+from app.db.city_index import city_from_db, city_index
+from app.db.history_writer import history_writer
 from app.models.weather import City, WeatherForecast, WeatherData
 
 from app.log_conf import logging
@@ -13,6 +31,18 @@ from app.log_conf import logging
 
 logger = logging.getLogger(__name__)
 
+# Адреса API переопределяются для тестовых стендов и нагрузочных тестов
+GEOCODING_API_URL = os.getenv(
+    'GEOCODING_API_URL', "https://geocoding-api.open-meteo.com/v1/search")
+FORECAST_API_URL = os.getenv(
+    'FORECAST_API_URL', "https://api.open-meteo.com/v1/forecast")
+
+# Запрашиваемые почасовые параметры прогноза
+HOURLY_VARIABLES = ("temperature_2m",)
+
+# Максимум координат в одном запросе прогноза для пакетной обработки
+BATCH_UPSTREAM_CHUNK = int(os.getenv('BATCH_UPSTREAM_CHUNK', '50'))
+
 
 async def get_city_coordinates(
     city_name: str, limit: int = 5, session: AsyncSession = None
@@ -29,36 +59,90 @@ async def get_city_coordinates(
                          country=db_city.country,
                          admin1=db_city.admin1)]
 
-    # Если город не найден в БД, запрашиваем API
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://geocoding-api.open-meteo.com/v1/search",
-                params={"name": city_name,
-                        "count": limit,
-                        "language": "ru",
-                        "format": "json"}
+    # Транслитерация и альтернативные названия — по индексу в памяти
+    exact_city = city_index.match(city_name, max_distance=0)
+    if exact_city is not None:
+        return [exact_city]
+
+    # Если города нет в БД, берём результат API из кэша или запрашиваем API
+    # (одновременные запросы одного и того же города объединяются)
+    cache_key = geocoding_cache_key(city_name, limit)
+    cities = await geocoding_cache.get(cache_key)
+    if cities is None:
+        try:
+            cities = await geocoding_flight.do(
+                cache_key,
+                lambda: _fetch_city_coordinates(city_name, limit, save=session is not None)
             )
-            response.raise_for_status()
-            data = response.json()
-
-            if "results" not in data:
-                return []
-
-            cities = [City(id=item.get("id"),
-                           name=item.get("name"),
-                           latitude=item.get("latitude"),
-                           longitude=item.get("longitude"),
-                           country=item.get("country"),
-                           admin1=item.get("admin1"))
-                      for item in data["results"]]
-
-            # Сохраняем найденные города в БД
-            if session and cities:
-                for city_data in data["results"]:
-                    await db.save_city(city_data, session)
-
-            return cities
+        except HTTPException:
+            fuzzy_city = city_index.match(city_name)
+            if fuzzy_city is None:
+                raise
+            return [fuzzy_city]
+
+    # Опечатки исправляются по индексу, только если API такого города не знает:
+    # иначе реальный город, которого ещё нет в БД, подменился бы похожим
+    if not cities:
+        fuzzy_city = city_index.match(city_name)
+        if fuzzy_city is not None:
+            return [fuzzy_city]
+    return list(cities)
+
+
+async def search_cities(
+    query: str, limit: int = 5, session: AsyncSession = None
+) -> List[City]:
+    """Подсказки городов: из индекса в памяти, из БД, иначе через геокодирование"""
+    cities = city_index.search(query, limit)
+    if cities:
+        return cities
+
+    if session:
+        db_cities = (await db.find_cities_by_prefix(query, session, limit)
+                     or await db.find_similar_cities(query, session, limit))
+        if db_cities:
+            return [city_from_db(db_city) for db_city in db_cities]
+
+    return await get_city_coordinates(query, limit=limit, session=session)
+
+
+async def _fetch_city_coordinates(
+    city_name: str, limit: int, save: bool = False
+) -> List[City]:
+    """Запрос координат города к API геокодирования"""
+    try:
+        response = await upstream.get(
+            GEOCODING_API_URL,
+            params={"name": city_name,
+                    "count": limit,
+                    "language": "ru",
+                    "format": "json"}
+        )
+        data = response.json()
+
+        cities = [City(id=item.get("id"),
+                       name=item.get("name"),
+                       latitude=item.get("latitude"),
+                       longitude=item.get("longitude"),
+                       country=item.get("country"),
+                       admin1=item.get("admin1"))
+                  for item in data.get("results", [])]
+
+        # Пустой результат хранится недолго: город может появиться в API
+        ttl = GEOCODING_CACHE_TTL if cities else GEOCODING_CACHE_NEGATIVE_TTL
+        await geocoding_cache.set(geocoding_cache_key(city_name, limit), cities,
+                                  time.time() + ttl)
+
+        # Сохраняем найденные города в БД. Запрос объединяется для нескольких
+        # вызывающих и переживает их отмену, поэтому сессия запроса не используется
+        if save and cities:
+            try:
+                async with db.Session() as session:
+                    await db.save_cities(data["results"], session)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить города в БД: {e}")
+
+        return cities
     except httpx.HTTPError as e:
         logger.error(f"Ошибка при получении координат города: {e}")
         raise HTTPException(
@@ -71,34 +155,62 @@ async def get_weather_forecast(
     city: City, forecast_days: int = 1
 ) -> Optional[WeatherForecast]:
     """Получение прогноза погоды по координатам"""
+    cache_key = forecast_cache_key(city, forecast_days, HOURLY_VARIABLES)
+    cached = await forecast_cache.get(cache_key)
+    if cached is not None:
+        # В одной ячейке сетки могут оказаться разные города
+        return cached.model_copy(update={"city": city})
+
+    # Пока API недоступен или прогноз уже обновляется, отдаём последний полученный
+    if (upstream.breaker(FORECAST_API_URL).is_open()
+            or forecast_flight.in_flight(cache_key)):
+        stale = await forecast_cache.get_stale(cache_key)
+        if stale is not None:
+            return stale.model_copy(update={"city": city, "stale": True})
+
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://api.open-meteo.com/v1/forecast",
-                params={"latitude": city.latitude,
-                        "longitude": city.longitude,
-                        "hourly": "temperature_2m",
-                        "forecast_days": forecast_days,
-                        "format": "json",
-                        "timeformat": "unixtime"}
-            )
-            response.raise_for_status()
-            data = response.json()
+        forecast = await forecast_flight.do(
+            cache_key,
+            lambda: _fetch_weather_forecast(city, forecast_days, cache_key)
+        )
+    except HTTPException:
+        stale = await forecast_cache.get_stale(cache_key)
+        if stale is None:
+            raise
+        return stale.model_copy(update={"city": city, "stale": True})
 
-            if "hourly" not in data:
-                return None
+    if forecast is not None and forecast.city != city:
+        forecast = forecast.model_copy(update={"city": city})
+    return forecast
 
-            # Создаем объект прогноза погоды
-            weather_data = WeatherData(
-                time=data["hourly"]["time"],
-                temperature_2m=data["hourly"]["temperature_2m"]
-            )
 
-            return WeatherForecast(
-                city=city,
-                hourly=weather_data,
-                hourly_units=data["hourly_units"]
-            )
+async def refresh_weather_forecast(
+    city: City, forecast_days: int = 1, expires_at: Optional[float] = None
+) -> Optional[WeatherForecast]:
+    """Принудительное обновление прогноза в кэше (для фоновой предзагрузки)"""
+    cache_key = forecast_cache_key(city, forecast_days, HOURLY_VARIABLES)
+    return await forecast_flight.do(
+        cache_key,
+        lambda: _fetch_weather_forecast(city, forecast_days, cache_key, expires_at)
+    )
+
+
+async def _fetch_weather_forecast(
+    city: City,
+    forecast_days: int,
+    cache_key: tuple,
+    expires_at: Optional[float] = None
+) -> Optional[WeatherForecast]:
+    """Запрос прогноза погоды к API с сохранением в кэш"""
+    try:
+        response = await upstream.get(
+            FORECAST_API_URL,
+            params=_forecast_params([city], forecast_days)
+        )
+        forecast = _parse_forecast(response.json(), city)
+        if forecast is not None:
+            await forecast_cache.set(cache_key, forecast, expires_at or next_refresh_at())
+        return forecast
     except httpx.HTTPError as e:
         logger.error(f"Ошибка при получении прогноза погоды: {e}")
         raise HTTPException(
@@ -107,33 +219,219 @@ async def get_weather_forecast(
         )
 
 
+def _forecast_params(cities: List[City], forecast_days: int) -> dict:
+    """Параметры запроса прогноза; несколько координат передаются через запятую"""
+    return {"latitude": ",".join(str(city.latitude) for city in cities),
+            "longitude": ",".join(str(city.longitude) for city in cities),
+            "hourly": ",".join(HOURLY_VARIABLES),
+            "forecast_days": forecast_days,
+            "format": "json",
+            "timeformat": "unixtime"}
+
+
+def _parse_forecast(data: dict, city: City) -> Optional[WeatherForecast]:
+    """Создание объекта прогноза из ответа API"""
+    if "hourly" not in data:
+        return None
+
+    weather_data = WeatherData(
+        time=data["hourly"]["time"],
+        temperature_2m=data["hourly"]["temperature_2m"]
+    )
+
+    return WeatherForecast(
+        city=city,
+        hourly=weather_data,
+        hourly_units=data["hourly_units"],
+        fetched_at=int(time.time())
+    )
+
+
+async def _fetch_forecast_chunk(
+    cities: List[City], keys: List[tuple], forecast_days: int
+) -> Dict[tuple, Optional[WeatherForecast]]:
+    """Один запрос прогноза для нескольких координат с сохранением в кэш"""
+    response = await upstream.get(FORECAST_API_URL,
+                                  params=_forecast_params(cities, forecast_days))
+    data = response.json()
+    # Для одной точки API возвращает объект, для нескольких — список
+    items = data if isinstance(data, list) else [data]
+
+    expires_at = next_refresh_at()
+    forecasts = {}
+    for city, key, item in zip(cities, keys, items):
+        forecast = _parse_forecast(item, city)
+        if forecast is not None:
+            await forecast_cache.set(key, forecast, expires_at)
+        forecasts[key] = forecast
+    return forecasts
+
+
+async def get_weather_forecasts(
+    cities: List[City], forecast_days: int = 1
+) -> List[Optional[WeatherForecast]]:
+    """Прогнозы для списка городов: промахи кэша запрашиваются пачками координат"""
+    keys = [forecast_cache_key(city, forecast_days, HOURLY_VARIABLES) for city in cities]
+    forecasts: Dict[tuple, Optional[WeatherForecast]] = {}
+    missing: Dict[tuple, City] = {}
+    for city, key in zip(cities, keys):
+        if key in forecasts or key in missing:
+            continue
+        cached = await forecast_cache.get(key)
+        if cached is not None:
+            forecasts[key] = cached
+        else:
+            missing[key] = city
+
+    missing_keys = list(missing)
+    chunks = [missing_keys[i:i + BATCH_UPSTREAM_CHUNK]
+              for i in range(0, len(missing_keys), BATCH_UPSTREAM_CHUNK)]
+    results = await asyncio.gather(*(
+        _fetch_forecast_chunk([missing[key] for key in chunk], chunk, forecast_days)
+        for chunk in chunks
+    ), return_exceptions=True)
+
+    failed = False
+    for chunk, result in zip(chunks, results):
+        if not isinstance(result, BaseException):
+            forecasts.update(result)
+            continue
+        if not isinstance(result, httpx.HTTPError):
+            raise result
+        logger.error(f"Ошибка при получении пакета прогнозов погоды: {result}")
+        failed = True
+        # При сбое API отдаём последние полученные прогнозы с пометкой
+        for key in chunk:
+            stale = await forecast_cache.get_stale(key)
+            forecasts[key] = stale.model_copy(update={"stale": True}) if stale else None
+
+    if failed and all(forecasts[key] is None for key in missing_keys):
+        raise HTTPException(
+            status_code=503,
+            detail="Не удалось получить прогноз погоды. API недоступен."
+        )
+
+    return [forecasts[key].model_copy(update={"city": city})
+            if forecasts.get(key) is not None else None
+            for city, key in zip(cities, keys)]
+
+
+@lru_cache(maxsize=1024)
+def _format_hour(timestamp: int) -> str:
+    """Время прогноза в формате ЧЧ:ММ (почасовые метки повторяются между запросами)"""
+    return datetime.fromtimestamp(timestamp).strftime('%H:%M')
+
+
+def format_forecast(
+    forecast: WeatherForecast, response_format: str = "rows", now: Optional[int] = None
+):
+    """Почасовой прогноз начиная с текущего часа в построчном или колоночном виде"""
+    if now is None:
+        now = int(time.time())
+    # Метки времени отсортированы: первый будущий час находим бинарным поиском
+    start = bisect_left(forecast.hourly.time, now)
+    times = [_format_hour(timestamp) for timestamp in forecast.hourly.time[start:]]
+    temperatures = forecast.hourly.temperature_2m[start:]
+    unit = forecast.hourly_units.get("temperature_2m", "°C")
+
+    if response_format == "columnar":
+        return {"time": times, "temperature": temperatures, "unit": unit}
+
+    return [{"time": time_str, "temperature": temp, "unit": unit}
+            for time_str, temp in zip(times, temperatures)]
+
+
 async def forecast_handler(
-        city: str, user_id: str, session: AsyncSession
+        city: str, user_id: str, session: AsyncSession, response_format: str = "rows"
     ) -> dict:
     """Обработчик прогноза погоды"""
 
     # Получаем координаты города
     cities = await get_city_coordinates(city, limit=1, session=session)
+    if not cities:
+        raise HTTPException(status_code=404, detail=f"Город '{city}' не найден")
     city_info = cities[0]
 
     # Получаем прогноз погоды по координатам
     forecast = await get_weather_forecast(city_info)
+    if forecast is None:
+        raise HTTPException(status_code=404, detail="Не удалось получить прогноз погоды")
 
-    # Добавляем поиск в историю
-    await db.add_search_history(user_id, city_info.name, session)
+    # Добавляем поиск в историю (в фоне, если запущена пакетная запись)
+    if history_writer.running:
+        await history_writer.submit(user_id, city_info.name)
+    else:
+        await db.add_search_history(user_id, city_info.name, session)
+
+    return {"city": forecast.city,
+            "forecast": format_forecast(forecast, response_format),
+            "stale": forecast.stale,
+            "fetched_at": forecast.fetched_at}
+
+
+async def _geocode_batch(
+    names: List[str], session: AsyncSession
+) -> Dict[str, object]:
+    """Координаты для списка названий: один запрос к БД, промахи — через API"""
+    found: Dict[str, object] = {}
+    for db_city in await db.find_cities_by_names(names, session):
+        found.setdefault(db_city.name.lower(), city_from_db(db_city))
+
+    missing = list({name.lower(): name for name in names
+                    if name.lower() not in found}.values())
+    # Сессия не передаётся: запросы идут параллельно, сохранение — одним пакетом ниже
+    results = await asyncio.gather(
+        *(get_city_coordinates(name, limit=1) for name in missing),
+        return_exceptions=True
+    )
+
+    new_cities = []
+    for name, result in zip(missing, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, HTTPException):
+                raise result
+            found[name.lower()] = result
+        elif result:
+            found[name.lower()] = result[0]
+            new_cities.append(result[0].model_dump())
+        else:
+            found[name.lower()] = None
+
+    if new_cities:
+        await db.save_cities(new_cities, session)
+    return found
+
+
+async def batch_forecast_handler(
+        names: List[str],
+        session: AsyncSession,
+        forecast_days: int = 1,
+        response_format: str = "rows"
+    ) -> dict:
+    """Обработчик пакетного прогноза погоды для нескольких городов"""
+    geocoded = await _geocode_batch(names, session)
+
+    found = [(key, city) for key, city in geocoded.items() if isinstance(city, City)]
+    forecasts = dict(zip(
+        (key for key, _ in found),
+        await get_weather_forecasts([city for _, city in found], forecast_days)
+    )) if found else {}
+
+    results = []
+    for name in names:
+        city = geocoded.get(name.lower())
+        forecast = forecasts.get(name.lower())
+        if isinstance(city, HTTPException):
+            results.append({"query": name, "error": city.detail})
+        elif city is None:
+            results.append({"query": name, "error": f"Город '{name}' не найден"})
+        elif forecast is None:
+            results.append({"query": name, "error": "Не удалось получить прогноз погоды"})
+        else:
+            results.append({"query": name,
+                            "city": forecast.city,
+                            "forecast": format_forecast(forecast, response_format),
+                            "stale": forecast.stale,
+                            "fetched_at": forecast.fetched_at})
+    return {"results": results}
 
-    # Форматируем данные для отображения
-    formatted_data = []
-    for i in range(len(forecast.hourly.time)):
-        timestamp = forecast.hourly.time[i]
-        if timestamp < int(datetime.now().timestamp()):
-            continue
-        time_str = datetime.fromtimestamp(timestamp).strftime('%H:%M')
-        temp = forecast.hourly.temperature_2m[i]
-        formatted_data.append({
-            "time": time_str,
-            "temperature": temp,
-            "unit": forecast.hourly_units.get("temperature_2m", "°C")
-        })
-
-    return {"city": forecast.city, "forecast": formatted_data}
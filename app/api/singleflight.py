@@ -0,0 +1,56 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from app.metrics import registry
+
+
+class SingleFlight:
+    """Объединение одновременных одинаковых запросов в один вызов"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Выполняется ли сейчас запрос с таким ключом"""
+        return key in self._calls
+
+    async def do(
+            self, key: Hashable, fn: Callable[[], Awaitable[Any]]
+        ) -> Any:
+        """Выполнение fn или ожидание уже запущенного вызова с тем же ключом"""
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            # Вызов выполняется отдельной задачей, чтобы отмена одного из
+            # ожидающих не прерывала запрос для остальных
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Помечаем исключение как полученное, даже если все ожидающие отменены
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики выполненных и объединённых вызовов"""
+        return {"in_flight": len(self._calls),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "errors": self.errors}
+
+
+# Объединение запросов к API геокодирования и прогноза
+geocoding_flight = SingleFlight()
+forecast_flight = SingleFlight()
+registry.register_stats('weather_geocoding_singleflight', geocoding_flight.stats)
+registry.register_stats('weather_forecast_singleflight', forecast_flight.stats)
@@ -0,0 +1,157 @@
+import os
+import time
+import re
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.api.circuit import CircuitBreaker
+from app.api.limits import UpstreamLimiter, UpstreamOverloadedError
+from app.log_conf import logging
+from app.metrics import registry, upstream_errors, upstream_request_duration
+
+
+logger = logging.getLogger(__name__)
+
+
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', '100'))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv('UPSTREAM_MAX_KEEPALIVE', '20'))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv('UPSTREAM_KEEPALIVE_EXPIRY', '30'))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3'))
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', '10'))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv('UPSTREAM_POOL_TIMEOUT', '5'))
+UPSTREAM_HTTP2 = os.getenv('UPSTREAM_HTTP2', '0').lower() in ('1', 'true', 'yes')
+
+
+def _http2_available() -> bool:
+    """Проверка наличия пакета h2, необходимого httpx для HTTP/2"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class UpstreamClient:
+    """Общий HTTP-клиент для запросов к Open-Meteo с пулом соединений"""
+
+    def __init__(
+            self,
+            max_connections: int = UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive: int = UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry: float = UPSTREAM_KEEPALIVE_EXPIRY,
+            http2: bool = UPSTREAM_HTTP2
+        ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(
+            UPSTREAM_READ_TIMEOUT,
+            connect=UPSTREAM_CONNECT_TIMEOUT,
+            pool=UPSTREAM_POOL_TIMEOUT
+        )
+        self.http2 = http2
+        self._client: Optional[httpx.AsyncClient] = None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # Общее ограничение одновременных запросов ко всем хостам
+        self.limiter = UpstreamLimiter()
+
+    def _create_client(self) -> httpx.AsyncClient:
+        http2 = self.http2
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 запрошен, но пакет h2 не установлен: используется HTTP/1.1")
+            http2 = False
+        return httpx.AsyncClient(limits=self.limits,
+                                 timeout=self.timeout,
+                                 http2=http2)
+
+    async def start(self):
+        """Создание клиента (вызывается при старте приложения)"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+
+    async def close(self):
+        """Закрытие клиента и всех соединений пула"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Клиент создаётся лениво, если приложение запущено без lifespan (тесты, скрипты)
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """Автоматический выключатель хоста из url"""
+        host = urlsplit(url).hostname
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(host)
+        return breaker
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        """GET-запрос; ответ с кодом ошибки приводит к httpx.HTTPStatusError,
+        разомкнутый выключатель хоста — к CircuitOpenError без запроса,
+        переполненная очередь запросов — к UpstreamOverloadedError"""
+        breaker = self.breaker(url)
+        labels = (breaker.host,)
+        try:
+            breaker.before_call()
+        except httpx.HTTPError as e:
+            upstream_errors.inc(labels + (type(e).__name__,))
+            raise
+
+        started = None
+        try:
+            async with self.limiter.slot():
+                started = time.perf_counter()
+                response = await self.client.get(url, **kwargs)
+                response.raise_for_status()
+        except UpstreamOverloadedError as e:
+            # Перегрузка сервиса не говорит о недоступности хоста
+            breaker.release()
+            upstream_errors.inc(labels + (type(e).__name__,))
+            raise
+        except httpx.HTTPStatusError as e:
+            # Ошибки клиента не говорят о недоступности хоста
+            if e.response.status_code >= 500 or e.response.status_code == 429:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            upstream_errors.inc(labels + (type(e).__name__,))
+            raise
+        except httpx.HTTPError as e:
+            breaker.record_failure()
+            upstream_errors.inc(labels + (type(e).__name__,))
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+        finally:
+            # Время ожидания в очереди учитывается отдельно (upstream_queue_wait_seconds)
+            if started is not None:
+                upstream_request_duration.observe(time.perf_counter() - started, labels)
+        return response
+
+    def stats(self) -> Dict[str, int]:
+        """Состояние выключателей по хостам"""
+        stats = {}
+        for host, breaker in self.breakers.items():
+            name = re.sub(r'[^a-zA-Z0-9_]', '_', host)
+            stats[f"{name}_open"] = int(breaker.is_open())
+            stats[f"{name}_trips"] = breaker.trips
+            stats[f"{name}_rejected"] = breaker.rejected
+        return stats
+
+
+# Общий клиент приложения
+upstream = UpstreamClient()
+registry.register_stats('weather_upstream_breaker', upstream.stats)
+registry.register_stats('weather_upstream_limiter', upstream.limiter.stats)
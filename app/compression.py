@@ -0,0 +1,171 @@
+import os
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен, без него используется только gzip
+    brotli = None
+
+
+# Ответы меньше порога (байт) не сжимаются
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '500'))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+
+# Потоковые ответы, которые должны доходить до клиента без буферизации
+UNCOMPRESSED_CONTENT_TYPES = ('text/event-stream',)
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Кодировки из Accept-Encoding с их весами q"""
+    encodings = {}
+    for item in header.split(','):
+        name, *params = item.strip().split(';')
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Предпочтительная поддерживаемая кодировка (brotli, если он установлен)"""
+    accepted = accepted_encodings(header)
+    supported = ('br', 'gzip') if brotli is not None else ('gzip',)
+    best, best_quality = None, 0.0
+    for encoding in supported:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _GzipCompressor:
+    def __init__(self):
+        # wbits=31: формат gzip
+        self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+_COMPRESSORS = {'gzip': _GzipCompressor, 'br': _BrotliCompressor}
+
+
+class CompressionMiddleware:
+    """Сжатие ответов gzip или brotli с порогом по размеру (ASGI)"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+            if encoding is not None:
+                responder = _CompressionResponder(self.app, encoding, self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Optional[Send] = None
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.compressor = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def _set_headers(self, content_length: Optional[int]):
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        headers.add_vary_header("Accept-Encoding")
+        # Сжатый вариант — другое представление: сильный ETag должен отличаться
+        etag = headers.get("etag")
+        if etag and etag.endswith('"'):
+            headers["ETag"] = f'{etag[:-1]}-{self.encoding}"'
+
+    async def send_compressed(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Заголовки отправляются после того, как станет ясно, сжимается ли тело
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = ("content-encoding" in headers
+                                or headers.get("content-type", "").startswith(
+                                    UNCOMPRESSED_CONTENT_TYPES))
+            return
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.started:
+            self.started = True
+            if self.passthrough or (len(body) < self.minimum_size and not more_body):
+                self.passthrough = True
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            self.compressor = _COMPRESSORS[self.encoding]()
+            if more_body:
+                self._set_headers(None)
+                body = self.compressor.compress(body) + self.compressor.flush()
+            else:
+                body = self.compressor.compress(body) + self.compressor.finish()
+                self._set_headers(len(body))
+            await self.send(self.initial_message)
+            await self.send({**message, "body": body})
+            return
+
+        if self.passthrough:
+            await self.send(message)
+            return
+        # Каждая часть потокового ответа отправляется сразу (Z_SYNC_FLUSH)
+        body = self.compressor.compress(body)
+        body += self.compressor.flush() if more_body else self.compressor.finish()
+        await self.send({**message, "body": body})
@@ -0,0 +1,307 @@
+import math
+import os
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import CityDB
+from app.metrics import registry
+from app.models.weather import City
+
+
+# Минимальное сходство по триграммам для попадания в подсказки
+TRIGRAM_THRESHOLD = 0.3
+
+# Минимальное сходство нечёткого совпадения названия (1 - расстояние / длина);
+# ниже порога город ищется через API геокодирования
+FUZZY_MATCH_THRESHOLD = float(os.getenv('FUZZY_MATCH_THRESHOLD', '0.75'))
+# Наибольшее число опечаток (вставка, удаление, замена, перестановка соседних букв)
+FUZZY_MAX_DISTANCE = int(os.getenv('FUZZY_MAX_DISTANCE', '2'))
+# Короткие названия совпадают только точно: одна правка превращает
+# один реальный город в другой (Омск — Томск, Рига — Нига)
+FUZZY_MIN_LENGTH = int(os.getenv('FUZZY_MIN_LENGTH', '6'))
+# Вес популярности (количества поисков) при выборе среди похожих названий
+FUZZY_POPULARITY_WEIGHT = 0.1
+# Сколько альтернативных названий города (GeoNames) учитывать
+CITY_INDEX_MAX_ALTERNATES = int(os.getenv('CITY_INDEX_MAX_ALTERNATES', '32'))
+
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p',
+    'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+
+def normalize_name(name: str) -> str:
+    """Приведение названия к виду для сравнения"""
+    return name.strip().lower().replace('ё', 'е')
+
+
+def trigrams(name: str) -> Set[str]:
+    """Множество триграмм нормализованного названия (с отступами по краям)"""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def match_key(name: str) -> str:
+    """Название для нечёткого сравнения: без пробелов, дефисов и знаков препинания"""
+    return ''.join(ch for ch in normalize_name(name) if ch.isalnum())
+
+
+def transliterate(name: str) -> str:
+    """Латинская запись русского названия (Москва — moskva)"""
+    return name.translate(_TRANSLIT)
+
+
+def _latin_or_cyrillic(name: str) -> bool:
+    return all(ch < '\u0250' or '\u0400' <= ch < '\u0500' for ch in name)
+
+
+def name_variants(db_city: CityDB) -> List[str]:
+    """Ключи сравнения города: название, его транслитерация и альтернативные названия"""
+    names = [db_city.name or '']
+    # Названия на других алфавитах пользователи не вводят
+    names.extend([name for name in (db_city.alternate_names or '').split(',')
+                  if _latin_or_cyrillic(name)][:CITY_INDEX_MAX_ALTERNATES])
+    variants = []
+    for name in names:
+        key = match_key(name)
+        for variant in (key, transliterate(key)):
+            if variant and variant not in variants:
+                variants.append(variant)
+    return variants
+
+
+def bounded_distance(a: str, b: str, max_distance: int) -> int:
+    """Расстояние Дамерау — Левенштейна; если оно больше max_distance — max_distance + 1"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous: List[int] = []
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            value = min(row[j] + 1, current[j - 1] + 1, row[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous[j - 2] + 1)
+            current[j] = value
+        # Расстояние не меньше минимума строки: дальше считать бессмысленно
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous, row = row, current
+    return min(row[-1], max_distance + 1)
+
+
+def city_from_db(db_city: CityDB) -> City:
+    return City(id=db_city.city_id,
+                name=db_city.name,
+                latitude=db_city.latitude,
+                longitude=db_city.longitude,
+                country=db_city.country,
+                admin1=db_city.admin1)
+
+
+class CityIndex:
+    """Индекс городов в памяти для автодополнения по префиксу и триграммам"""
+
+    def __init__(self):
+        self._cities: Dict[int, City] = {}
+        self._names: Dict[int, str] = {}
+        # Отсортированный список (название, ключ) для поиска по префиксу
+        self._sorted: List[Tuple[str, int]] = []
+        self._trigrams: Dict[str, Set[int]] = defaultdict(set)
+        # Ключи нечёткого сравнения города и триграммы по ним
+        self._variants: Dict[int, List[str]] = {}
+        self._variant_trigrams: Dict[str, Set[int]] = defaultdict(set)
+        self._popularity: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.fuzzy_hits = 0
+        self.fuzzy_misses = 0
+
+    def __len__(self) -> int:
+        return len(self._cities)
+
+    @staticmethod
+    def _key(db_city: CityDB) -> int:
+        # Города без id из API различаем по первичному ключу таблицы
+        return db_city.city_id if db_city.city_id is not None else -db_city.id
+
+    def clear(self):
+        self._cities.clear()
+        self._names.clear()
+        self._sorted.clear()
+        self._trigrams.clear()
+        self._variants.clear()
+        self._variant_trigrams.clear()
+        self._popularity.clear()
+
+    def add(self, db_city: CityDB):
+        """Добавление или обновление города в индексе"""
+        key = self._key(db_city)
+        name = normalize_name(db_city.name or '')
+        if not name:
+            return
+
+        if key in self._names:
+            self._remove(key)
+
+        self._cities[key] = city_from_db(db_city)
+        self._names[key] = name
+        insort(self._sorted, (name, key))
+        for gram in trigrams(name):
+            self._trigrams[gram].add(key)
+        self._variants[key] = name_variants(db_city)
+        for variant in self._variants[key]:
+            for gram in trigrams(variant):
+                self._variant_trigrams[gram].add(key)
+
+    def _remove(self, key: int):
+        name = self._names.pop(key)
+        del self._cities[key]
+        pos = bisect_left(self._sorted, (name, key))
+        if pos < len(self._sorted) and self._sorted[pos] == (name, key):
+            del self._sorted[pos]
+        for gram in trigrams(name):
+            self._trigrams[gram].discard(key)
+        for variant in self._variants.pop(key, ()):
+            for gram in trigrams(variant):
+                self._variant_trigrams[gram].discard(key)
+
+    def set_popularity(self, counts: Iterable[Tuple[str, int]]):
+        """Загрузка количества поисков по названиям городов"""
+        self._popularity = {normalize_name(name): count
+                            for name, count in counts if name}
+
+    def bump(self, city_name: str, count: int = 1):
+        """Учёт нового поиска города"""
+        name = normalize_name(city_name)
+        self._popularity[name] = self._popularity.get(name, 0) + count
+
+    def popularity(self, city_name: str) -> int:
+        return self._popularity.get(normalize_name(city_name), 0)
+
+    def _prefix(self, query: str) -> List[int]:
+        start = bisect_left(self._sorted, (query, -float('inf')))
+        keys = []
+        for name, key in self._sorted[start:]:
+            if not name.startswith(query):
+                break
+            keys.append(key)
+        return keys
+
+    def _similar(self, query: str) -> List[Tuple[float, int]]:
+        query_grams = trigrams(query)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for key in self._trigrams.get(gram, ()):
+                shared[key] += 1
+
+        scored = []
+        for key, common in shared.items():
+            total = len(query_grams) + len(trigrams(self._names[key])) - common
+            score = common / total
+            if score >= TRIGRAM_THRESHOLD:
+                scored.append((score, key))
+        return scored
+
+    def search(self, query: str, limit: int = 5) -> List[City]:
+        """Подсказки: сначала совпадения по префиксу, затем похожие по триграммам"""
+        query = normalize_name(query)
+        if not query:
+            return []
+
+        def rank(key: int):
+            name = self._names[key]
+            return (-self._popularity.get(name, 0), len(name), name)
+
+        keys = sorted(self._prefix(query), key=rank)[:limit]
+
+        if len(keys) < limit:
+            seen = set(keys)
+            similar = sorted(
+                ((score, key) for score, key in self._similar(query)
+                 if key not in seen),
+                key=lambda item: (-item[0],) + rank(item[1])
+            )
+            keys.extend(key for _, key in similar[:limit - len(keys)])
+
+        if keys:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return [self._cities[key] for key in keys]
+
+    def match(
+            self,
+            query: str,
+            threshold: float = FUZZY_MATCH_THRESHOLD,
+            max_distance: Optional[int] = None
+        ) -> Optional[City]:
+        """Город, название которого совпадает с запросом с точностью до опечаток.
+
+        Среди похожих названий выбирается самое близкое с учётом популярности;
+        если сходство ниже threshold, возвращается None. При max_distance=0
+        учитываются только точные совпадения транслитерации и альтернативных названий.
+        """
+        query = match_key(query)
+        if len(query) < FUZZY_MIN_LENGTH:
+            max_distance = 0
+        elif max_distance is None:
+            max_distance = min(FUZZY_MAX_DISTANCE, int(len(query) * (1 - threshold)))
+        query_grams = trigrams(query)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for key in self._variant_trigrams.get(gram, ()):
+                shared[key] += 1
+
+        # Каждая опечатка меняет не больше четырёх триграмм
+        min_common = max(len(query_grams) - 4 * max_distance, 1)
+        max_popularity = max(self._popularity.values(), default=0)
+        best: Optional[Tuple[float, int]] = None
+        for key, common in shared.items():
+            if common < min_common:
+                continue
+            similarity = 0.0
+            for variant in self._variants[key]:
+                distance = bounded_distance(query, variant, max_distance)
+                if distance <= max_distance:
+                    similarity = max(similarity,
+                                     1 - distance / max(len(query), len(variant)))
+            if similarity < threshold:
+                continue
+            popularity = self._popularity.get(self._names[key], 0)
+            score = similarity + FUZZY_POPULARITY_WEIGHT * (
+                math.log1p(popularity) / math.log1p(max_popularity) if max_popularity else 0)
+            if best is None or score > best[0]:
+                best = (score, key)
+
+        if best is None:
+            self.fuzzy_misses += 1
+            return None
+        self.fuzzy_hits += 1
+        return self._cities[best[1]]
+
+    async def load(self, session: AsyncSession, stats: Iterable[Tuple[str, int]] = ()):
+        """Построение индекса по таблице городов"""
+        result = await session.execute(select(CityDB))
+        self.clear()
+        for db_city in result.scalars():
+            self.add(db_city)
+        self.set_popularity(stats)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._cities),
+                "hits": self.hits,
+                "misses": self.misses,
+                "fuzzy_hits": self.fuzzy_hits,
+                "fuzzy_misses": self.fuzzy_misses}
+
+
+# Индекс городов процесса
+city_index = CityIndex()
+registry.register_stats('weather_city_index', city_index.stats)
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.db.base import DB, db
+from app.log_conf import logging
+from app.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+
+HISTORY_QUEUE_SIZE = int(os.getenv('HISTORY_QUEUE_SIZE', '10000'))
+HISTORY_BATCH_SIZE = int(os.getenv('HISTORY_BATCH_SIZE', '500'))
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', '1.0'))
+HISTORY_DRAIN_TIMEOUT = float(os.getenv('HISTORY_DRAIN_TIMEOUT', '10'))
+
+# Запись истории: (user_id, city_name, timestamp)
+HistoryEntry = Tuple[str, str, int]
+
+# Маркер остановки в очереди
+_STOP = None
+
+
+class HistoryWriter:
+    """Фоновая пакетная запись истории поиска вне пути обработки запроса"""
+
+    def __init__(
+            self,
+            database: DB,
+            max_queue: int = HISTORY_QUEUE_SIZE,
+            batch_size: int = HISTORY_BATCH_SIZE,
+            flush_interval: float = HISTORY_FLUSH_INTERVAL
+        ):
+        self.db = database
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.enqueued = 0
+        self.blocked = 0
+        self.flushed_rows = 0
+        self.flushed_batches = 0
+        self.failed_rows = 0
+        self.max_depth = 0
+        self.last_flush_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Запуск фоновой задачи записи"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = HISTORY_DRAIN_TIMEOUT):
+        """Остановка с записью всех накопленных в очереди строк"""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                f"История поиска не записана до остановки: {self._queue.qsize()} строк"
+            )
+        self._task = None
+
+    async def submit(self, user_id: str, city_name: str):
+        """Постановка записи истории в очередь"""
+        entry = (user_id, city_name, int(time.time()))
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            # Очередь заполнена: запрос ждёт освобождения места (backpressure)
+            self.blocked += 1
+            await self._queue.put(entry)
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            entry = await self._queue.get()
+            if entry is _STOP:
+                break
+
+            batch: List[HistoryEntry] = [entry]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[HistoryEntry]):
+        started = time.perf_counter()
+        try:
+            async with self.db.Session() as session:
+                await self.db.add_search_histories(batch, session)
+        except Exception as e:
+            self.failed_rows += len(batch)
+            logger.error(f"Ошибка при записи истории поиска ({len(batch)} строк): {e}")
+        else:
+            self.flushed_rows += len(batch)
+            self.flushed_batches += 1
+        self.last_flush_seconds = time.perf_counter() - started
+
+    def stats(self) -> Dict[str, float]:
+        """Метрики очереди и записи"""
+        return {"queue_depth": self._queue.qsize() if self._queue else 0,
+                "queue_max_depth": self.max_depth,
+                "queue_capacity": self.max_queue,
+                "enqueued": self.enqueued,
+                "blocked": self.blocked,
+                "flushed_rows": self.flushed_rows,
+                "flushed_batches": self.flushed_batches,
+                "failed_rows": self.failed_rows,
+                "last_flush_seconds": self.last_flush_seconds}
+
+
+# Фоновая запись истории поиска
+history_writer = HistoryWriter(db)
+registry.register_stats('weather_history_writer', history_writer.stats)
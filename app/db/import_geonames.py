@@ -0,0 +1,263 @@
+"""Загрузка городов из выгрузки GeoNames (cities500.txt, cities15000.txt и т.п.)
+
+Пример:
+    python -m app.db.import_geonames cities15000.txt \\
+        --countries countryInfo.txt --admin1 admin1CodesASCII.txt \\
+        --alternate-names alternateNamesV2.txt --rebuild-indexes
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from app.db.base import DB, db
+from app.db.models import CityDB
+from app.log_conf import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# 7 параметров на строку: 2000 строк укладываются в лимит 32767 параметров asyncpg
+IMPORT_CHUNK_SIZE = int(os.getenv('GEONAMES_CHUNK_SIZE', '2000'))
+# Язык названий, как у запросов к API геокодирования
+IMPORT_LANGUAGE = os.getenv('GEONAMES_LANGUAGE', 'ru')
+
+# Индексы, которые дешевле построить заново, чем обновлять при массовой загрузке
+SEARCH_INDEXES = ('ix_cities_name_lower', 'ix_cities_name_trgm')
+
+
+def parse_city_line(line: str) -> Optional[dict]:
+    """Разбор строки cities*.txt; None для строк, не являющихся населёнными пунктами"""
+    fields = line.rstrip('\n').split('\t')
+    if len(fields) < 15 or fields[6] != 'P':
+        return None
+    return {"id": int(fields[0]),
+            "name": fields[1],
+            "latitude": float(fields[4]),
+            "longitude": float(fields[5]),
+            "country": fields[8],
+            "admin1": f"{fields[8]}.{fields[10]}" if fields[10] else None,
+            "alternate_names": fields[3] or None,
+            "population": int(fields[14] or 0)}
+
+
+def read_countries(path: str) -> Dict[str, Tuple[str, Optional[int]]]:
+    """Код страны -> (название, geonameid) из countryInfo.txt"""
+    countries = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 17:
+                continue
+            countries[fields[0]] = (fields[4], int(fields[16]) if fields[16] else None)
+    return countries
+
+
+def read_admin1(path: str) -> Dict[str, Tuple[str, Optional[int]]]:
+    """Код региона (RU.48) -> (название, geonameid) из admin1CodesASCII.txt"""
+    regions = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 4:
+                continue
+            regions[fields[0]] = (fields[1], int(fields[3]) if fields[3] else None)
+    return regions
+
+
+def read_localized_names(path: str, language: str, ids: Set[int]) -> Dict[int, str]:
+    """Названия на языке language для указанных geonameid из alternateNamesV2.txt"""
+    names: Dict[int, Tuple[bool, str]] = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 4 or fields[2] != language:
+                continue
+            geoname_id = int(fields[1])
+            if geoname_id not in ids:
+                continue
+            # Исторические и разговорные варианты не используются
+            if len(fields) > 7 and (fields[6] == '1' or fields[7] == '1'):
+                continue
+            preferred = len(fields) > 4 and fields[4] == '1'
+            if geoname_id not in names or (preferred and not names[geoname_id][0]):
+                names[geoname_id] = (preferred, fields[3])
+    return {geoname_id: name for geoname_id, (_, name) in names.items()}
+
+
+def iter_cities(path: str, min_population: int = 0,
+                start_line: int = 0) -> Iterator[Tuple[int, dict]]:
+    """Построчное чтение выгрузки: (номер строки, город) начиная после start_line"""
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if line_no <= start_line:
+                continue
+            city = parse_city_line(line)
+            if city is not None and city["population"] >= min_population:
+                yield line_no, city
+
+
+class GeoNamesImporter:
+    """Пакетная идемпотентная загрузка городов с сохранением прогресса"""
+
+    def __init__(
+            self,
+            database: DB,
+            countries: Optional[Dict[str, Tuple[str, Optional[int]]]] = None,
+            regions: Optional[Dict[str, Tuple[str, Optional[int]]]] = None,
+            localized: Optional[Dict[int, str]] = None,
+            chunk_size: int = IMPORT_CHUNK_SIZE,
+            state_file: Optional[str] = None
+        ):
+        self.db = database
+        self.countries = countries or {}
+        self.regions = regions or {}
+        self.localized = localized or {}
+        self.chunk_size = chunk_size
+        self.state_file = state_file
+        self.imported = 0
+
+    def _name(self, names: Dict[str, Tuple[str, Optional[int]]],
+              code: Optional[str]) -> Optional[str]:
+        if code is None or code not in names:
+            return code
+        name, geoname_id = names[code]
+        return self.localized.get(geoname_id, name)
+
+    def to_row(self, city: dict) -> dict:
+        """Город GeoNames в формате ответа API геокодирования"""
+        return {"id": city["id"],
+                "name": self.localized.get(city["id"], city["name"]),
+                "latitude": city["latitude"],
+                "longitude": city["longitude"],
+                "country": self._name(self.countries, city["country"]),
+                "admin1": self._name(self.regions, city["admin1"]),
+                "alternate_names": city["alternate_names"]}
+
+    def load_state(self, source: str) -> int:
+        """Номер последней записанной строки предыдущего запуска"""
+        if not self.state_file or not os.path.exists(self.state_file):
+            return 0
+        with open(self.state_file, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get("source") != os.path.abspath(source):
+            return 0
+        return state.get("line", 0)
+
+    def save_state(self, source: str, line_no: int):
+        if not self.state_file:
+            return
+        # Запись через временный файл: прерванный запуск не портит состояние
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"source": os.path.abspath(source), "line": line_no}, f)
+        os.replace(tmp_path, self.state_file)
+
+    async def _write_chunk(self, rows: List[dict], source: str, line_no: int):
+        async with self.db.Session() as session:
+            await self.db.save_cities(rows, session, update_index=False)
+        self.imported += len(rows)
+        self.save_state(source, line_no)
+
+    async def run(self, source: str, min_population: int = 0):
+        """Загрузка файла; повторный запуск продолжает с последнего записанного пакета"""
+        start_line = self.load_state(source)
+        if start_line:
+            logger.info(f"Продолжение загрузки {source} со строки {start_line + 1}")
+
+        rows: List[dict] = []
+        line_no = start_line
+        for line_no, city in iter_cities(source, min_population, start_line):
+            rows.append(self.to_row(city))
+            if len(rows) >= self.chunk_size:
+                await self._write_chunk(rows, source, line_no)
+                rows = []
+        if rows:
+            await self._write_chunk(rows, source, line_no)
+
+    async def drop_search_indexes(self):
+        if self.db.engine.dialect.name != 'postgresql':
+            return
+        async with self.db.engine.begin() as conn:
+            for name in SEARCH_INDEXES:
+                await conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+
+    async def create_search_indexes(self):
+        if self.db.engine.dialect.name != 'postgresql':
+            return
+        indexes = [index for index in CityDB.__table__.indexes
+                   if index.name in SEARCH_INDEXES]
+        async with self.db.engine.begin() as conn:
+            for index in indexes:
+                await conn.run_sync(
+                    lambda sync_conn, index=index: index.create(sync_conn, checkfirst=True)
+                )
+
+    async def analyze(self):
+        """Обновление статистики планировщика после массовой загрузки"""
+        async with self.db.engine.begin() as conn:
+            await conn.execute(text('ANALYZE cities'))
+
+
+def collect_ids(path: str, min_population: int,
+                countries: Dict[str, Tuple[str, Optional[int]]],
+                regions: Dict[str, Tuple[str, Optional[int]]]) -> Set[int]:
+    """geonameid городов, регионов и стран, для которых нужны локализованные названия"""
+    ids = set()
+    for _, city in iter_cities(path, min_population):
+        ids.add(city["id"])
+        for names, code in ((countries, city["country"]), (regions, city["admin1"])):
+            if code in names and names[code][1] is not None:
+                ids.add(names[code][1])
+    return ids
+
+
+async def main(args: argparse.Namespace):
+    countries = read_countries(args.countries) if args.countries else {}
+    regions = read_admin1(args.admin1) if args.admin1 else {}
+    localized = {}
+    if args.alternate_names:
+        ids = collect_ids(args.cities, args.min_population, countries, regions)
+        localized = read_localized_names(args.alternate_names, args.language, ids)
+
+    importer = GeoNamesImporter(db, countries, regions, localized,
+                                chunk_size=args.chunk_size,
+                                state_file=args.state_file or f"{args.cities}.import-state")
+    started = time.perf_counter()
+    if args.rebuild_indexes:
+        await importer.drop_search_indexes()
+    try:
+        await importer.run(args.cities, args.min_population)
+    finally:
+        if args.rebuild_indexes:
+            await importer.create_search_indexes()
+    await importer.analyze()
+    await db.engine.dispose()
+    logger.info(f"Загружено городов: {importer.imported} "
+                f"за {time.perf_counter() - started:.1f} с")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Загрузка городов из выгрузки GeoNames")
+    parser.add_argument('cities', help="файл cities*.txt")
+    parser.add_argument('--countries', help="countryInfo.txt для названий стран")
+    parser.add_argument('--admin1', help="admin1CodesASCII.txt для названий регионов")
+    parser.add_argument('--alternate-names', help="alternateNamesV2.txt для локализованных названий")
+    parser.add_argument('--language', default=IMPORT_LANGUAGE)
+    parser.add_argument('--min-population', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument('--state-file', help="файл прогресса (по умолчанию <cities>.import-state)")
+    parser.add_argument('--rebuild-indexes', action='store_true',
+                        help="удалить индексы поиска до загрузки и построить после (PostgreSQL)")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
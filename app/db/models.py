@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Integer, String, Float, Index, func
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -14,12 +14,60 @@ class CityDB(Base):
     longitude = Column(Float)
     country = Column(String, nullable=True)
     admin1 = Column(String, nullable=True)
+    alternate_names = Column(String, nullable=True)  # Альтернативные названия через запятую (GeoNames)
+
+    __table_args__ = (
+        # Поиск по точному названию и префиксу без учёта регистра
+        Index('ix_cities_name_lower',
+              func.lower(name).label('name_lower'),
+              postgresql_ops={'name_lower': 'text_pattern_ops'}),
+        # Нечёткий поиск по триграммам (расширение pg_trgm)
+        Index('ix_cities_name_trgm',
+              func.lower(name).label('name_lower'),
+              postgresql_using='gin',
+              postgresql_ops={'name_lower': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
 
 class SearchHistoryDB(Base):
     """Модель истории поиска"""
     __tablename__ = 'search_history'
+    # В PostgreSQL таблица секционирована по timestamp (миграция f6c3d9a1b2e4),
+    # первичный ключ там (id, timestamp)
     
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String)
     city_name = Column(String)
-    timestamp = Column(Integer) 
\ No newline at end of file
+    timestamp = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        # История пользователя: последние поиски без обращения к таблице
+        Index('ix_search_history_user_id_timestamp',
+              user_id, timestamp.desc(),
+              postgresql_include=['city_name']),
+        # Поиск недавно активных пользователей при ограничении размера истории
+        Index('ix_search_history_timestamp_brin',
+              timestamp,
+              postgresql_using='brin').ddl_if(dialect='postgresql'),
+    )
+
+
+class CitySearchCountDB(Base):
+    """Модель счётчика поисков города"""
+    __tablename__ = 'city_search_counts'
+
+    city_name = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_city_search_counts_count', count.desc()),
+    )
+
+
+class CitySearchHourlyDB(Base):
+    """Модель почасового счётчика поисков города"""
+    __tablename__ = 'city_search_hourly'
+
+    # Первичный ключ (hour, city_name): окно по времени читается диапазоном ключа
+    hour = Column(Integer, primary_key=True)  # Начало часа (unix time)
+    city_name = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.db.base import DB, STATS_WINDOWS, db
+from app.log_conf import logging
+from app.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+
+# Срок хранения истории поиска (дней); 0 — хранить без ограничения
+HISTORY_RETENTION_DAYS = float(os.getenv('HISTORY_RETENTION_DAYS', '90'))
+# Максимум записей истории на пользователя; 0 — без ограничения
+HISTORY_USER_CAP = int(os.getenv('HISTORY_USER_CAP', '500'))
+HISTORY_PURGE_INTERVAL = float(os.getenv('HISTORY_PURGE_INTERVAL', '3600'))
+# Секции search_history в PostgreSQL: ширина (дней) и сколько создавать заранее
+HISTORY_PARTITION_DAYS = int(os.getenv('HISTORY_PARTITION_DAYS', '7'))
+HISTORY_PARTITIONS_AHEAD = int(os.getenv('HISTORY_PARTITIONS_AHEAD', '4'))
+# Почасовая статистика хранится не меньше самого длинного окна запроса
+STATS_HOURLY_RETENTION = max(STATS_WINDOWS.values()) + 86400
+# Перекрытие проходов: записи из очереди history_writer попадают в БД с задержкой
+ACTIVE_USERS_OVERLAP = 300
+# Пользователей в одном запросе ограничения истории (лимит параметров asyncpg)
+USERS_PER_STATEMENT = 1000
+
+_PARTITION_BOUND = re.compile(r"FROM \('?(-?\d+)'?\) TO \('?(-?\d+)'?\)")
+
+PARTITIONS_QUERY = text("""
+    SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = 'search_history'
+""")
+
+
+def parse_partition_bound(bound: str) -> Optional[Tuple[int, int]]:
+    """Границы секции из выражения FOR VALUES FROM (...) TO (...)"""
+    match = _PARTITION_BOUND.search(bound or '')
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+class HistoryRetention:
+    """Фоновое удаление старой истории поиска и ограничение её размера на пользователя"""
+
+    def __init__(
+            self,
+            database: DB,
+            retention_days: float = HISTORY_RETENTION_DAYS,
+            user_cap: int = HISTORY_USER_CAP,
+            interval: float = HISTORY_PURGE_INTERVAL,
+            partition_days: int = HISTORY_PARTITION_DAYS,
+            partitions_ahead: int = HISTORY_PARTITIONS_AHEAD
+        ):
+        self.db = database
+        self.retention = retention_days * 86400
+        self.user_cap = user_cap
+        self.interval = interval
+        self.partition_width = partition_days * 86400
+        self.partitions_ahead = partitions_ahead
+        self._task: Optional[asyncio.Task] = None
+        # Пользователи, записи которых появились после этого момента, проверяются на лимит
+        self._last_run: Optional[int] = None
+
+        self.runs = 0
+        self.dropped_partitions = 0
+        self.created_partitions = 0
+        self.purged_rows = 0
+        self.capped_rows = 0
+        self.purged_buckets = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Запуск фоновой задачи очистки"""
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка очистки истории поиска: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _partitions(self) -> List[Tuple[str, int, int]]:
+        """Секции search_history с границами (пусто, если таблица не секционирована)"""
+        if self.db.engine.dialect.name != 'postgresql':
+            return []
+        async with self.db.engine.connect() as conn:
+            rows = (await conn.execute(PARTITIONS_QUERY)).all()
+        partitions = []
+        for name, bound in rows:
+            bounds = parse_partition_bound(bound)
+            if bounds is not None:
+                partitions.append((name, *bounds))
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    async def maintain_partitions(self, now: int, cutoff: Optional[int]):
+        """Удаление секций старше срока хранения и создание секций на будущее"""
+        partitions = await self._partitions()
+        if not partitions:
+            return
+
+        async with self.db.engine.begin() as conn:
+            if cutoff is not None:
+                for name, _, upper in partitions:
+                    if upper <= cutoff:
+                        # Удаление секции вместо DELETE: без мёртвых строк и VACUUM
+                        await conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                        self.dropped_partitions += 1
+
+            lower = max(upper for _, _, upper in partitions)
+            horizon = now + self.partitions_ahead * self.partition_width
+            while lower < horizon:
+                upper = (lower // self.partition_width + 1) * self.partition_width
+                await conn.execute(text(
+                    f'CREATE TABLE IF NOT EXISTS search_history_p{lower} '
+                    f'PARTITION OF search_history FOR VALUES FROM ({lower}) TO ({upper})'
+                ))
+                self.created_partitions += 1
+                lower = upper
+
+    async def run_once(self, now: Optional[int] = None):
+        """Один проход очистки"""
+        self.runs += 1
+        if now is None:
+            now = int(time.time())
+        cutoff = now - int(self.retention) if self.retention > 0 else None
+
+        await self.maintain_partitions(now, cutoff)
+
+        async with self.db.Session() as session:
+            if cutoff is not None:
+                # Остаток в секции на границе срока, в секции по умолчанию
+                # или во всей таблице, если она не секционирована
+                self.purged_rows += await self.db.purge_search_history(session, cutoff)
+
+            if self.user_cap > 0:
+                # Лимит проверяется только у пользователей, искавших с прошлого прохода
+                # (при первом проходе — за последний интервал)
+                last_run = self._last_run if self._last_run is not None else now - self.interval
+                since = int(last_run) - ACTIVE_USERS_OVERLAP
+                users = await self.db.active_users_since(session, since)
+                for i in range(0, len(users), USERS_PER_STATEMENT):
+                    self.capped_rows += await self.db.cap_user_history(
+                        session, users[i:i + USERS_PER_STATEMENT], self.user_cap
+                    )
+
+            self.purged_buckets += await self.db.purge_city_search_hourly(
+                session, now - STATS_HOURLY_RETENTION
+            )
+        self._last_run = now
+
+    def stats(self) -> Dict[str, int]:
+        return {"runs": self.runs,
+                "dropped_partitions": self.dropped_partitions,
+                "created_partitions": self.created_partitions,
+                "purged_rows": self.purged_rows,
+                "capped_rows": self.capped_rows,
+                "purged_buckets": self.purged_buckets}
+
+
+# Фоновая очистка истории поиска
+history_retention = HistoryRetention(db)
+registry.register_stats('weather_history_retention', history_retention.stats)
@@ -1,10 +1,125 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+from typing import Dict, List
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(filename)s:%(lineno)d - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("app/app.log", encoding='utf-8')
-    ]
-)
\ No newline at end of file
+from app.metrics import registry
+
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# text или json (одна JSON-строка на запись)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+# Пустое значение отключает запись в файл
+LOG_FILE = os.getenv('LOG_FILE', 'app/app.log')
+# Уровни отдельных логгеров: "app.api.services=DEBUG,httpx=WARNING"
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Логирование SQL-запросов (переключается во время работы сигналом SIGUSR1)
+SQL_ECHO = os.getenv('SQL_ECHO', '0').lower() in ('1', 'true', 'yes')
+
+TEXT_FORMAT = '%(asctime)s - %(filename)s:%(lineno)d - %(levelname)s - %(message)s'
+SQL_LOGGER = 'sqlalchemy.engine'
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной JSON-строкой"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"time": self.formatTime(record),
+                 "level": record.levelname,
+                 "logger": record.name,
+                 "location": f"{record.filename}:{record.lineno}",
+                 "message": record.getMessage()}
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Постановка записей в очередь без ожидания: при переполнении запись отбрасывается"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Трассировка остаётся отдельным полем (exc_text), а не частью сообщения
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"queue_depth": self.queue.qsize(),
+                "dropped": self.dropped}
+
+
+def parse_levels(value: str) -> Dict[str, int]:
+    """Уровни логгеров из строки вида "имя=УРОВЕНЬ,..." """
+    levels = {}
+    for item in value.split(','):
+        name, _, level = item.strip().partition('=')
+        if name and level:
+            levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return {name: level for name, level in levels.items() if isinstance(level, int)}
+
+
+def set_sql_echo(enabled: bool):
+    """Включение логирования SQL-запросов (действует для новых соединений)"""
+    logging.getLogger(SQL_LOGGER).setLevel(logging.INFO if enabled else logging.WARNING)
+
+
+def sql_echo_enabled() -> bool:
+    return logging.getLogger(SQL_LOGGER).isEnabledFor(logging.INFO)
+
+
+def build_handlers() -> List[logging.Handler]:
+    formatter = JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.FileHandler(LOG_FILE, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Вывод логов в отдельном потоке: обработчик запроса только ставит запись в очередь"""
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    set_sql_echo(SQL_ECHO)
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *build_handlers(),
+                                              respect_handler_level=True)
+    listener.start()
+    # Оставшиеся в очереди записи выводятся при завершении процесса
+    atexit.register(listener.stop)
+    registry.register_stats('weather_logging', queue_handler.stats)
+    return listener
+
+
+log_listener = setup_logging()
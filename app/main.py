@@ -1,13 +1,132 @@
+import asyncio
+import os
+import signal
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict
+
 from fastapi import FastAPI, Request, Depends
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api import http_cache
+from app.api.broadcast import forecast_broadcaster
+from app.api.cache import forecast_cache, geocoding_cache
 from app.api.endpoints import router as weather_router
-from app.db.base import db
+from app.api.prefetch import forecast_prefetcher
+from app.api.upstream import upstream
+from app.compression import CompressionMiddleware
+from app.db.base import DB_POOL_SIZE, db
+from app.db.history_writer import history_writer
+from app.db.retention import history_retention
+from app.log_conf import logging, set_sql_echo, sql_echo_enabled
+from app.metrics import MetricsMiddleware, registry
+
+
+logger = logging.getLogger(__name__)
+
+# Прогрев воркера перед приёмом запросов: соединения с БД и шаблоны
+STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', '1').lower() in ('1', 'true', 'yes')
+# Сколько соединений пула открыть заранее (по умолчанию весь постоянный пул)
+DB_WARMUP_CONNECTIONS = int(os.getenv('DB_WARMUP_CONNECTIONS', str(DB_POOL_SIZE)))
+
+# Длительность этапов запуска (сек)
+startup_timings: Dict[str, float] = {}
+registry.register_stats('weather_startup_seconds', lambda: dict(startup_timings))
+
+
+@contextmanager
+def startup_phase(name: str):
+    """Замер и логирование длительности этапа запуска"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - started
+        logger.info(f"Запуск: {name} за {startup_timings[name] * 1000:.1f} мс")
+
+
+def compile_templates() -> int:
+    """Компиляция всех шаблонов Jinja в кэш окружения"""
+    names = templates.env.list_templates()
+    for name in names:
+        templates.env.get_template(name)
+    return len(names)
+
+
+async def warm_up():
+    """Открытие соединений с БД и компиляция шаблонов до приёма запросов"""
+    with startup_phase('db_connections'):
+        try:
+            await db.warm_up(DB_WARMUP_CONNECTIONS)
+        except Exception as e:
+            logger.error(f"Не удалось открыть соединения с БД: {e}")
+    with startup_phase('templates'):
+        compile_templates()
 
-app = FastAPI(title="Погодный сервис")
+
+def toggle_sql_echo():
+    """Переключение логирования SQL-запросов без перезапуска (kill -USR1 <pid>)"""
+    set_sql_echo(not sql_echo_enabled())
+    logger.warning(f"Логирование SQL {'включено' if sql_echo_enabled() else 'выключено'}")
+
+
+def _add_signal_handler(sig, handler) -> bool:
+    try:
+        asyncio.get_running_loop().add_signal_handler(sig, handler)
+    except (NotImplementedError, RuntimeError, ValueError):
+        # Windows или цикл событий не в главном потоке
+        return False
+    return True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Инициализация и освобождение общих ресурсов приложения"""
+    started = time.perf_counter()
+    with startup_phase('engine'):
+        db.connect()
+    await upstream.start()
+    if STARTUP_WARMUP:
+        await warm_up()
+    with startup_phase('city_index'):
+        try:
+            async with db.Session() as session:
+                await db.load_city_index(session)
+        except Exception as e:
+            # Без индекса подсказки работают через БД и API геокодирования
+            logger.error(f"Не удалось построить индекс городов: {e}")
+    await history_writer.start()
+    await forecast_prefetcher.start()
+    await history_retention.start()
+    startup_timings['total'] = time.perf_counter() - started
+    logger.info(f"Приложение запущено за {startup_timings['total'] * 1000:.1f} мс")
+    sql_echo_signal = hasattr(signal, 'SIGUSR1') and \
+        _add_signal_handler(signal.SIGUSR1, toggle_sql_echo)
+    try:
+        yield
+    finally:
+        if sql_echo_signal:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR1)
+        await forecast_broadcaster.stop()
+        await history_retention.stop()
+        await forecast_prefetcher.stop()
+        await history_writer.stop()
+        await upstream.close()
+        await forecast_cache.close()
+        await geocoding_cache.close()
+        await db.dispose()
+
+
+app = FastAPI(title="Погодный сервис", lifespan=lifespan)
+
+# Сжатие ответов больше порога COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
+# Замер времени обработки запросов по маршрутам
+app.add_middleware(MetricsMiddleware)
 
 # Подключение статических файлов
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -31,7 +150,19 @@ async def stats_page(
     """Страница статистики поиска городов"""
     stats = await db.get_city_stats(session)
 
+    headers = http_cache.stats_cache_headers(stats, "stats.html")
+    not_modified = http_cache.not_modified(request, headers)
+    if not_modified is not None:
+        return not_modified
+
     return templates.TemplateResponse(
         "stats.html", 
-        {"request": request, "stats": stats}
+        {"request": request, "stats": stats},
+        headers=headers
     )
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """Метрики приложения в текстовом формате Prometheus"""
+    return PlainTextResponse(registry.render(),
+                             media_type="text/plain; version=0.0.4")
@@ -0,0 +1,202 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+
+# Границы бакетов гистограмм задержек (сек)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонно растущий счётчик"""
+
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in self._values.items()]
+
+
+class Histogram:
+    """Гистограмма распределения значений по бакетам"""
+
+    type = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+        ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Для каждого набора меток: [счётчики бакетов (+Inf последним), сумма, количество]
+        self._values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def count(self, labels: Labels = ()) -> int:
+        state = self._values.get(labels)
+        return state[2] if state else 0
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f'{self.name}_bucket'
+                             f'{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {total!r}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """Набор метрик с выводом в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._stats: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+        ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def register_stats(self, prefix: str, stats: Callable[[], Dict[str, float]]):
+        """Регистрация счётчиков компонента, считываемых в момент запроса метрик"""
+        self._stats[prefix] = stats
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render())
+
+        for prefix, stats in self._stats.items():
+            for key, value in stats().items():
+                name = f'{prefix}_{key}'
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {_format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds',
+    'Время обработки HTTP-запроса',
+    ('method', 'route', 'status')
+)
+upstream_request_duration = registry.histogram(
+    'upstream_request_duration_seconds',
+    'Время запроса к внешнему API',
+    ('host',)
+)
+upstream_errors = registry.counter(
+    'upstream_errors_total',
+    'Ошибки запросов к внешнему API',
+    ('host', 'kind')
+)
+db_query_duration = registry.histogram(
+    'db_query_duration_seconds',
+    'Время выполнения SQL-запроса',
+    ('statement',)
+)
+db_query_errors = registry.counter(
+    'db_query_errors_total',
+    'Ошибки выполнения SQL-запросов',
+    ('statement',)
+)
+db_pool_checkout_wait = registry.histogram(
+    'db_pool_checkout_wait_seconds',
+    'Время ожидания соединения из пула БД'
+)
+
+
+class MetricsMiddleware:
+    """ASGI-middleware, измеряющее время обработки запросов по маршрутам"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = ['500']
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = str(message['status'])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Шаблон маршрута, а не фактический путь, чтобы не плодить метки
+            route = scope.get('route')
+            path = route.path if route is not None else scope.get('root_path') or 'unmatched'
+            http_request_duration.observe(time.perf_counter() - started,
+                                          (scope['method'], path, status[0]))
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Optional
 
 class City(BaseModel):
@@ -17,8 +17,14 @@ class WeatherForecast(BaseModel):
     city: City
     hourly: WeatherData
     hourly_units: Dict[str, str]
+    fetched_at: Optional[int] = None
+    stale: bool = False
     
 class SearchHistory(BaseModel):
     user_id: str
     city_name: str
-    timestamp: int 
\ No newline at end of file
+    timestamp: int
+
+class BatchForecastRequest(BaseModel):
+    cities: List[str] = Field(..., min_length=1, max_length=50)
+    forecast_days: int = Field(1, ge=1, le=16)
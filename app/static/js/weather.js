@@ -9,6 +9,10 @@ document.addEventListener('DOMContentLoaded', function() {
     const historyContainer = document.getElementById('history-container');
     const historyItems = document.getElementById('history-items');
     
+    // Подписка на обновления прогноза открытого города
+    let forecastStream = null;
+    let currentForecast = null;
+    
     // Получение истории поиска при загрузке страницы
     window.addEventListener('load', async () => {
         await loadHistory();
@@ -95,7 +99,9 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
             const data = await response.json();
+            currentForecast = data;
             displayWeather(data);
+            subscribeForecast(city);
             
             // Обновляем историю после успешного поиска
             await loadHistory();
@@ -105,12 +111,40 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Функция подписки на обновления прогноза (вместо повторных запросов)
+    function subscribeForecast(city) {
+        if (forecastStream) forecastStream.close();
+        if (!window.EventSource) return;
+        
+        forecastStream = new EventSource(`/api/weather/forecast/stream?city=${encodeURIComponent(city)}`);
+        forecastStream.addEventListener('forecast', event => {
+            currentForecast = JSON.parse(event.data);
+            displayWeather(currentForecast);
+        });
+        forecastStream.addEventListener('delta', event => {
+            if (!currentForecast) return;
+            const delta = JSON.parse(event.data);
+            const rows = new Map(currentForecast.forecast.map(row => [row.time, row]));
+            delta.removed.forEach(time => rows.delete(time));
+            delta.updated.forEach(row => rows.set(row.time, row));
+            currentForecast.forecast = Array.from(rows.values());
+            currentForecast.stale = delta.stale;
+            currentForecast.fetched_at = delta.fetched_at;
+            displayWeather(currentForecast);
+        });
+    }
+    
     // Функция для отображения погоды
     function displayWeather(data) {
         // Отображаем информацию о городе
         let cityText = data.city.name;
         if (data.city.admin1) cityText += `, ${data.city.admin1}`;
         if (data.city.country) cityText += `, ${data.city.country}`;
+        // Сервис погоды недоступен: показан последний полученный прогноз
+        if (data.stale && data.fetched_at) {
+            const fetchedAt = new Date(data.fetched_at * 1000);
+            cityText += ` (данные от ${fetchedAt.toLocaleTimeString([], {hour: '2-digit', minute: '2-digit'})})`;
+        }
         cityInfo.textContent = cityText;
         
         // Отображаем прогноз погоды
@@ -1,7 +1,16 @@
 import pytest
 import asyncio
+import os
 from unittest.mock import AsyncMock, patch
 
+# Тесты не пишут лог в файл (LOG_FILE читается при импорте app.log_conf)
+os.environ.setdefault('LOG_FILE', '')
+
+from app.api.cache import forecast_cache, geocoding_cache
+from app.api.limits import user_rate_limiter
+from app.api.upstream import upstream
+from app.db.city_index import city_index
+
 # Настройка pytest-asyncio для тестирования асинхронных функций
 @pytest.fixture(scope="session")
 def event_loop():
@@ -10,6 +19,17 @@ def event_loop():
     yield loop
     loop.close()
 
+# Кэши процесса не должны переносить данные между тестами
+@pytest.fixture(autouse=True)
+def clear_caches(event_loop):
+    """Очистка кэшей приложения перед каждым тестом"""
+    event_loop.run_until_complete(forecast_cache.clear())
+    event_loop.run_until_complete(geocoding_cache.clear())
+    city_index.clear()
+    upstream.breakers.clear()
+    user_rate_limiter.clear()
+    yield
+
 # Мок для сессии базы данных
 @pytest.fixture
 async def db_session():
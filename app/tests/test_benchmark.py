@@ -0,0 +1,65 @@
+from fastapi.testclient import TestClient
+
+from app.api.services import _parse_forecast
+from app.models.weather import City
+from benchmarks.fake_open_meteo import city_names, create_app
+from benchmarks.run import Workload, compare, parse_mix, percentile, summarize
+
+
+def test_fake_upstream_matches_api_format():
+    """Тест совместимости ответов заглушки с разбором ответов API"""
+    client = TestClient(create_app(latency=0, jitter=0))
+    name = city_names()[0]
+
+    results = client.get("/v1/search", params={"name": name[:3], "count": 5}).json()
+    assert name in [city["name"] for city in results["results"]]
+
+    city = City(**results["results"][0])
+    data = client.get("/v1/forecast", params={"latitude": city.latitude,
+                                              "longitude": city.longitude,
+                                              "forecast_days": 2}).json()
+    forecast = _parse_forecast(data, city)
+    assert len(forecast.hourly.time) == 48
+
+    # Несколько координат: список ответов, как у настоящего API
+    data = client.get("/v1/forecast", params={"latitude": "55.7,59.9",
+                                              "longitude": "37.6,30.3"}).json()
+    assert isinstance(data, list) and len(data) == 2
+
+
+def test_fake_upstream_errors():
+    """Тест доли ошибок заглушки"""
+    client = TestClient(create_app(latency=0, jitter=0, error_rate=1.0))
+
+    assert client.get("/v1/search", params={"name": "Мо"}).status_code == 503
+
+
+def test_workload_zipf_popularity():
+    """Тест распределения популярности городов в нагрузке"""
+    cities = city_names(100)
+    workload = Workload(cities, parse_mix('forecast=1'), 1.1, users=10, seed=1)
+
+    requested = [workload.next_request()[2]["city"] for _ in range(2000)]
+
+    assert requested.count(cities[0]) > requested.count(cities[50]) * 10
+
+
+def test_summarize_percentiles():
+    """Тест расчёта перцентилей и сравнения запусков"""
+    latencies = [i / 1000 for i in range(1, 101)]
+    assert percentile(latencies, 50) == 0.05
+    assert percentile(latencies, 99) == 0.099
+
+    summary = summarize({"stats": latencies}, {"stats": {"200": 100}}, {}, elapsed=10)
+    assert summary["stats"]["rps"] == 10
+    assert summary["stats"]["p95_ms"] == 95
+
+    assert summary["stats"]["throttled"] == 0
+
+    throttled = summarize({}, {"history": {"429": 3}}, {}, elapsed=10)
+    assert throttled["history"]["requests"] == 0
+    assert throttled["history"]["throttled"] == 3
+
+    previous = {"commit": "abc", "endpoints": {"stats": dict(summary["stats"], rps=5)}}
+    report = compare({"endpoints": summary}, previous)
+    assert "rps 5 -> 10.0 (+100.0%)" in report[1]
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.broadcast import ForecastBroadcaster, forecast_delta
+from app.api.endpoints import stream_forecast
+from app.models.weather import City, WeatherData, WeatherForecast
+
+
+CITY = City(id=1, name='Москва', latitude=55.7558, longitude=37.6173)
+
+
+def make_forecast(temperatures, fetched_at=1) -> WeatherForecast:
+    start = int(time.time()) // 3600 * 3600 + 3600
+    return WeatherForecast(
+        city=CITY,
+        hourly=WeatherData(time=[start + 3600 * i for i in range(len(temperatures))],
+                           temperature_2m=temperatures),
+        hourly_units={'temperature_2m': '°C'},
+        fetched_at=fetched_at
+    )
+
+
+def parse_event(raw: str):
+    fields = dict(line.split(': ', 1) for line in raw.strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+
+def test_forecast_delta():
+    """Тест изменений прогноза: изменившиеся и прошедшие часы"""
+    previous = {"forecast": [{"time": "10:00", "temperature": 1.0},
+                             {"time": "11:00", "temperature": 2.0}],
+                "stale": False, "fetched_at": 1}
+    current = {"forecast": [{"time": "11:00", "temperature": 3.0}],
+               "stale": False, "fetched_at": 2}
+
+    delta = forecast_delta(previous, current)
+    assert delta["updated"] == [{"time": "11:00", "temperature": 3.0}]
+    assert delta["removed"] == ["10:00"]
+    assert forecast_delta(current, current) is None
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_fans_out_one_fetch():
+    """Тест одного запроса прогноза на всех подписчиков города и рассылки изменений"""
+    broadcaster = ForecastBroadcaster()
+    mock_get = AsyncMock(return_value=make_forecast([20.0, 21.0]))
+    with patch('app.api.services.get_weather_forecast', mock_get):
+        first = broadcaster.subscribe(CITY)
+        second = broadcaster.subscribe(CITY)
+        event, data = parse_event(await asyncio.wait_for(first.queue.get(), 1))
+        assert parse_event(await asyncio.wait_for(second.queue.get(), 1))[0] == 'forecast'
+
+        mock_get.return_value = make_forecast([20.0, 25.0], fetched_at=2)
+        await broadcaster.refresh(first.channel)
+
+    assert mock_get.call_count == 2
+    assert event == 'forecast'
+    assert [row['temperature'] for row in data['forecast']] == [20.0, 21.0]
+    event, data = parse_event(first.queue.get_nowait())
+    assert event == 'delta'
+    assert [row['temperature'] for row in data['updated']] == [25.0]
+    await broadcaster.stop()
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_slow_subscriber_gets_snapshot():
+    """Тест переполнения очереди: вместо накопленных изменений — полный прогноз"""
+    broadcaster = ForecastBroadcaster(queue_size=1)
+    mock_get = AsyncMock(return_value=make_forecast([20.0]))
+    with patch('app.api.services.get_weather_forecast', mock_get):
+        subscription = broadcaster.subscribe(CITY)
+        await asyncio.sleep(0)
+        for temperature in (21.0, 22.0):
+            mock_get.return_value = make_forecast([temperature], fetched_at=temperature)
+            await broadcaster.refresh(subscription.channel)
+
+    assert subscription.queue.qsize() == 1
+    event, data = parse_event(subscription.queue.get_nowait())
+    assert event == 'forecast'
+    assert data['forecast'][0]['temperature'] == 22.0
+    assert broadcaster.stats()['overflows'] == 2
+    await broadcaster.stop()
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_evicts_idle_city():
+    """Тест удаления города без подписчиков"""
+    broadcaster = ForecastBroadcaster(idle_ttl=0.01)
+    with patch('app.api.services.get_weather_forecast',
+               AsyncMock(return_value=make_forecast([20.0]))):
+        events = broadcaster.events(CITY)
+        assert parse_event(await asyncio.wait_for(events.__anext__(), 1))[0] == 'forecast'
+        channel = next(iter(broadcaster.channels.values()))
+        await events.aclose()
+        await asyncio.wait_for(channel.task, 1)
+
+    assert broadcaster.stats()['channels'] == 0
+    assert broadcaster.stats()['subscribers'] == 0
+    assert broadcaster.stats()['evictions'] == 1
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_subscriber_limit():
+    """Тест отказа при превышении числа подписок"""
+    broadcaster = ForecastBroadcaster(max_subscribers=0)
+
+    with pytest.raises(HTTPException) as exc_info:
+        broadcaster.subscribe(CITY)
+    assert exc_info.value.status_code == 503
+
+    # Лимит, достигнутый после проверки в обработчике, завершает поток событием error
+    events = broadcaster.events(CITY)
+    assert parse_event(await events.__anext__())[0] == 'error'
+    with pytest.raises(StopAsyncIteration):
+        await events.__anext__()
+
+
+@pytest.mark.asyncio
+async def test_stream_not_started_keeps_no_subscription():
+    """Тест отключения клиента до начала ответа: подписка не создаётся"""
+    broadcaster = ForecastBroadcaster()
+    events = broadcaster.events(CITY)
+    await events.aclose()
+
+    assert broadcaster.stats()['subscribers'] == 0
+    assert broadcaster.stats()['channels'] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_forecast_endpoint():
+    """Тест потока событий: первым приходит полный прогноз"""
+    database = MagicMock()
+    database.Session.return_value.__aenter__ = AsyncMock(return_value=MagicMock())
+    database.Session.return_value.__aexit__ = AsyncMock(return_value=False)
+    with patch('app.api.endpoints.db', database), \
+         patch('app.api.services.get_city_coordinates', AsyncMock(return_value=[CITY])), \
+         patch('app.api.services.get_weather_forecast',
+               AsyncMock(return_value=make_forecast([20.0]))), \
+         patch('app.api.endpoints.forecast_broadcaster', ForecastBroadcaster()) as broadcaster:
+        response = await stream_forecast(city='Москва')
+        event, data = parse_event(await asyncio.wait_for(response.body_iterator.__anext__(), 1))
+        await response.body_iterator.aclose()
+        await broadcaster.stop()
+
+    assert response.media_type == 'text/event-stream'
+    assert event == 'forecast'
+    assert data['city']['name'] == 'Москва'
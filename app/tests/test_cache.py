@@ -0,0 +1,71 @@
+import pytest
+
+from app.api.cache import (
+    forecast_cache_key,
+    next_refresh_at,
+    seconds_until_refresh,
+    FORECAST_REFRESH_INTERVAL
+)
+from app.api.cache_backends import TTLCache
+from app.models.weather import City
+
+
+def test_ttl_cache_hit_and_miss():
+    """Тест попаданий и промахов кэша"""
+    cache = TTLCache(max_entries=10)
+    cache.set('a', 1, expires_at=200)
+
+    assert cache.get('a', now=100) == 1
+    assert cache.get('b', now=100) is None
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+def test_ttl_cache_expiration():
+    """Тест истечения времени жизни записи"""
+    cache = TTLCache(max_entries=10)
+    cache.set('a', 1, expires_at=200)
+
+    assert cache.get('a', now=200) is None
+    assert len(cache) == 0
+    assert cache.stats()['expirations'] == 1
+
+
+def test_ttl_cache_lru_eviction():
+    """Тест вытеснения давно не использованных записей"""
+    cache = TTLCache(max_entries=2)
+    cache.set('a', 1, expires_at=200)
+    cache.set('b', 2, expires_at=200)
+
+    # Обращение к 'a' делает её самой свежей
+    cache.get('a', now=100)
+    cache.set('c', 3, expires_at=200)
+
+    assert cache.get('b', now=100) is None
+    assert cache.get('a', now=100) == 1
+    assert cache.get('c', now=100) == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_forecast_cache_key_grid_cell():
+    """Тест совпадения ключа для близких координат одной ячейки"""
+    first = City(name='Москва', latitude=55.75581, longitude=37.61731)
+    second = City(name='Москва-Сити', latitude=55.75579, longitude=37.61729)
+    other = City(name='Химки', latitude=55.8970, longitude=37.4297)
+
+    hourly = ('temperature_2m',)
+    assert forecast_cache_key(first, 1, hourly) == forecast_cache_key(second, 1, hourly)
+    assert forecast_cache_key(first, 1, hourly) != forecast_cache_key(first, 2, hourly)
+    assert forecast_cache_key(first, 1, hourly) != forecast_cache_key(other, 1, hourly)
+
+
+def test_next_refresh_at_aligned():
+    """Тест выравнивания срока жизни по циклу обновления модели"""
+    now = 10 * FORECAST_REFRESH_INTERVAL + 15
+    expires_at = next_refresh_at(now)
+
+    assert expires_at > now
+    assert expires_at % FORECAST_REFRESH_INTERVAL == 0
+    assert seconds_until_refresh(now) == FORECAST_REFRESH_INTERVAL - 15
@@ -0,0 +1,196 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+
+from app.api.cache import CITIES_CODEC, FORECAST_CODEC
+from app.api.cache_backends import (
+    MemoryCache,
+    RedisCache,
+    RedisClient,
+    SQLiteCache,
+    SharedCache,
+    create_cache,
+    encode_command,
+    encode_key,
+    read_reply
+)
+from app.models.weather import City, WeatherData, WeatherForecast
+
+
+def make_forecast() -> WeatherForecast:
+    return WeatherForecast(
+        city=City(id=1, name='Москва', latitude=55.7558, longitude=37.6173),
+        hourly=WeatherData(time=[1625097600], temperature_2m=[20.5]),
+        hourly_units={'temperature_2m': '°C'},
+        fetched_at=1625097000
+    )
+
+
+class FakeRedis:
+    """Сервер протокола Redis в памяти: GET, SET с PX, DEL, SCAN"""
+
+    def __init__(self):
+        self.data = {}
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                command = await read_reply(reader)
+                writer.write(self._execute([part.decode() for part in command]))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _execute(self, command) -> bytes:
+        name, args = command[0].upper(), command[1:]
+        if name == 'GET':
+            value, expires_at = self.data.get(args[0], (None, 0))
+            if value is None or expires_at <= time.time():
+                return b'$-1\r\n'
+            data = value.encode()
+            return b'$%d\r\n%s\r\n' % (len(data), data)
+        if name == 'SET':
+            self.data[args[0]] = (args[1], time.time() + int(args[3]) / 1000)
+            return b'+OK\r\n'
+        if name == 'DEL':
+            return b':%d\r\n' % sum(self.data.pop(key, None) is not None for key in args)
+        if name == 'SCAN':
+            prefix = args[2].rstrip('*')
+            keys = [key for key in self.data if key.startswith(prefix)]
+            return b'*2\r\n$1\r\n0\r\n' + encode_command(tuple(keys))
+        return b'-ERR unknown command\r\n'
+
+
+@pytest_asyncio.fixture
+async def fake_redis():
+    server = FakeRedis()
+    url = await server.start()
+    yield server, url
+    await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_keeps_objects():
+    """Тест кэша в памяти: значение возвращается без сериализации"""
+    cache = create_cache('test', FORECAST_CODEC, max_entries=10, backend='memory')
+    value = object()
+    await cache.set('a', value, expires_at=200)
+
+    assert isinstance(cache, MemoryCache)
+    assert await cache.get('a', now=100) is value
+    assert await cache.expires_at('a') == 200
+    assert cache.stats()['hits'] == 1
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_shared_between_workers(tmp_path):
+    """Тест общего SQLite-кэша: запись одного воркера видна другому"""
+    path = str(tmp_path / 'cache.sqlite3')
+    worker_a = SQLiteCache('weather_forecast', FORECAST_CODEC, path, stale_ttl=600)
+    worker_b = SQLiteCache('weather_forecast', FORECAST_CODEC, path, stale_ttl=600)
+    key = (55.76, 37.62, 1, ('temperature_2m',))
+    now = time.time()
+
+    await worker_a.set(key, make_forecast(), expires_at=now + 60)
+    cached = await worker_b.get(key)
+    assert cached == make_forecast()
+    assert await worker_b.expires_at(key) == pytest.approx(now + 60)
+
+    # Устаревшая запись отдаётся только как stale
+    assert await worker_b.get(key, now=now + 120) is None
+    assert (await worker_b.get_stale(key, now=now + 120)).fetched_at == 1625097000
+    assert await worker_b.get_stale(key, now=now + 700) is None
+
+    await worker_a.clear()
+    assert await worker_b.get(key) is None
+    await worker_a.close()
+    await worker_b.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_purge(tmp_path):
+    """Тест удаления просроченных записей и записей сверх лимита"""
+    cache = SQLiteCache('weather_geocoding', CITIES_CODEC, str(tmp_path / 'cache.sqlite3'),
+                        max_entries=2)
+    now = time.time()
+    city = City(name='Казань', latitude=55.7887, longitude=49.1221)
+    await cache.set(('old', 1), [city], expires_at=now - 1)
+    for i in range(3):
+        await cache.set((f'city{i}', 1), [city], expires_at=now + 100 + i)
+
+    await cache.purge(now)
+
+    assert cache.stats()['purged'] == 2
+    assert await cache.get(('city0', 1)) is None
+    assert await cache.get(('city2', 1)) == [city]
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_roundtrip(fake_redis):
+    """Тест кэша через протокол Redis: два воркера с общим сервером"""
+    server, url = fake_redis
+    worker_a = RedisCache('weather_forecast', FORECAST_CODEC, RedisClient(url), stale_ttl=600)
+    worker_b = RedisCache('weather_forecast', FORECAST_CODEC, RedisClient(url), stale_ttl=600)
+    key = (55.76, 37.62, 1, ('temperature_2m',))
+    now = time.time()
+
+    await worker_a.set(key, make_forecast(), expires_at=now + 60)
+    assert encode_key('weather_forecast', key) in server.data
+    assert await worker_b.get(key) == make_forecast()
+    assert await worker_b.get(('missing',)) is None
+    assert await worker_b.get_stale(key, now=now + 120) is not None
+    assert worker_b.stats() == {"hits": 1, "misses": 1, "stale_hits": 1, "failures": 0}
+
+    await worker_a.clear()
+    assert server.data == {}
+    await worker_a.close()
+    await worker_b.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_unavailable():
+    """Тест недоступного сервера: промах без ошибки и пауза перед повторной попыткой"""
+    server = await asyncio.start_server(lambda reader, writer: None, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    server.close()
+    await server.wait_closed()
+
+    cache = RedisCache('weather_forecast', FORECAST_CODEC,
+                       RedisClient(f"redis://127.0.0.1:{port}/0", timeout=1))
+    assert await cache.get(('key',)) is None
+    await cache.set(('key',), make_forecast(), expires_at=time.time() + 60)
+
+    # Вторая операция не обращается к серверу до истечения паузы
+    assert cache.stats()['failures'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_create_cache_unknown_backend():
+    """Тест ошибки для неизвестного типа хранилища"""
+    with pytest.raises(ValueError):
+        create_cache('test', FORECAST_CODEC, max_entries=10, backend='memcached')
+
+
+def test_shared_cache_requires_storage_methods():
+    """Тест ошибки при создании хранилища без операций чтения и записи"""
+    class IncompleteCache(SharedCache):
+        async def _load(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        IncompleteCache('test', FORECAST_CODEC)
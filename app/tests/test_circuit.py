@@ -0,0 +1,53 @@
+import pytest
+from unittest.mock import patch
+
+from app.api.circuit import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+
+def test_breaker_opens_after_failures():
+    """Тест размыкания после серии ошибок"""
+    breaker = CircuitBreaker('api.open-meteo.com', failure_threshold=2, reset_timeout=30)
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.rejected == 1
+
+
+def test_breaker_half_open_single_probe():
+    """Тест единственного пробного запроса после таймаута"""
+    breaker = CircuitBreaker('api.open-meteo.com', failure_threshold=1, reset_timeout=30)
+    with patch('app.api.circuit.time.monotonic', return_value=100):
+        breaker.record_failure()
+
+    with patch('app.api.circuit.time.monotonic', return_value=131):
+        breaker.before_call()
+        assert breaker.state == HALF_OPEN
+
+        # Пока пробный запрос не завершён, остальные отклоняются
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_breaker_probe_failure_reopens():
+    """Тест повторного размыкания при неудачном пробном запросе"""
+    breaker = CircuitBreaker('api.open-meteo.com', failure_threshold=1, reset_timeout=30)
+    with patch('app.api.circuit.time.monotonic', return_value=100):
+        breaker.record_failure()
+
+    with patch('app.api.circuit.time.monotonic', return_value=131):
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert breaker.is_open()
@@ -0,0 +1,133 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.db.city_index import CityIndex, bounded_distance
+from app.db.models import CityDB
+
+
+def make_city(city_id, name, latitude=55.0, longitude=37.0):
+    return CityDB(id=city_id, city_id=city_id, name=name,
+                  latitude=latitude, longitude=longitude,
+                  country='Россия', admin1=None)
+
+
+@pytest.fixture
+def index():
+    """Фикстура индекса с несколькими городами"""
+    index = CityIndex()
+    for city in [make_city(1, 'Москва'),
+                 make_city(2, 'Мосальск'),
+                 make_city(3, 'Мурманск'),
+                 make_city(4, 'Санкт-Петербург')]:
+        index.add(city)
+    return index
+
+
+def test_prefix_search(index):
+    """Тест поиска по префиксу без учёта регистра"""
+    result = index.search('мос')
+
+    assert [city.name for city in result] == ['Москва', 'Мосальск']
+
+
+def test_prefix_search_ranked_by_popularity(index):
+    """Тест ранжирования подсказок по популярности"""
+    index.set_popularity([('Мосальск', 10), ('Москва', 3)])
+
+    result = index.search('Мос')
+    assert result[0].name == 'Мосальск'
+
+    index.bump('Москва', 20)
+    result = index.search('Мос')
+    assert result[0].name == 'Москва'
+
+
+def test_trigram_search(index):
+    """Тест поиска похожих названий по триграммам"""
+    result = index.search('Петербург')
+
+    assert [city.name for city in result] == ['Санкт-Петербург']
+
+
+def test_search_no_match(index):
+    """Тест отсутствия подсказок"""
+    assert index.search('Париж') == []
+    assert index.stats()['misses'] == 1
+
+
+def test_add_updates_existing(index):
+    """Тест обновления города с тем же city_id"""
+    index.add(make_city(1, 'Москва', latitude=56.0))
+
+    result = index.search('Москва')
+    assert len(index) == 4
+    assert result[0].latitude == 56.0
+
+
+@pytest.mark.asyncio
+async def test_load_from_session():
+    """Тест построения индекса по таблице городов"""
+    mock_result = MagicMock()
+    mock_result.scalars.return_value = [make_city(1, 'Москва')]
+    session = AsyncMock()
+    session.execute.return_value = mock_result
+
+    index = CityIndex()
+    await index.load(session, [('Москва', 5)])
+
+    assert len(index) == 1
+    assert index.popularity('москва') == 5
+
+
+def test_bounded_distance():
+    """Тест расстояния с перестановкой соседних букв и ограничением"""
+    assert bounded_distance('москва', 'москва', 2) == 0
+    assert bounded_distance('mosow', 'moscow', 2) == 1
+    assert bounded_distance('мсокв', 'мосвк', 2) == 2
+    # Превышение ограничения не вычисляется до конца
+    assert bounded_distance('казань', 'мурманск', 2) == 3
+
+
+@pytest.mark.parametrize('query', ['Moskva', 'Moskwa', 'москваа', 'Moskau'])
+def test_fuzzy_match(index, query):
+    """Тест нечёткого совпадения: опечатки, транслитерация, альтернативные названия"""
+    index.add(CityDB(id=1, city_id=1, name='Москва', latitude=55.7558, longitude=37.6173,
+                     alternate_names='Moscow,Moskau,莫斯科'))
+
+    assert index.match(query).name == 'Москва'
+
+
+def test_fuzzy_match_ignores_hyphens(index):
+    """Тест совпадения названия без дефисов"""
+    assert index.match('санкт петербург').name == 'Санкт-Петербург'
+    assert index.match('Sankt-Peterburg').name == 'Санкт-Петербург'
+
+
+def test_fuzzy_match_threshold(index):
+    """Тест отказа при низкой уверенности: запрос уходит к API"""
+    assert index.match('Мурмаши') is None
+    assert index.match('Мск') is None
+    assert index.stats()['fuzzy_misses'] == 2
+
+
+def test_fuzzy_match_short_names_exact_only():
+    """Тест коротких названий: одна правка даёт другой реальный город"""
+    index = CityIndex()
+    index.add(make_city(1, 'Томск'))
+    index.add(make_city(2, 'Рига'))
+
+    assert index.match('Омск') is None
+    assert index.match('Нига') is None
+    assert index.match('Tomsk').name == 'Томск'
+
+
+def test_fuzzy_match_ranked_by_popularity():
+    """Тест выбора более популярного города среди одинаково похожих"""
+    index = CityIndex()
+    index.add(make_city(1, 'Самара'))
+    index.add(make_city(2, 'Самора'))
+
+    index.set_popularity([('Самора', 5)])
+    assert index.match('Самура').name == 'Самора'
+    index.bump('Самара', 50)
+    assert index.match('Самура').name == 'Самара'
@@ -0,0 +1,74 @@
+import gzip
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from fastapi.testclient import TestClient
+
+from app.compression import CompressionMiddleware, choose_encoding
+
+
+def make_client():
+    async def large(request):
+        return PlainTextResponse("погода " * 200, headers={"ETag": '"v1"'})
+
+    async def small(request):
+        return PlainTextResponse("ok")
+
+    async def stream(request):
+        async def chunks():
+            for i in range(3):
+                yield ("часть %d " % i) * 100
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    async def events(request):
+        async def chunks():
+            yield "data: 1\n\n" * 100
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    app = Starlette(routes=[Route("/large", large), Route("/small", small),
+                            Route("/stream", stream), Route("/events", events)])
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+    return TestClient(app)
+
+
+def test_choose_encoding():
+    """Тест выбора кодировки по Accept-Encoding"""
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("*") in ("gzip", "br")
+    assert choose_encoding("identity") is None
+
+
+def test_compress_large_response():
+    """Тест сжатия ответа больше порога и ETag сжатого варианта"""
+    client = make_client()
+
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == '"v1-gzip"'
+    assert int(response.headers["content-length"]) < len(("погода " * 200).encode())
+    assert response.text == "погода " * 200
+
+
+def test_small_and_event_stream_not_compressed():
+    """Тест пропуска маленьких ответов и потока событий"""
+    client = make_client()
+
+    assert "content-encoding" not in client.get(
+        "/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get(
+        "/events", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_compress_streaming_response():
+    """Тест сжатия потокового ответа по частям"""
+    client = make_client()
+
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(raw).decode() == "".join(("часть %d " % i) * 100 for i in range(3))
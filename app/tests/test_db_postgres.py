@@ -0,0 +1,169 @@
+"""Тесты, требующие настоящего PostgreSQL (TEST_DATABASE_URL)"""
+import os
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.base import DB
+from app.db.models import Base, CityDB
+from app.db.retention import PARTITIONS_QUERY, HistoryRetention
+
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL,
+    reason="TEST_DATABASE_URL не задан: тесты PostgreSQL пропущены"
+)
+
+SEED_SIZE = 120_000
+
+
+def sql_literal(value) -> str:
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+@pytest_asyncio.fixture
+async def pg_engine():
+    """Движок тестовой БД с заполненной таблицей городов"""
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(text(
+            "INSERT INTO cities (city_id, name, latitude, longitude) "
+            "SELECT g, 'Город ' || md5(g::text), 0, 0 "
+            f"FROM generate_series(1, {SEED_SIZE}) AS g"
+        ))
+        await conn.execute(text(
+            "INSERT INTO cities (city_id, name, latitude, longitude) "
+            "VALUES (0, 'Москва', 55.7558, 37.6173)"
+        ))
+        await conn.execute(text('ANALYZE cities'))
+    yield engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+async def explain(engine, query) -> str:
+    """План запроса с параметрами в том виде, в каком его отправляет asyncpg.
+
+    Общий план (force_generic_plan) не зависит от значений параметров, поэтому
+    индекс должен использоваться для любого значения, а не только для подставленного.
+    """
+    compiled = query.compile(dialect=engine.dialect)
+    values = ', '.join(sql_literal(compiled.params[name]) for name in compiled.positiontup)
+    async with engine.connect() as conn:
+        await conn.execute(text('SET plan_cache_mode = force_generic_plan'))
+        await conn.exec_driver_sql(f'PREPARE explained AS {compiled}')
+        result = await conn.exec_driver_sql(f'EXPLAIN EXECUTE explained({values})')
+        plan = '\n'.join(row[0] for row in result.all())
+        await conn.exec_driver_sql('DEALLOCATE explained')
+        return plan
+
+
+@pytest.mark.asyncio
+async def test_city_name_query_uses_lower_index(pg_engine):
+    """Тест использования индекса lower(name) при поиске по названию"""
+    plan = await explain(pg_engine, DB.city_name_query('москва'))
+
+    assert 'ix_cities_name_lower' in plan
+    assert 'Seq Scan' not in plan
+
+
+@pytest.mark.asyncio
+async def test_city_prefix_query_uses_lower_index(pg_engine):
+    """Тест использования индекса lower(name) при поиске по префиксу"""
+    plan = await explain(pg_engine, DB.city_prefix_query('Моск'))
+
+    assert 'ix_cities_name_lower' in plan
+    assert 'Seq Scan' not in plan
+
+
+@pytest.mark.asyncio
+async def test_similar_cities_query_uses_trigram_index(pg_engine):
+    """Тест использования GIN-индекса pg_trgm при нечётком поиске"""
+    plan = await explain(pg_engine, DB.similar_cities_query('Масква'))
+
+    assert 'ix_cities_name_trgm' in plan
+    assert 'Seq Scan' not in plan
+
+
+@pytest.mark.asyncio
+async def test_save_cities_postgres(pg_engine, monkeypatch):
+    """Тест INSERT ... ON CONFLICT для городов на PostgreSQL"""
+    monkeypatch.setenv('db_url', TEST_DATABASE_URL)
+    pg_db = DB()
+
+    async with pg_db.Session() as session:
+        await pg_db.save_cities(
+            [{'id': 0, 'name': 'Москва', 'latitude': 55.8, 'longitude': 37.6},
+             {'id': -1, 'name': 'Казань', 'latitude': 55.8, 'longitude': 49.1}],
+            session
+        )
+        result = await session.execute(
+            select(CityDB).filter(CityDB.city_id.in_([0, -1])).order_by(CityDB.city_id)
+        )
+        cities = result.scalars().all()
+
+    assert [(city.city_id, city.latitude) for city in cities] == [(-1, 55.8), (0, 55.8)]
+    await pg_db.engine.dispose()
+
+
+
+@pytest.mark.asyncio
+async def test_city_stats_window_query_uses_bucket_range(pg_engine):
+    """Тест чтения только бакетов окна по первичному ключу почасовой статистики"""
+    async with pg_engine.begin() as conn:
+        # Год почасовых бакетов по 50 городам
+        await conn.execute(text(
+            "INSERT INTO city_search_hourly (hour, city_name, count) "
+            "SELECT h * 3600, 'Город ' || c, 1 "
+            "FROM generate_series(0, 8759) AS h, generate_series(1, 50) AS c"
+        ))
+        await conn.execute(text('ANALYZE city_search_hourly'))
+
+    plan = await explain(pg_engine, DB.city_stats_window_query(8760 * 3600 - 86400))
+
+    assert 'city_search_hourly_pkey' in plan
+    assert 'Seq Scan' not in plan
+
+
+@pytest.mark.asyncio
+async def test_history_retention_partitions(pg_engine, monkeypatch):
+    """Тест удаления старых и создания новых секций search_history"""
+    async with pg_engine.begin() as conn:
+        await conn.execute(text("DROP TABLE search_history"))
+        await conn.execute(text(
+            "CREATE TABLE search_history (id serial, user_id varchar, city_name varchar, "
+            "timestamp integer NOT NULL, PRIMARY KEY (id, timestamp)) "
+            "PARTITION BY RANGE (timestamp)"
+        ))
+        for lower in (0, 604800):
+            await conn.execute(text(
+                f"CREATE TABLE search_history_p{lower} PARTITION OF search_history "
+                f"FOR VALUES FROM ({lower}) TO ({lower + 604800})"
+            ))
+        await conn.execute(text(
+            "INSERT INTO search_history (user_id, city_name, timestamp) "
+            "VALUES ('user', 'Москва', 10), ('user', 'Казань', 700000)"
+        ))
+
+    monkeypatch.setenv('db_url', TEST_DATABASE_URL)
+    retention = HistoryRetention(DB(), retention_days=7, user_cap=0,
+                                 partition_days=7, partitions_ahead=2)
+    await retention.run_once(now=604800 + 8 * 86400)
+
+    async with pg_engine.connect() as conn:
+        names = (await conn.execute(PARTITIONS_QUERY)).scalars().all()
+        cities = (await conn.execute(text("SELECT city_name FROM search_history"))).scalars().all()
+    assert 'search_history_p0' not in names
+    assert 'search_history_p1209600' in names
+    assert cities == ['Казань']
+    await retention.db.engine.dispose()
@@ -51,7 +51,7 @@ def override_get_session():
 def test_search_city(test_client, mock_city, override_get_session):
     """Тест эндпоинта поиска города"""
     # Мокируем функцию сервиса
-    with patch('app.api.services.get_city_coordinates') as mock_get_coords:
+    with patch('app.api.services.search_cities') as mock_get_coords:
         mock_get_coords.return_value = [mock_city]
         
         # Выполняем запрос
@@ -70,7 +70,7 @@ def test_search_city(test_client, mock_city, override_get_session):
 def test_search_city_empty_result(test_client, override_get_session):
     """Тест эндпоинта поиска города без результатов"""
     # Мокируем функцию сервиса
-    with patch('app.api.services.get_city_coordinates') as mock_get_coords:
+    with patch('app.api.services.search_cities') as mock_get_coords:
         mock_get_coords.return_value = []
         
         # Выполняем запрос
@@ -169,8 +169,8 @@ def test_get_history_with_data(test_client, override_get_session):
     # Мокируем функцию получения истории
     history = ["Москва", "Санкт-Петербург"]
     
-    with patch('app.db.base.db.get_user_history') as mock_history:
-        mock_history.return_value = history
+    with patch('app.db.base.db.get_user_history_page') as mock_history:
+        mock_history.return_value = {"history": history, "next_cursor": None}
         
         # Устанавливаем cookie непосредственно на клиенте
         test_client.cookies.set("user_id", "test_user_id")
@@ -236,4 +236,153 @@ def test_stats_page(test_client, override_get_session):
         
         # Проверяем ответ
         assert response.status_code == 200
-        assert "text/html" in response.headers["content-type"] 
\ No newline at end of file
+        assert "text/html" in response.headers["content-type"] 
+
+def test_metrics_endpoint(test_client):
+    """Тест эндпоинта метрик в формате Prometheus"""
+    test_client.get("/")
+
+    response = test_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert "text/plain" in response.headers["content-type"]
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"}' in response.text
+    assert "weather_forecast_cache_hits" in response.text
+
+
+def test_get_forecast_columnar(test_client, override_get_session):
+    """Тест передачи колоночного формата в обработчик прогноза"""
+    with patch('app.api.services.forecast_handler') as mock_forecast_handler:
+        mock_forecast_handler.return_value = {"city": None, "forecast": {}}
+
+        response = test_client.get("/api/weather/forecast?city=Москва&format=columnar")
+
+        assert response.status_code == 200
+        assert mock_forecast_handler.call_args.args[3] == "columnar"
+
+    response = test_client.get("/api/weather/forecast?city=Москва&format=xml")
+    assert response.status_code == 422
+
+
+def test_get_forecast_batch(test_client, override_get_session):
+    """Тест эндпоинта пакетного прогноза"""
+    with patch('app.api.services.batch_forecast_handler') as mock_batch:
+        mock_batch.return_value = {"results": [{"query": "Москва", "error": "x"}]}
+
+        response = test_client.post("/api/weather/forecast/batch",
+                                    json={"cities": ["Москва", "Казань"]})
+
+        assert response.status_code == 200
+        assert mock_batch.call_args.args[0] == ["Москва", "Казань"]
+
+    response = test_client.post("/api/weather/forecast/batch", json={"cities": []})
+    assert response.status_code == 422
+
+
+def test_get_forecast_not_modified(test_client, mock_city, override_get_session):
+    """Тест ETag и ответа 304 для прогноза"""
+    result = {"city": mock_city, "forecast": [], "stale": False, "fetched_at": 1700000000}
+    with patch('app.api.services.forecast_handler') as mock_forecast_handler:
+        mock_forecast_handler.return_value = result
+
+        response = test_client.get("/api/weather/forecast?city=Москва",
+                                   headers={"Cookie": "user_id=user"})
+        etag = response.headers["etag"]
+        assert response.headers["cache-control"].startswith("public, max-age=")
+
+        response = test_client.get("/api/weather/forecast?city=Москва",
+                                   headers={"Cookie": "user_id=user",
+                                            "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+
+def test_get_statistics_not_modified(test_client, override_get_session):
+    """Тест ответа 304 для статистики и смены ETag при изменении данных"""
+    stats = [{"city": "Москва", "count": 10}]
+    with patch('app.db.base.db.get_city_stats') as mock_stats:
+        mock_stats.return_value = stats
+        etag = test_client.get("/api/weather/stats").headers["etag"]
+        page_etag = test_client.get("/stats").headers["etag"]
+
+        assert test_client.get("/api/weather/stats",
+                               headers={"If-None-Match": etag}).status_code == 304
+        assert test_client.get("/stats",
+                               headers={"If-None-Match": page_etag}).status_code == 304
+
+        mock_stats.return_value = [{"city": "Москва", "count": 11}]
+        assert test_client.get("/api/weather/stats",
+                               headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_get_statistics_window(test_client, override_get_session):
+    """Тест статистики за период"""
+    with patch('app.db.base.db.get_city_stats') as mock_stats:
+        mock_stats.return_value = [{"city": "Москва", "count": 3}]
+
+        response = test_client.get("/api/weather/stats?window=day&limit=5")
+
+        assert response.status_code == 200
+        assert mock_stats.call_args.kwargs == {"limit": 5, "window": 86400}
+        assert response.headers["etag"] != test_client.get(
+            "/api/weather/stats?window=hour").headers["etag"]
+
+    assert test_client.get("/api/weather/stats?window=year").status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_warm_up_compiles_templates():
+    """Тест прогрева: соединения с БД и компиляция шаблонов с замером времени"""
+    from app.main import DB_WARMUP_CONNECTIONS, startup_timings, templates, warm_up
+
+    templates.env.cache.clear()
+    with patch('app.db.base.db.warm_up', AsyncMock(return_value=1)) as mock_warm_up:
+        await warm_up()
+
+    mock_warm_up.assert_awaited_once_with(DB_WARMUP_CONNECTIONS)
+    assert len(templates.env.cache) == len(templates.env.list_templates())
+    assert {'db_connections', 'templates'} <= set(startup_timings)
+
+
+def test_get_history_invalid_cursor(test_client):
+    """Тест ответа 400 на некорректный курсор истории"""
+    response = test_client.get("/api/weather/history?cursor=not-a-cursor",
+                               headers={"Cookie": "user_id=test_user"})
+
+    assert response.status_code == 400
+
+
+def test_user_rate_limit(test_client, override_get_session):
+    """Тест ответа 429 при превышении частоты запросов пользователя"""
+    from app.api.limits import SlidingWindowLimiter
+
+    with patch('app.api.endpoints.user_rate_limiter', SlidingWindowLimiter(limit=2, window=60)):
+        headers = {"Cookie": "user_id=limited-user"}
+        with patch('app.db.base.db.get_user_history_page',
+                   AsyncMock(return_value={"history": [], "next_cursor": None})):
+            statuses = [test_client.get("/api/weather/history", headers=headers).status_code
+                        for _ in range(3)]
+        # Другой пользователь не затронут
+        other = test_client.get("/api/weather/history")
+        response = test_client.get("/api/weather/history", headers=headers)
+
+    assert statuses == [200, 200, 429]
+    assert other.status_code == 200
+    assert int(response.headers["Retry-After"]) > 0
+
+
+def test_user_rate_limit_by_forwarded_address(test_client):
+    """Тест раздельных лимитов посетителей без cookie за доверенным прокси"""
+    from app.api.limits import SlidingWindowLimiter
+
+    with patch('app.api.endpoints.user_rate_limiter', SlidingWindowLimiter(limit=1, window=60)), \
+         patch('app.api.endpoints.client_address',
+               side_effect=lambda peer, forwarded_for: forwarded_for or peer):
+        first = test_client.get("/api/weather/history", headers={"X-Forwarded-For": "203.0.113.1"})
+        second = test_client.get("/api/weather/history", headers={"X-Forwarded-For": "203.0.113.2"})
+        repeated = test_client.get("/api/weather/history", headers={"X-Forwarded-For": "203.0.113.1"})
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert repeated.status_code == 429
@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.db.history_writer import HistoryWriter
+
+
+@pytest.fixture
+def mock_db():
+    """Фикстура мока DB с фабрикой сессий"""
+    database = MagicMock()
+    session = AsyncMock()
+    database.Session.return_value.__aenter__ = AsyncMock(return_value=session)
+    database.Session.return_value.__aexit__ = AsyncMock(return_value=False)
+    database.add_search_histories = AsyncMock()
+    return database
+
+
+def written_rows(mock_db):
+    return [entry for call in mock_db.add_search_histories.call_args_list
+            for entry in call.args[0]]
+
+
+@pytest.mark.asyncio
+async def test_flush_by_batch_size(mock_db):
+    """Тест записи пакета при достижении размера"""
+    writer = HistoryWriter(mock_db, batch_size=3, flush_interval=10)
+    await writer.start()
+
+    for city in ['Москва', 'Казань', 'Сочи']:
+        await writer.submit('user', city)
+    await asyncio.sleep(0.01)
+
+    assert mock_db.add_search_histories.call_count == 1
+    assert [row[1] for row in written_rows(mock_db)] == ['Москва', 'Казань', 'Сочи']
+
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_flush_by_interval(mock_db):
+    """Тест записи неполного пакета по истечении интервала"""
+    writer = HistoryWriter(mock_db, batch_size=100, flush_interval=0.02)
+    await writer.start()
+
+    await writer.submit('user', 'Москва')
+    await asyncio.sleep(0.05)
+
+    assert mock_db.add_search_histories.call_count == 1
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_queue(mock_db):
+    """Тест записи оставшихся строк при остановке"""
+    writer = HistoryWriter(mock_db, batch_size=100, flush_interval=10)
+    await writer.start()
+
+    for i in range(5):
+        await writer.submit(f'user{i}', 'Москва')
+    await writer.stop()
+
+    assert len(written_rows(mock_db)) == 5
+    assert not writer.running
+    assert writer.stats()['flushed_rows'] == 5
+
+
+@pytest.mark.asyncio
+async def test_backpressure_counted(mock_db):
+    """Тест учёта ожиданий при заполненной очереди"""
+    writer = HistoryWriter(mock_db, max_queue=1, batch_size=1, flush_interval=10)
+    await writer.start()
+
+    await asyncio.gather(*(writer.submit('user', 'Москва') for _ in range(5)))
+    await writer.stop()
+
+    assert writer.stats()['blocked'] > 0
+    assert len(written_rows(mock_db)) == 5
+
+
+@pytest.mark.asyncio
+async def test_flush_error_counted(mock_db):
+    """Тест учёта строк, которые не удалось записать"""
+    mock_db.add_search_histories.side_effect = Exception("db is down")
+    writer = HistoryWriter(mock_db, batch_size=1, flush_interval=10)
+    await writer.start()
+
+    await writer.submit('user', 'Москва')
+    await writer.stop()
+
+    assert writer.stats()['failed_rows'] == 1
@@ -0,0 +1,34 @@
+from app.api.http_cache import forecast_cache_headers, make_etag, matching_etag
+
+
+def test_matching_etag():
+    """Тест сравнения If-None-Match с текущей версией"""
+    etag = make_etag("Москва", 1)
+
+    assert matching_etag(etag, etag) == etag
+    assert matching_etag(f'"other", W/{etag}', etag) == f'W/{etag}'
+    # Сжатый вариант того же представления
+    gzip_etag = etag[:-1] + '-gzip"'
+    assert matching_etag(gzip_etag, etag) == gzip_etag
+    assert matching_etag('*', etag) == etag
+    assert matching_etag('"other"', etag) is None
+    assert matching_etag(None, etag) is None
+
+
+def test_forecast_cache_headers():
+    """Тест ETag и max-age прогноза"""
+    result = {"city": {"id": 1, "name": "Москва"}, "fetched_at": 1700000000, "stale": False}
+    now = 1699999200 + 600  # 10 минут после начала часа
+
+    headers = forecast_cache_headers(result, "rows", now=now)
+
+    # max-age не выходит за границу часа, на которой меняется тело ответа
+    assert headers["Cache-Control"] == "public, max-age=3000"
+    assert headers["ETag"] == forecast_cache_headers(result, "rows", now=now + 60)["ETag"]
+    assert headers["ETag"] != forecast_cache_headers(result, "columnar", now=now)["ETag"]
+    assert headers["ETag"] != forecast_cache_headers(result, "rows", now=now + 3600)["ETag"]
+    assert headers["ETag"] != forecast_cache_headers(
+        dict(result, fetched_at=1700003600), "rows", now=now)["ETag"]
+
+    stale = forecast_cache_headers(dict(result, stale=True), "rows", private=True, now=now)
+    assert stale["Cache-Control"] == "private, max-age=0"
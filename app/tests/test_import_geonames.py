@@ -0,0 +1,105 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from app.db.base import DB
+from app.db.import_geonames import GeoNamesImporter, parse_city_line, read_localized_names
+from app.db.models import Base, CityDB
+
+
+MOSCOW = ("524901\tMoscow\tMoscow\tMoskva,Москва\t55.75222\t37.61556\tP\tPPLC\tRU\t\t48"
+          "\t\t\t\t10381222\t\t144\tEurope/Moscow\t2022-12-10\n")
+KAZAN = ("551487\tKazan\tKazan\tKazan',Казань\t55.78874\t49.12214\tP\tPPLA\tRU\t\t73"
+         "\t\t\t\t1243500\t\t\tEurope/Moscow\t2022-12-10\n")
+RIVER = ("2017721\tAmur\tAmur\t\t52.9\t141.1\tH\tSTM\tRU\t\t\t\t\t\t0\t\t\t\t2022-01-01\n")
+
+
+@pytest.fixture
+def cities_file(tmp_path):
+    path = tmp_path / 'cities.txt'
+    path.write_text(MOSCOW + RIVER + KAZAN, encoding='utf-8')
+    return str(path)
+
+
+@pytest_asyncio.fixture
+async def sqlite_db(monkeypatch):
+    pytest.importorskip('aiosqlite')
+    monkeypatch.setenv('db_url', 'sqlite+aiosqlite://')
+    database = DB()
+    async with database.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield database
+    await database.engine.dispose()
+
+
+async def stored_cities(database):
+    async with database.Session() as session:
+        result = await session.execute(select(CityDB).order_by(CityDB.city_id))
+        return result.scalars().all()
+
+
+def test_parse_city_line():
+    """Тест разбора строки выгрузки GeoNames"""
+    city = parse_city_line(MOSCOW)
+
+    assert city["id"] == 524901
+    assert city["latitude"] == 55.75222
+    assert city["admin1"] == 'RU.48'
+    assert city["alternate_names"] == 'Moskva,Москва'
+    assert city["population"] == 10381222
+    # Не населённые пункты пропускаются
+    assert parse_city_line(RIVER) is None
+
+
+def test_localized_names(tmp_path):
+    """Тест выбора предпочтительного названия на нужном языке"""
+    path = tmp_path / 'alternateNamesV2.txt'
+    path.write_text(
+        "1\t524901\tru\tМосковия\t\t\t\t1\t\t\n"
+        "2\t524901\tru\tМосква\t1\t\t\t\t\t\n"
+        "3\t524901\ten\tMoscow\t1\t\t\t\t\t\n"
+        "4\t999\tru\tНе нужен\t1\t\t\t\t\t\n",
+        encoding='utf-8'
+    )
+
+    names = read_localized_names(str(path), 'ru', {524901})
+
+    assert names == {524901: 'Москва'}
+
+
+@pytest.mark.asyncio
+async def test_import_chunks_and_names(sqlite_db, cities_file, tmp_path):
+    """Тест загрузки пакетами с названиями страны и региона"""
+    importer = GeoNamesImporter(sqlite_db,
+                                countries={'RU': ('Russia', 2017370)},
+                                regions={'RU.48': ('Moscow', 524894)},
+                                localized={524901: 'Москва', 2017370: 'Россия'},
+                                chunk_size=1,
+                                state_file=str(tmp_path / 'state.json'))
+
+    await importer.run(cities_file)
+
+    cities = await stored_cities(sqlite_db)
+    assert importer.imported == 2
+    assert [(city.name, city.country, city.admin1) for city in cities] == [
+        ('Москва', 'Россия', 'Moscow'),
+        ('Kazan', 'Россия', 'RU.73')
+    ]
+    assert cities[0].alternate_names == 'Moskva,Москва'
+
+
+@pytest.mark.asyncio
+async def test_import_resume(sqlite_db, cities_file, tmp_path):
+    """Тест продолжения загрузки после записанного пакета"""
+    state_file = str(tmp_path / 'state.json')
+    importer = GeoNamesImporter(sqlite_db, chunk_size=1, state_file=state_file)
+    importer.save_state(cities_file, 1)
+
+    await importer.run(cities_file)
+
+    assert [city.city_id for city in await stored_cities(sqlite_db)] == [551487]
+    assert importer.load_state(cities_file) == 3
+
+    # Повторный запуск с начала идемпотентен
+    await GeoNamesImporter(sqlite_db, chunk_size=2).run(cities_file)
+    assert [city.city_id for city in await stored_cities(sqlite_db)] == [524901, 551487]
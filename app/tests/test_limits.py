@@ -0,0 +1,121 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.api.limits import (
+    SlidingWindowLimiter,
+    TokenBucket,
+    UpstreamLimiter,
+    UpstreamOverloadedError,
+    client_address,
+    parse_networks,
+    upstream_queue_wait
+)
+
+
+def test_sliding_window_limit():
+    """Тест ограничения числа запросов за окно"""
+    limiter = SlidingWindowLimiter(limit=3, window=60)
+
+    assert all(limiter.hit('user', now=600 + i) == 0 for i in range(3))
+    # Четвёртый запрос в том же окне — до начала следующего окна
+    assert limiter.hit('user', now=610) == pytest.approx(50)
+    assert limiter.hit('other', now=610) == 0
+    assert limiter.stats()['rejected'] == 1
+
+
+def test_sliding_window_weights_previous_window():
+    """Тест учёта предыдущего окна с убывающим весом"""
+    limiter = SlidingWindowLimiter(limit=4, window=60)
+    for _ in range(4):
+        limiter.hit('user', now=650)
+
+    # В начале следующего окна предыдущее учитывается почти полностью: 4 * 11/12 + 0 < 4
+    assert limiter.hit('user', now=665) == 0
+    # 4 * 11/12 + 1 >= 4: повтор, когда вклад предыдущего окна уменьшится до 2
+    assert limiter.hit('user', now=665) == pytest.approx(25)
+    assert limiter.hit('user', now=690) == 0
+    # Без запросов дольше двух окон счётчики сбрасываются
+    assert limiter.hit('user', now=900) == 0
+
+
+def test_sliding_window_max_keys():
+    """Тест вытеснения давно не обращавшихся пользователей"""
+    limiter = SlidingWindowLimiter(limit=1, window=60, max_keys=2)
+    for key in ('a', 'b', 'c'):
+        limiter.hit(key, now=600)
+
+    assert len(limiter) == 2
+    assert limiter.stats()['evictions'] == 1
+    assert limiter.hit('a', now=601) == 0
+
+
+def test_token_bucket():
+    """Тест задержки при исчерпании токенов"""
+    bucket = TokenBucket(rate=10, burst=2)
+    now = bucket.updated
+
+    assert bucket.reserve(now) == 0
+    assert bucket.reserve(now) == 0
+    assert bucket.reserve(now) == pytest.approx(0.1)
+    assert bucket.reserve(now) == pytest.approx(0.2)
+    # За секунду токены восстанавливаются до burst
+    assert bucket.reserve(now + 1) == 0
+
+
+@pytest.mark.asyncio
+async def test_upstream_limiter_sheds_when_queue_full():
+    """Тест очереди ограниченной длины и отказа без ожидания"""
+    limiter = UpstreamLimiter(concurrency=1, max_queue=1, timeout=1)
+    waits = upstream_queue_wait.count()
+    release = asyncio.Event()
+
+    async def call():
+        async with limiter.slot():
+            await release.wait()
+
+    first = asyncio.create_task(call())
+    await asyncio.sleep(0)
+    second = asyncio.create_task(call())
+    await asyncio.sleep(0)
+    assert limiter.stats() == {"in_flight": 1, "queued": 1, "shed": 0, "timeouts": 0}
+
+    with pytest.raises(UpstreamOverloadedError):
+        async with limiter.slot():
+            pass
+    assert limiter.shed == 1
+
+    release.set()
+    await asyncio.gather(first, second)
+    assert limiter.in_flight == 0
+    assert upstream_queue_wait.count() == waits + 2
+
+
+@pytest.mark.asyncio
+async def test_upstream_limiter_queue_timeout():
+    """Тест отказа после истечения ожидания в очереди"""
+    limiter = UpstreamLimiter(concurrency=1, max_queue=10, timeout=0.01)
+
+    async with limiter.slot():
+        with pytest.raises(UpstreamOverloadedError):
+            async with limiter.slot():
+                pass
+
+    assert limiter.timeouts == 1
+    assert limiter.stats()['queued'] == 0
+    assert limiter.in_flight == 0
+
+
+def test_client_address_trusted_proxies():
+    """Тест адреса клиента за доверенными прокси"""
+    with patch('app.api.limits.TRUSTED_PROXIES', parse_networks('10.0.0.0/8, 192.168.1.5')):
+        # Запрос от доверенного прокси: клиент — первый недоверенный адрес справа
+        assert client_address('10.0.0.2', '1.1.1.1, 203.0.113.7, 192.168.1.5') == '203.0.113.7'
+        # Заголовок от клиента напрямую не учитывается
+        assert client_address('198.51.100.1', '203.0.113.7') == '198.51.100.1'
+        assert client_address('10.0.0.2', None) == '10.0.0.2'
+        assert client_address(None, None) == 'unknown'
+
+    with patch('app.api.limits.TRUSTED_PROXIES', []):
+        assert client_address('10.0.0.2', '203.0.113.7') == '10.0.0.2'
@@ -0,0 +1,51 @@
+import json
+import logging
+import queue
+
+from app.log_conf import (JsonFormatter, NonBlockingQueueHandler, parse_levels,
+                          set_sql_echo, sql_echo_enabled)
+
+
+def make_record(message: str = "Ошибка %s", args=("API",)) -> logging.LogRecord:
+    return logging.LogRecord("app.api.services", logging.ERROR, "services.py", 42,
+                             message, args, None)
+
+
+def test_json_formatter():
+    """Тест записи лога в формате JSON"""
+    entry = json.loads(JsonFormatter().format(make_record()))
+
+    assert entry["level"] == "ERROR"
+    assert entry["logger"] == "app.api.services"
+    assert entry["location"] == "services.py:42"
+    assert entry["message"] == "Ошибка API"
+
+
+def test_queue_handler_does_not_block():
+    """Тест отбрасывания записей при переполненной очереди"""
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+
+    handler.handle(make_record())
+    handler.handle(make_record())
+
+    assert handler.stats() == {"queue_depth": 1, "dropped": 1}
+    # Сообщение форматируется до постановки в очередь
+    assert handler.queue.get_nowait().getMessage() == "Ошибка API"
+
+
+def test_parse_levels():
+    """Тест разбора уровней логгеров из переменной окружения"""
+    assert parse_levels("app.api=debug, httpx=WARNING,bad=LOUD,") == {
+        "app.api": logging.DEBUG, "httpx": logging.WARNING}
+
+
+def test_sql_echo_switch():
+    """Тест переключения логирования SQL во время работы"""
+    enabled = sql_echo_enabled()
+    try:
+        set_sql_echo(True)
+        assert sql_echo_enabled()
+        set_sql_echo(False)
+        assert not sql_echo_enabled()
+    finally:
+        set_sql_echo(enabled)
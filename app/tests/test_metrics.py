@@ -0,0 +1,39 @@
+from app.metrics import Registry
+
+
+def test_counter_render():
+    """Тест вывода счётчика с метками"""
+    registry = Registry()
+    counter = registry.counter('errors_total', 'Ошибки', ('host',))
+    counter.inc(('api.open-meteo.com',))
+    counter.inc(('api.open-meteo.com',), 2)
+
+    text = registry.render()
+    assert '# TYPE errors_total counter' in text
+    assert 'errors_total{host="api.open-meteo.com"} 3' in text
+
+
+def test_histogram_render_cumulative():
+    """Тест накопительных бакетов гистограммы"""
+    registry = Registry()
+    histogram = registry.histogram('latency_seconds', 'Задержка', buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_count 3' in text
+    assert 'latency_seconds_sum 5.55' in text
+
+
+def test_stats_collected_on_render():
+    """Тест чтения счётчиков компонентов в момент вывода"""
+    registry = Registry()
+    stats = {'hits': 1}
+    registry.register_stats('weather_cache', lambda: stats)
+
+    stats['hits'] = 7
+    assert 'weather_cache_hits 7' in registry.render()
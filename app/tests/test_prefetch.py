@@ -0,0 +1,86 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.api.cache import forecast_cache, forecast_cache_key, next_refresh_at
+from app.api.prefetch import ForecastPrefetcher
+from app.api.services import HOURLY_VARIABLES
+from app.db.models import CityDB
+from app.models.weather import City
+
+
+@pytest.fixture
+def mock_db():
+    """Фикстура мока DB со статистикой популярных городов"""
+    database = MagicMock()
+    session = AsyncMock()
+    database.Session.return_value.__aenter__ = AsyncMock(return_value=session)
+    database.Session.return_value.__aexit__ = AsyncMock(return_value=False)
+    database.get_city_stats = AsyncMock(return_value=[
+        {"city": "Москва", "count": 10},
+        {"city": "Казань", "count": 5}
+    ])
+    database.find_cities_by_names = AsyncMock(return_value=[
+        CityDB(id=1, city_id=1, name='Москва', latitude=55.7558, longitude=37.6173),
+        CityDB(id=2, city_id=2, name='Казань', latitude=55.7963, longitude=49.1088)
+    ])
+    return database
+
+
+@pytest.mark.asyncio
+async def test_prefetch_refreshes_missing_entries(mock_db):
+    """Тест обновления только тех прогнозов, которых нет в кэше"""
+    now = 10_000.0
+    moscow = City(id=1, name='Москва', latitude=55.7558, longitude=37.6173)
+    # Прогноз Москвы ещё долго будет свежим
+    await forecast_cache.set(forecast_cache_key(moscow, 1, HOURLY_VARIABLES),
+                             MagicMock(), expires_at=now + 3000)
+
+    prefetcher = ForecastPrefetcher(mock_db, top_n=2, lead=180, jitter=0)
+    with patch('app.api.services.refresh_weather_forecast', AsyncMock()) as mock_refresh:
+        await prefetcher.run_once(now=now)
+
+    assert mock_refresh.call_count == 1
+    assert mock_refresh.call_args.args[0].name == 'Казань'
+    assert mock_db.get_city_stats.call_args.kwargs['limit'] == 2
+    assert prefetcher.stats()['refreshed'] == 1
+    assert prefetcher.stats()['skipped_fresh'] == 1
+
+
+@pytest.mark.asyncio
+async def test_prefetch_refreshes_after_model_update(mock_db):
+    """Тест продления записи до смены модели и обновления сразу после неё"""
+    boundary = next_refresh_at(10_000.0)
+    moscow = City(id=1, name='Москва', latitude=55.7558, longitude=37.6173)
+    key = forecast_cache_key(moscow, 1, HOURLY_VARIABLES)
+    forecast = MagicMock()
+    await forecast_cache.set(key, forecast, expires_at=boundary)
+    mock_db.find_cities_by_names.return_value = mock_db.find_cities_by_names.return_value[:1]
+
+    prefetcher = ForecastPrefetcher(mock_db, top_n=2, lead=180, jitter=0)
+    with patch('app.api.services.refresh_weather_forecast', AsyncMock()) as mock_refresh:
+        # До смены модели API отдал бы прежние данные: запись только продлевается
+        await prefetcher.run_once(now=boundary - 100)
+        assert mock_refresh.call_count == 0
+        assert await forecast_cache.expires_at(key) == boundary + 180
+        assert await forecast_cache.get(key, now=boundary + 30) is forecast
+
+        # Повторный запуск до смены модели запись не трогает
+        await prefetcher.run_once(now=boundary - 40)
+        # Первый запуск после смены модели обновляет прогноз
+        await prefetcher.run_once(now=boundary + 20)
+
+    assert mock_refresh.call_count == 1
+    assert mock_refresh.call_args.args[0].name == 'Москва'
+    assert prefetcher.stats()['extended'] == 1
+    assert prefetcher.stats()['skipped_fresh'] == 1
+
+
+@pytest.mark.asyncio
+async def test_prefetch_counts_failures(mock_db):
+    """Тест учёта неудачных обновлений"""
+    prefetcher = ForecastPrefetcher(mock_db, top_n=2, jitter=0)
+    with patch('app.api.services.refresh_weather_forecast',
+               AsyncMock(side_effect=Exception("API недоступен"))):
+        await prefetcher.run_once()
+
+    assert prefetcher.stats()['failed'] == 2
@@ -0,0 +1,82 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from app.db.base import DB
+from app.db.models import Base, CitySearchHourlyDB, SearchHistoryDB
+from app.db.retention import HistoryRetention, parse_partition_bound
+
+
+NOW = 1700000000
+DAY = 86400
+
+
+@pytest_asyncio.fixture
+async def sqlite_db(monkeypatch):
+    pytest.importorskip('aiosqlite')
+    monkeypatch.setenv('db_url', 'sqlite+aiosqlite://')
+    database = DB()
+    async with database.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield database
+    await database.engine.dispose()
+
+
+async def history_rows(database):
+    async with database.Session() as session:
+        result = await session.execute(
+            select(SearchHistoryDB.user_id, SearchHistoryDB.city_name)
+            .order_by(SearchHistoryDB.timestamp)
+        )
+        return result.all()
+
+
+def test_parse_partition_bound():
+    """Тест разбора границ секции PostgreSQL"""
+    assert parse_partition_bound("FOR VALUES FROM (1699488000) TO (1700092800)") == \
+        (1699488000, 1700092800)
+    assert parse_partition_bound("DEFAULT") is None
+
+
+@pytest.mark.asyncio
+async def test_retention_purges_old_history(sqlite_db):
+    """Тест удаления истории старше срока хранения и старых почасовых счётчиков"""
+    async with sqlite_db.Session() as session:
+        await sqlite_db.add_search_histories([
+            ('user1', 'Сочи', NOW - 100 * DAY),
+            ('user1', 'Москва', NOW - 10 * DAY),
+            ('user2', 'Казань', NOW - 60),
+        ], session)
+
+    retention = HistoryRetention(sqlite_db, retention_days=30, user_cap=0)
+    await retention.run_once(now=NOW)
+
+    assert await history_rows(sqlite_db) == [('user1', 'Москва'), ('user2', 'Казань')]
+    async with sqlite_db.Session() as session:
+        hours = (await session.execute(select(CitySearchHourlyDB.city_name))).scalars().all()
+    # Почасовая статистика хранится дольше самого длинного окна, но не бессрочно
+    assert sorted(hours) == ['Казань']
+    assert retention.stats()['purged_rows'] == 1
+    # Общие счётчики поиска не затрагиваются
+    async with sqlite_db.Session() as session:
+        assert (await sqlite_db.get_city_stats(session))[0]['count'] == 1
+
+
+@pytest.mark.asyncio
+async def test_retention_caps_active_users(sqlite_db):
+    """Тест ограничения истории недавно активных пользователей"""
+    async with sqlite_db.Session() as session:
+        await sqlite_db.add_search_histories(
+            [('user1', f'Город {i}', NOW - 100 + i) for i in range(5)]
+            + [('user2', f'Город {i}', NOW - 2 * DAY + i) for i in range(5)],
+            session
+        )
+
+    retention = HistoryRetention(sqlite_db, retention_days=0, user_cap=2, interval=3600)
+    await retention.run_once(now=NOW)
+
+    rows = await history_rows(sqlite_db)
+    # user2 не искал с прошлого прохода: его история не проверяется
+    assert [city for user, city in rows if user == 'user1'] == ['Город 3', 'Город 4']
+    assert len([user for user, _ in rows if user == 'user2']) == 5
+    assert retention.stats()['capped_rows'] == 3
@@ -1,9 +1,27 @@
+import asyncio
+import time
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
 from datetime import datetime
 from fastapi import HTTPException
+import httpx
 
-from app.api.services import get_city_coordinates, get_weather_forecast, forecast_handler
+from app.api.cache import forecast_cache, forecast_cache_key
+from app.api.services import (
+    FORECAST_API_URL,
+    HOURLY_VARIABLES,
+    batch_forecast_handler,
+    get_city_coordinates,
+    get_weather_forecast,
+    get_weather_forecasts,
+    forecast_handler,
+    format_forecast,
+    search_cities
+)
+from app.api.singleflight import forecast_flight
+from app.api.upstream import upstream
+from app.db.city_index import city_index
+from app.db.models import CityDB
 from app.models.weather import City, WeatherData, WeatherForecast
 
 
@@ -87,7 +105,7 @@ async def test_get_city_coordinates_from_api(db_session):
     # Настройка мока для поиска города в БД (возвращаем None)
     with patch('app.db.base.db.find_city_by_name', AsyncMock(return_value=None)), \
          patch('httpx.AsyncClient.get', AsyncMock(return_value=mock_response)), \
-         patch('app.db.base.db.save_city', AsyncMock()):
+         patch('app.db.base.db.save_cities', AsyncMock()):
         result = await get_city_coordinates('Москва', session=session)
     
     # Проверка результата
@@ -97,6 +115,41 @@ async def test_get_city_coordinates_from_api(db_session):
     assert result[0].longitude == 37.6173
 
 
+
+@pytest.mark.asyncio
+async def test_get_city_coordinates_saves_in_own_session():
+    """Тест сохранения городов объединённым запросом в собственной сессии"""
+    mock_response = MagicMock()
+    mock_response.json.return_value = {
+        'results': [{'id': 1, 'name': 'Москва', 'latitude': 55.7558, 'longitude': 37.6173}]
+    }
+    release = asyncio.Event()
+
+    async def slow_get(*args, **kwargs):
+        await release.wait()
+        return mock_response
+
+    database = MagicMock()
+    database.find_city_by_name = AsyncMock(return_value=None)
+    database.save_cities = AsyncMock()
+    own_session = MagicMock()
+    database.Session.return_value.__aenter__ = AsyncMock(return_value=own_session)
+    database.Session.return_value.__aexit__ = AsyncMock(return_value=False)
+    with patch('app.api.services.db', database), \
+         patch('httpx.AsyncClient.get', side_effect=slow_get):
+        first = asyncio.create_task(get_city_coordinates('Москва', session=MagicMock()))
+        second = asyncio.create_task(get_city_coordinates('Москва', session=MagicMock()))
+        await asyncio.sleep(0.01)
+        # Первый вызывающий отменён до ответа API: запрос продолжается для второго
+        first.cancel()
+        release.set()
+        result = await second
+
+    assert result[0].name == 'Москва'
+    assert database.save_cities.call_count == 1
+    assert database.save_cities.call_args.args[1] is own_session
+
+
 @pytest.mark.asyncio
 async def test_get_weather_forecast(mock_city):
     """Тест получения прогноза погоды"""
@@ -180,4 +233,301 @@ async def test_forecast_handler_forecast_not_available(mock_city, db_session):
             assert False, "Исключение не было выброшено"
         except HTTPException as exc:
             assert exc.status_code == 404
-            assert "Не удалось получить прогноз погоды" == exc.detail 
\ No newline at end of file
+            assert "Не удалось получить прогноз погоды" == exc.detail 
+
+
+@pytest.mark.asyncio
+async def test_get_weather_forecast_cached(mock_city):
+    """Тест повторного получения прогноза из кэша"""
+    mock_response = MagicMock()
+    mock_response.json.return_value = {
+        'hourly': {
+            'time': [1625097600, 1625101200],
+            'temperature_2m': [20.5, 21.0]
+        },
+        'hourly_units': {'temperature_2m': '°C'}
+    }
+    mock_response.raise_for_status = MagicMock()
+
+    neighbour = mock_city.model_copy(update={'name': 'Москва-Сити'})
+
+    with patch('httpx.AsyncClient.get',
+               AsyncMock(return_value=mock_response)) as mock_get:
+        first = await get_weather_forecast(mock_city)
+        second = await get_weather_forecast(neighbour)
+
+    # Второй запрос для той же ячейки сетки не уходит в API
+    assert mock_get.call_count == 1
+    assert first.hourly == second.hourly
+    assert second.city.name == 'Москва-Сити'
+
+
+@pytest.mark.asyncio
+async def test_get_weather_forecast_coalesced(mock_city):
+    """Тест объединения одновременных запросов прогноза"""
+    mock_response = MagicMock()
+    mock_response.json.return_value = {
+        'hourly': {
+            'time': [1625097600],
+            'temperature_2m': [20.5]
+        },
+        'hourly_units': {'temperature_2m': '°C'}
+    }
+    mock_response.raise_for_status = MagicMock()
+
+    async def slow_get(*args, **kwargs):
+        await asyncio.sleep(0.01)
+        return mock_response
+
+    coalesced_before = forecast_flight.coalesced
+    with patch('httpx.AsyncClient.get', side_effect=slow_get) as mock_get:
+        results = await asyncio.gather(
+            *(get_weather_forecast(mock_city) for _ in range(5))
+        )
+
+    assert mock_get.call_count == 1
+    assert all(result.hourly.temperature_2m == [20.5] for result in results)
+    assert forecast_flight.coalesced - coalesced_before == 4
+
+
+@pytest.mark.asyncio
+async def test_get_city_coordinates_cached():
+    """Тест повторного геокодирования из кэша без запроса к API"""
+    mock_response = MagicMock()
+    mock_response.json.return_value = {'results': [{'id': 2, 'name': 'Казань',
+                                                    'latitude': 55.7887,
+                                                    'longitude': 49.1221}]}
+
+    with patch('httpx.AsyncClient.get', AsyncMock(return_value=mock_response)) as mock_get:
+        first = await get_city_coordinates('Казань', limit=1)
+        second = await get_city_coordinates('казань', limit=1)
+
+    assert mock_get.call_count == 1
+    assert first == second
+    assert second[0].name == 'Казань'
+
+
+def geocoding_response(results) -> MagicMock:
+    response = MagicMock()
+    response.json.return_value = {'results': results}
+    return response
+
+
+@pytest.mark.asyncio
+async def test_get_city_coordinates_fuzzy(db_session, mock_city):
+    """Тест исправления опечатки по индексу, если API города не знает"""
+    session = await anext(db_session)
+    city_index.add(CityDB(id=1, city_id=1, name='Москва',
+                          latitude=55.7558, longitude=37.6173))
+
+    with patch('app.db.base.db.find_city_by_name', AsyncMock(return_value=None)), \
+         patch('httpx.AsyncClient.get',
+               AsyncMock(return_value=geocoding_response([]))) as mock_get:
+        result = await get_city_coordinates('Mosvka', session=session)
+        # Транслитерация совпадает точно: API не нужен
+        assert (await get_city_coordinates('Moskva', session=session))[0].name == 'Москва'
+
+    assert mock_get.call_count == 1
+    assert result[0].name == 'Москва'
+
+
+@pytest.mark.asyncio
+async def test_get_city_coordinates_fuzzy_when_api_unavailable(db_session):
+    """Тест исправления опечатки по индексу при недоступном API"""
+    session = await anext(db_session)
+    city_index.add(CityDB(id=1, city_id=1, name='Москва',
+                          latitude=55.7558, longitude=37.6173))
+
+    with patch('app.db.base.db.find_city_by_name', AsyncMock(return_value=None)), \
+         patch('httpx.AsyncClient.get', AsyncMock(side_effect=httpx.ConnectError("refused"))):
+        result = await get_city_coordinates('Mosvka', session=session)
+        with pytest.raises(HTTPException):
+            await get_city_coordinates('Казань', session=session)
+
+    assert result[0].name == 'Москва'
+
+
+@pytest.mark.asyncio
+async def test_get_city_coordinates_similar_real_city(db_session):
+    """Тест города, которого нет в БД: похожий город из индекса не подставляется"""
+    session = await anext(db_session)
+    city_index.add(CityDB(id=1, city_id=1, name='Томск', latitude=56.4977, longitude=84.9744))
+    omsk = {'id': 2, 'name': 'Омск', 'latitude': 54.9924, 'longitude': 73.3686}
+
+    with patch('app.db.base.db.find_city_by_name', AsyncMock(return_value=None)), \
+         patch('app.db.base.db.save_cities', AsyncMock()), \
+         patch('httpx.AsyncClient.get',
+               AsyncMock(return_value=geocoding_response([omsk]))) as mock_get:
+        result = await get_city_coordinates('Омск', session=session)
+
+    assert mock_get.call_count == 1
+    assert result[0].name == 'Омск'
+
+
+@pytest.mark.asyncio
+async def test_get_city_coordinates_coalesced_error(db_session):
+    """Тест передачи ошибки API всем объединённым вызовам"""
+    session = await anext(db_session)
+
+    async def failing_get(*args, **kwargs):
+        await asyncio.sleep(0.01)
+        raise httpx.ConnectError("connection refused")
+
+    with patch('app.db.base.db.find_city_by_name', AsyncMock(return_value=None)), \
+         patch('httpx.AsyncClient.get', side_effect=failing_get) as mock_get:
+        results = await asyncio.gather(
+            *(get_city_coordinates('Москва', session=session) for _ in range(3)),
+            return_exceptions=True
+        )
+
+    assert mock_get.call_count == 1
+    for result in results:
+        assert isinstance(result, HTTPException)
+        assert result.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_search_cities_from_index(db_session):
+    """Тест подсказок из индекса без обращения к API"""
+    session = await anext(db_session)
+    city_index.add(CityDB(id=1, city_id=1, name='Москва',
+                          latitude=55.7558, longitude=37.6173))
+
+    with patch('app.api.services.get_city_coordinates', AsyncMock()) as mock_coords:
+        result = await search_cities('Мос', session=session)
+
+    assert [city.name for city in result] == ['Москва']
+    assert not mock_coords.called
+
+
+def test_format_forecast_columnar(mock_city):
+    """Тест колоночного формата прогноза начиная с текущего часа"""
+    forecast = WeatherForecast(
+        city=mock_city,
+        hourly=WeatherData(time=[1000, 4600, 8200, 11800],
+                           temperature_2m=[18.0, 19.5, 21.0, 20.0]),
+        hourly_units={'temperature_2m': '°C'}
+    )
+
+    columnar = format_forecast(forecast, "columnar", now=4600)
+    rows = format_forecast(forecast, "rows", now=4600)
+
+    assert columnar['temperature'] == [19.5, 21.0, 20.0]
+    assert columnar['unit'] == '°C'
+    assert len(columnar['time']) == 3
+    assert [row['time'] for row in rows] == columnar['time']
+    assert [row['temperature'] for row in rows] == columnar['temperature']
+    assert rows[0]['time'] == datetime.fromtimestamp(4600).strftime('%H:%M')
+
+
+def forecast_payload(temperature):
+    return {
+        'hourly': {'time': [1625097600], 'temperature_2m': [temperature]},
+        'hourly_units': {'temperature_2m': '°C'}
+    }
+
+
+@pytest.mark.asyncio
+async def test_get_weather_forecasts_multi_location(mock_city):
+    """Тест пакетного запроса прогноза для нескольких координат"""
+    kazan = City(name='Казань', latitude=55.7963, longitude=49.1088)
+    sochi = City(name='Сочи', latitude=43.5855, longitude=39.7231)
+
+    # Прогноз для Москвы уже в кэше
+    single = MagicMock()
+    single.json.return_value = forecast_payload(20.5)
+    with patch('httpx.AsyncClient.get', AsyncMock(return_value=single)):
+        await get_weather_forecast(mock_city)
+
+    multi = MagicMock()
+    multi.json.return_value = [forecast_payload(25.0), forecast_payload(28.0)]
+    with patch('httpx.AsyncClient.get', AsyncMock(return_value=multi)) as mock_get:
+        result = await get_weather_forecasts([mock_city, kazan, sochi])
+
+    # Промахи кэша запрошены одним запросом с координатами через запятую
+    assert mock_get.call_count == 1
+    params = mock_get.call_args.kwargs['params']
+    assert params['latitude'] == '55.7963,43.5855'
+    assert params['longitude'] == '49.1088,39.7231'
+    assert [forecast.city.name for forecast in result] == ['Москва', 'Казань', 'Сочи']
+    assert [forecast.hourly.temperature_2m[0] for forecast in result] == [20.5, 25.0, 28.0]
+
+
+@pytest.mark.asyncio
+async def test_batch_forecast_handler(mock_city, mock_weather_forecast, db_session):
+    """Тест пакетного прогноза с ненайденным городом"""
+    session = await anext(db_session)
+    db_city = CityDB(id=1, city_id=1, name='Москва',
+                     latitude=mock_city.latitude, longitude=mock_city.longitude)
+    kazan = City(id=2, name='Казань', latitude=55.7963, longitude=49.1088)
+
+    async def coordinates(name, limit=5, session=None):
+        return [kazan] if name == 'Казань' else []
+
+    async def forecasts(cities, forecast_days=1):
+        return [mock_weather_forecast.model_copy(update={'city': city}) for city in cities]
+
+    with patch('app.db.base.db.find_cities_by_names', AsyncMock(return_value=[db_city])), \
+         patch('app.db.base.db.save_cities', AsyncMock()) as mock_save, \
+         patch('app.api.services.get_city_coordinates', side_effect=coordinates), \
+         patch('app.api.services.get_weather_forecasts', side_effect=forecasts):
+        result = await batch_forecast_handler(['Москва', 'Казань', 'Атлантида'], session)
+
+    results = result['results']
+    assert [item['query'] for item in results] == ['Москва', 'Казань', 'Атлантида']
+    assert results[0]['city'].name == 'Москва'
+    assert results[1]['city'].name == 'Казань'
+    assert len(results[1]['forecast']) > 0
+    assert results[2]['error'] == "Город 'Атлантида' не найден"
+    # Новые города сохраняются одним пакетом
+    assert mock_save.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_get_weather_forecast_stale_on_error(mock_city):
+    """Тест выдачи устаревшего прогноза при ошибке API"""
+    key = forecast_cache_key(mock_city, 1, HOURLY_VARIABLES)
+    forecast = WeatherForecast(
+        city=mock_city,
+        hourly=WeatherData(time=[1625097600], temperature_2m=[20.5]),
+        hourly_units={'temperature_2m': '°C'},
+        fetched_at=1625097000
+    )
+    # Срок жизни истёк, но запись ещё в пределах stale_ttl
+    await forecast_cache.set(key, forecast, expires_at=time.time() - 1)
+
+    with patch('httpx.AsyncClient.get',
+               AsyncMock(side_effect=httpx.ConnectError("connection refused"))):
+        result = await get_weather_forecast(mock_city)
+
+    assert result.stale is True
+    assert result.fetched_at == 1625097000
+    assert result.hourly.temperature_2m == [20.5]
+
+
+@pytest.mark.asyncio
+async def test_get_weather_forecast_breaker_open(mock_city):
+    """Тест выдачи устаревшего прогноза без запроса при разомкнутом выключателе"""
+    key = forecast_cache_key(mock_city, 1, HOURLY_VARIABLES)
+    forecast = WeatherForecast(
+        city=mock_city,
+        hourly=WeatherData(time=[1625097600], temperature_2m=[20.5]),
+        hourly_units={'temperature_2m': '°C'}
+    )
+    await forecast_cache.set(key, forecast, expires_at=time.time() - 1)
+
+    breaker = upstream.breaker(FORECAST_API_URL)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    with patch('httpx.AsyncClient.get', AsyncMock()) as mock_get:
+        result = await get_weather_forecast(mock_city)
+
+    assert not mock_get.called
+    assert result.stale is True
+
+    # Без сохранённого прогноза запрос сразу завершается ошибкой 503
+    other = City(name='Казань', latitude=55.7963, longitude=49.1088)
+    with pytest.raises(HTTPException) as exc:
+        await get_weather_forecast(other)
+    assert exc.value.status_code == 503
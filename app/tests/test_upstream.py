@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+import pytest
+from unittest.mock import patch
+
+from app.api.limits import UpstreamLimiter, UpstreamOverloadedError
+from app.api.upstream import UpstreamClient
+
+
+@pytest.mark.asyncio
+async def test_upstream_client_reused():
+    """Тест повторного использования одного клиента между запросами"""
+    upstream = UpstreamClient()
+    await upstream.start()
+
+    first = upstream.client
+    second = upstream.client
+
+    # Соединения пула переиспользуются одним и тем же клиентом
+    assert first is second
+    assert not first.is_closed
+
+    await upstream.close()
+    assert first.is_closed
+
+
+@pytest.mark.asyncio
+async def test_upstream_client_lazy_without_start():
+    """Тест ленивого создания клиента без lifespan"""
+    upstream = UpstreamClient()
+
+    client = upstream.client
+    assert client is not None
+    assert upstream.client is client
+
+    await upstream.close()
+
+
+@pytest.mark.asyncio
+async def test_upstream_http2_fallback_without_h2():
+    """Тест отката на HTTP/1.1 при отсутствии пакета h2"""
+    upstream = UpstreamClient(http2=True)
+
+    with patch('app.api.upstream._http2_available', return_value=False):
+        await upstream.start()
+
+    assert upstream.client is not None
+    await upstream.close()
+
+
+@pytest.mark.asyncio
+async def test_upstream_overload_does_not_trip_breaker():
+    """Тест отказа при переполненной очереди без учёта как сбоя хоста"""
+    upstream = UpstreamClient()
+    upstream.limiter = UpstreamLimiter(concurrency=1, max_queue=0, timeout=1)
+    url = "https://api.open-meteo.com/v1/forecast"
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_get(*args, **kwargs):
+        started.set()
+        await release.wait()
+        return httpx.Response(200, request=httpx.Request("GET", url))
+
+    with patch('httpx.AsyncClient.get', side_effect=slow_get):
+        first = asyncio.create_task(upstream.get(url))
+        await started.wait()
+        with pytest.raises(UpstreamOverloadedError):
+            await upstream.get(url)
+        release.set()
+        await first
+
+    assert upstream.breaker(url).failures == 0
+    assert upstream.limiter.shed == 1
+    await upstream.close()
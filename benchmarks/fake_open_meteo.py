@@ -0,0 +1,116 @@
+"""Локальная замена API геокодирования и прогноза open-meteo.com для нагрузочных тестов
+
+Запуск:
+    FAKE_UPSTREAM_LATENCY=0.05 FAKE_UPSTREAM_ERROR_RATE=0.01 \\
+        uvicorn benchmarks.fake_open_meteo:app --port 8081
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+
+
+# Задержка ответа: базовая и случайная добавка, секунды
+FAKE_UPSTREAM_LATENCY = float(os.getenv('FAKE_UPSTREAM_LATENCY', '0.05'))
+FAKE_UPSTREAM_JITTER = float(os.getenv('FAKE_UPSTREAM_JITTER', '0.02'))
+# Доля ответов 503
+FAKE_UPSTREAM_ERROR_RATE = float(os.getenv('FAKE_UPSTREAM_ERROR_RATE', '0'))
+FAKE_UPSTREAM_CITIES = int(os.getenv('FAKE_UPSTREAM_CITIES', '1000'))
+FAKE_UPSTREAM_SEED = int(os.getenv('FAKE_UPSTREAM_SEED', '42'))
+
+_SYLLABLES = ('ар', 'бо', 'ве', 'го', 'да', 'ел', 'жу', 'за', 'ин', 'ка', 'ло', 'ми',
+              'но', 'ор', 'пе', 'ра', 'со', 'ту', 'ур', 'фа', 'хо', 'це', 'ча', 'ша')
+
+
+def city_names(count: int = FAKE_UPSTREAM_CITIES, seed: int = FAKE_UPSTREAM_SEED) -> List[str]:
+    """Детерминированный список уникальных названий городов"""
+    rng = random.Random(seed)
+    names: List[str] = []
+    seen = set()
+    while len(names) < count:
+        name = ''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+        name = name.capitalize() + rng.choice(('ск', 'ов', 'ино', 'град', ''))
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def city_records(count: int = FAKE_UPSTREAM_CITIES,
+                 seed: int = FAKE_UPSTREAM_SEED) -> List[Dict[str, object]]:
+    """Города в формате ответа API геокодирования"""
+    rng = random.Random(seed)
+    return [{"id": 1000000 + i,
+             "name": name,
+             "latitude": round(rng.uniform(42, 70), 4),
+             "longitude": round(rng.uniform(20, 170), 4),
+             "country": "Россия",
+             "admin1": f"Регион {i % 80 + 1}"}
+            for i, name in enumerate(city_names(count, seed))]
+
+
+def hourly_forecast(latitude: float, longitude: float, forecast_days: int,
+                    now: Optional[float] = None) -> Dict[str, object]:
+    """Почасовой прогноз в формате API (timeformat=unixtime)"""
+    if now is None:
+        now = time.time()
+    start = int(now) // 86400 * 86400
+    hours = forecast_days * 24
+    base = 25 - abs(latitude) / 3
+    return {"latitude": latitude,
+            "longitude": longitude,
+            "hourly_units": {"time": "unixtime", "temperature_2m": "°C"},
+            "hourly": {"time": [start + 3600 * i for i in range(hours)],
+                       "temperature_2m": [round(base + 5 * ((i % 24) - 12) / 12, 1)
+                                          for i in range(hours)]}}
+
+
+def create_app(
+        latency: float = FAKE_UPSTREAM_LATENCY,
+        jitter: float = FAKE_UPSTREAM_JITTER,
+        error_rate: float = FAKE_UPSTREAM_ERROR_RATE,
+        cities: Optional[List[Dict[str, object]]] = None,
+        seed: int = FAKE_UPSTREAM_SEED
+    ) -> FastAPI:
+    """Приложение с эндпоинтами /v1/search и /v1/forecast"""
+    fake = FastAPI(title="Fake Open-Meteo")
+    records = city_records() if cities is None else cities
+    by_name = sorted(records, key=lambda city: city["name"].lower())
+    rng = random.Random(seed)
+
+    async def delay():
+        if latency or jitter:
+            await asyncio.sleep(latency + rng.uniform(0, jitter))
+
+    def failed() -> bool:
+        return error_rate > 0 and rng.random() < error_rate
+
+    @fake.get("/v1/search")
+    async def search(name: str = Query(...), count: int = Query(10)):
+        await delay()
+        if failed():
+            return JSONResponse({"error": True, "reason": "fake"}, status_code=503)
+        prefix = name.lower()
+        results = [city for city in by_name
+                   if city["name"].lower().startswith(prefix)][:count]
+        # Как и настоящий API, при отсутствии совпадений поле results не возвращается
+        return {"results": results} if results else {"generationtime_ms": 0.1}
+
+    @fake.get("/v1/forecast")
+    async def forecast(latitude: str = Query(...), longitude: str = Query(...),
+                       forecast_days: int = Query(1)):
+        await delay()
+        if failed():
+            return JSONResponse({"error": True, "reason": "fake"}, status_code=503)
+        points = [hourly_forecast(float(lat), float(lon), forecast_days)
+                  for lat, lon in zip(latitude.split(','), longitude.split(','))]
+        return points[0] if len(points) == 1 else points
+
+    return fake
+
+
+app = create_app()
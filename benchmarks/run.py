@@ -0,0 +1,283 @@
+"""Нагрузочный тест сервиса погоды на локальной замене open-meteo.com
+
+Запускает fake_open_meteo и приложение (uvicorn) и нагружает /search, /forecast,
+/history и /stats запросами с Zipf-распределением популярности городов.
+Результаты сохраняются в JSON для сравнения между коммитами:
+
+    python -m benchmarks.run --duration 30 --concurrency 32
+    python -m benchmarks.run --compare benchmarks/results/<предыдущий>.json
+
+Приложению нужна БД с применёнными миграциями (DATABASE_URL / --database-url).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+
+from benchmarks.fake_open_meteo import city_names
+
+
+ENDPOINTS = ('search', 'forecast', 'history', 'stats')
+DEFAULT_MIX = 'search=4,forecast=4,history=1,stats=1'
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def zipf_weights(count: int, exponent: float) -> List[float]:
+    """Накопленные веса рангов 1..count по закону Ципфа"""
+    total = 0.0
+    cumulative = []
+    for rank in range(1, count + 1):
+        total += 1 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Доли эндпоинтов из строки вида search=4,forecast=4"""
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in ENDPOINTS:
+            raise ValueError(f"Неизвестный эндпоинт: {name}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Перцентиль q (0-100) отсортированных значений методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    rank = math.ceil(q / 100 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def summarize(latencies: Dict[str, List[float]], statuses: Dict[str, Dict[str, int]],
+              errors: Dict[str, int], elapsed: float) -> Dict[str, dict]:
+    """Запросы в секунду и перцентили задержки (мс) по эндпоинтам"""
+    summary = {}
+    for endpoint in sorted(set(latencies) | set(errors) | set(statuses)):
+        values = sorted(latencies.get(endpoint, []))
+        summary[endpoint] = {
+            "requests": len(values),
+            "errors": errors.get(endpoint, 0),
+            # Отклонённые ограничением частоты (429) не входят в requests и задержки
+            "throttled": statuses.get(endpoint, {}).get("429", 0),
+            "statuses": dict(statuses.get(endpoint, {})),
+            "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+            "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+        }
+    return summary
+
+
+class Workload:
+    """Генератор запросов: эндпоинт по долям, город по закону Ципфа"""
+
+    def __init__(self, cities: List[str], mix: Dict[str, float], zipf_exponent: float,
+                 users: int, seed: int):
+        self.cities = cities
+        self.rng = random.Random(seed)
+        self.endpoints = list(mix)
+        self.endpoint_weights = list(mix.values())
+        self.city_weights = zipf_weights(len(cities), zipf_exponent)
+        self.users = [f"bench-{i}" for i in range(users)]
+
+    def city(self) -> str:
+        return self.rng.choices(self.cities, cum_weights=self.city_weights)[0]
+
+    def next_request(self):
+        """(эндпоинт, путь, параметры, заголовки)"""
+        endpoint = self.rng.choices(self.endpoints, weights=self.endpoint_weights)[0]
+        headers = {"Cookie": f"user_id={self.rng.choice(self.users)}"}
+        if endpoint == 'search':
+            city = self.city()
+            return endpoint, '/api/weather/search', {"q": city[:self.rng.randint(2, 5)]}, headers
+        if endpoint == 'forecast':
+            return endpoint, '/api/weather/forecast', {"city": self.city()}, headers
+        return endpoint, f'/api/weather/{endpoint}', {}, headers
+
+
+async def drive(base_url: str, workload: Workload, duration: float, concurrency: int,
+                warmup: float = 0.0) -> dict:
+    """Нагрузка приложения в concurrency потоков; запросы прогрева не учитываются"""
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    errors: Dict[str, int] = defaultdict(int)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        loop = asyncio.get_running_loop()
+        measure_from = loop.time() + warmup
+        deadline = measure_from + duration
+
+        async def worker():
+            while True:
+                endpoint, path, params, headers = workload.next_request()
+                started = loop.time()
+                if started >= deadline:
+                    return
+                try:
+                    response = await client.get(path, params=params, headers=headers)
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = None
+                finished = loop.time()
+                if started < measure_from:
+                    continue
+                statuses[endpoint][str(status)] += 1
+                if status == 429:
+                    continue
+                latencies[endpoint].append(finished - started)
+                if status is None or status >= 500:
+                    errors[endpoint] += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return summarize(latencies, statuses, errors, duration)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(target: str, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', target, '--host', '127.0.0.1',
+         '--port', str(port), '--log-level', 'warning'],
+        env={**os.environ, **env}
+    )
+
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Сервер {url} не запустился за {timeout} с")
+                await asyncio.sleep(0.2)
+
+
+def compare(current: dict, previous: dict) -> List[str]:
+    """Строки отчёта об изменении rps и p95/p99 относительно предыдущего запуска"""
+    lines = [f"Сравнение с {previous.get('commit')} ({previous.get('started_at')})"]
+    for endpoint, result in current["endpoints"].items():
+        before = previous.get("endpoints", {}).get(endpoint)
+        if not before:
+            continue
+        changes = []
+        for metric in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            old, new = before.get(metric) or 0, result[metric]
+            delta = (new - old) / old * 100 if old else 0.0
+            changes.append(f"{metric} {old} -> {new} ({delta:+.1f}%)")
+        lines.append(f"  {endpoint}: " + ", ".join(changes))
+    return lines
+
+
+def print_report(result: dict):
+    print(f"{'endpoint':<10}{'req':>8}{'err':>6}{'429':>6}{'rps':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in result["endpoints"].items():
+        print(f"{endpoint:<10}{stats['requests']:>8}{stats['errors']:>6}"
+              f"{stats.get('throttled', 0):>6}{stats['rps']:>10}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+
+async def main(args: argparse.Namespace) -> dict:
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    cities = city_names(args.cities, args.seed)
+
+    servers = []
+    try:
+        if not args.app_url:
+            servers.append(start_server('benchmarks.fake_open_meteo:app', args.upstream_port, {
+                'FAKE_UPSTREAM_LATENCY': str(args.upstream_latency),
+                'FAKE_UPSTREAM_JITTER': str(args.upstream_jitter),
+                'FAKE_UPSTREAM_ERROR_RATE': str(args.upstream_error_rate),
+                'FAKE_UPSTREAM_CITIES': str(args.cities),
+                'FAKE_UPSTREAM_SEED': str(args.seed),
+            }))
+            app_env = {'GEOCODING_API_URL': f"{upstream_url}/v1/search",
+                       'FORECAST_API_URL': f"{upstream_url}/v1/forecast",
+                       'USER_RATE_LIMIT': str(args.user_rate_limit)}
+            if args.database_url:
+                app_env['DATABASE_URL'] = args.database_url
+            servers.append(start_server('app.main:app', args.app_port, app_env))
+            await wait_ready(f"{upstream_url}/v1/search?name=a")
+            await wait_ready(f"{app_url}/metrics")
+
+        workload = Workload(cities, parse_mix(args.mix), args.zipf, args.users, args.seed)
+        started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        endpoints = await drive(args.app_url or app_url, workload, args.duration,
+                                args.concurrency, args.warmup)
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    return {"commit": git_commit(),
+            "started_at": started_at,
+            "config": {key: value for key, value in vars(args).items()
+                       if key not in ('output', 'compare')},
+            "endpoints": endpoints}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сервиса погоды")
+    parser.add_argument('--duration', type=float, default=30, help="длительность замера, с")
+    parser.add_argument('--warmup', type=float, default=5, help="прогрев без учёта, с")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="доли эндпоинтов")
+    parser.add_argument('--cities', type=int, default=1000, help="количество городов")
+    parser.add_argument('--zipf', type=float, default=1.1, help="показатель распределения Ципфа")
+    parser.add_argument('--users', type=int, default=200, help="количество пользователей")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--upstream-latency', type=float, default=0.05)
+    parser.add_argument('--upstream-jitter', type=float, default=0.02)
+    parser.add_argument('--upstream-error-rate', type=float, default=0.0)
+    parser.add_argument('--upstream-port', type=int, default=8081)
+    parser.add_argument('--app-port', type=int, default=8082)
+    parser.add_argument('--app-url', help="нагружать уже запущенное приложение")
+    parser.add_argument('--user-rate-limit', type=int, default=0,
+                        help="USER_RATE_LIMIT приложения (по умолчанию 0 — без ограничения)")
+    parser.add_argument('--database-url', help="DATABASE_URL для приложения")
+    parser.add_argument('--output', help="файл результатов (по умолчанию benchmarks/results/)")
+    parser.add_argument('--compare', help="JSON предыдущего запуска для сравнения")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    result = asyncio.run(main(args))
+    print_report(result)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{result['commit'] or 'local'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print('\n'.join(compare(result, json.load(f))))